@@ -1,26 +1,78 @@
 import sys
 sys.path.append('bibcheck')
 
-from helpers import check_bib, compare_bibs
+# helpers (and with it pandas, numpy and bibtexparser) is imported by the
+# commands that use it, so that --help starts quickly
+from gitdiff import GitError
+from offsets import EntryIndex
+from patcher import patch_entry
+from stores import carry_sidecars
 import typer
-import numpy as np
+import random
 import os
 
-app = typer.Typer()
+try:
+    # plain help: newer versions of typer format it with rich, which takes
+    # longer to import than everything else the CLI needs at startup
+    app = typer.Typer(rich_markup_mode=None)
+except TypeError:  # typer < 0.7
+    app = typer.Typer()
 bibfile = 'cdl.bib'
 
+def rule_names(s):
+    return None if s is None else [r.strip() for r in s.split(',') if r.strip()]
+
+
+def print_timings(timings):
+    from helpers import RULES
+
+    typer.echo('time per rule:')
+    for name, seconds in timings.items():
+        cost = f' ({RULES[name].cost})' if name in RULES else ''
+        typer.echo(f'  {name:<12} {seconds:8.3f}s{cost}')
+
+
 @app.command()
-def verify(fname: str='cdl.bib', autofix: bool=False, outfile: str=None, verbose: bool=False):
+def verify(fname: str='cdl.bib', autofix: bool=False, outfile: str=None, verbose: bool=False,
+           only: str=typer.Option(None, help='Comma-separated rules to run (see `bibcheck.py rules`)'),
+           skip: str=typer.Option(None, help='Comma-separated rules to skip'),
+           timings: bool=typer.Option(False, help='Report the time spent on each rule'),
+           staged: bool=typer.Option(False, help='Only check the entries changed in the staged version of fname (e.g., in a pre-commit hook)'),
+           since: str=typer.Option(None, help='Only check the entries changed since this git revision'),
+           venues: str=typer.Option(None, help='Also suggest the journal names learned by bibverify, from this venue authority file (e.g., cdl.venues.json)')):
+    from helpers import check_bib, get_renames, select_rules
+
+    only, skip = rule_names(only), rule_names(skip)
+    try:
+        select_rules(only, skip)
+    except ValueError as e:
+        typer.echo(str(e))
+        raise typer.Exit(1)
+
+    times = {}
     try:
-        errors, corrected = check_bib(fname, autofix=autofix, outfile=outfile, verbose=verbose)
+        errors, corrected = check_bib(fname, autofix=autofix, outfile=outfile, verbose=verbose,
+                                      only=only, skip=skip, timings=times, staged=staged, since=since,
+                                      venues=venues)
+    except GitError as e:
+        typer.echo(str(e))
+        raise typer.Exit(1)
     except:
+        if timings:
+            print_timings(times)
         if verbose:
             typer.echo('errors found; see log for details')
         else:
             typer.echo('errors found; run with verbose flag for details')
+        exit_on_errors(staged, since)
         return
+
+    if timings:
+        print_timings(times)
         
     if outfile:
+        if autofix:
+            carry_sidecars(fname, outfile, get_renames(errors))
         typer.echo(f'saved updated bibliography to {outfile}')
     
     if len(errors) == 0:
@@ -36,10 +88,29 @@ def verify(fname: str='cdl.bib', autofix: bool=False, outfile: str=None, verbose
             typer.echo('errors found; see log for details')
         else:
             typer.echo('errors found; run with verbose flag for details')
+        exit_on_errors(staged, since)
+
+
+def exit_on_errors(staged, since):
+    # when checking changes (as a pre-commit hook or CI gate), fail on errors
+    if staged or since is not None:
+        raise typer.Exit(1)
+
+
+@app.command()
+def rules():
+    """List the checks run by verify (for --only and --skip)."""
+    from helpers import RULES
+
+    for r in RULES.values():
+        reads = 'all fields' if r.reads is None else ', '.join(r.reads)
+        typer.echo(f'{r.name:<12} {r.cost:<10} {r.description} [reads: {reads}]')
 
 
 @app.command()
 def magic(fname: str='cdl.bib', verbose: bool=True):
+    from helpers import check_bib, get_renames
+
     typer.echo('WARNING: potentially unsafe')
     
     outfile = 'cleaned.bib'
@@ -55,12 +126,169 @@ def magic(fname: str='cdl.bib', verbose: bool=True):
     
     
     os.system(f'mv {outfile} {fname}')
+    carry_sidecars(fname, fname, get_renames(errors))
     
     commit(fname=fname)
         
     
+@app.command()
+def show(key: str, fname: str='cdl.bib', check: bool=False, fix: bool=False):
+    from helpers import bib_parser, check_entry, extraneous_fields
+
+    index = EntryIndex(fname)
+    raw = index.raw(key)
+    if raw is None:
+        typer.echo(f'{key} not found in {fname}')
+        raise typer.Exit(1)
+    typer.echo(raw.decode('utf-8'))
+    
+    if not (check or fix):
+        return
+    
+    entry = bib_parser().parse(raw.decode('utf-8')).entries[0]
+    fixes, problems = check_entry(entry)
+    for field, value in fixes.items():
+        typer.echo(f'{field} should be: {value}')
+    for p in problems:
+        typer.echo(p)
+    if len(fixes) == 0 and len(problems) == 0:
+        typer.echo('looks good!')
+    
+    if fix:
+        fixes.update({f: None for f in extraneous_fields(entry)})
+    if fix and len(fixes) > 0:
+        index.replace(key, patch_entry(raw, fixes, aliases=bib_parser().alt_dict))
+        if 'ID' in fixes:
+            carry_sidecars(fname, fname, {key: fixes['ID']})
+        typer.echo(f'fixed {key} in {fname}')
+
+
+@app.command()
+def extract(source: str, fname: str='cdl.bib', outfile: str=None, force: bool=False):
+    """Write the entries cited by a LaTeX document (.bcf, .aux or .tex) to a smaller .bib file."""
+    from citations import extract as extract_cited
+
+    if outfile is None:
+        outfile = os.path.splitext(source)[0] + '.cited.bib'
+    try:
+        written, missing = extract_cited(fname, source, outfile, force=force)
+    except (FileNotFoundError, FileExistsError) as e:
+        typer.echo(str(e))
+        raise typer.Exit(1)
+
+    if missing:
+        typer.echo(f'not found in {fname}: ' + ', '.join(missing))
+    if written:
+        typer.echo(f'saved cited entries to {outfile}')
+    else:
+        typer.echo(f'{outfile} is up to date')
+
+
+@app.command(name='propagate-renames')
+def propagate_renames(directory: str, fname: str='cdl.bib',
+                      renames: str=typer.Option(None, help='JSON file mapping old keys to new keys (default: the rename log of fname)'),
+                      workers: int=typer.Option(None, help='Number of processes (default: one per CPU)'),
+                      dry_run: bool=typer.Option(False, help='List the files that would change without changing them')):
+    """Update citations of renamed keys in the .tex files under directory."""
+    from citations import propagate_renames as propagate
+    from stores import RenameLog, sidecar_path
+
+    log = RenameLog(renames or sidecar_path(fname, 'renames'))
+    pending = log.data
+    if os.path.exists(fname):
+        # an old key that names an entry again is a citation of that entry
+        index = EntryIndex(fname)
+        pending = log.pending(index)
+        index.close()
+        if len(pending) < len(log):
+            typer.echo(f'not renaming keys that are in {fname}: ' + ', '.join(sorted(set(log.data) - set(pending))))
+    if len(pending) == 0:
+        typer.echo('no renamed keys to propagate')
+        return
+    changed = propagate(directory, pending, workers=workers, dry_run=dry_run)
+    verb = 'would be updated' if dry_run else 'updated'
+    for f, n in sorted(changed.items()):
+        typer.echo(f'{f}: {n} citation(s) {verb}')
+    typer.echo(f'{len(changed)} file(s) {verb}')
+
+
+@app.command()
+def index(fname: str='cdl.bib', rebuild: bool=False):
+    """Build or update the full-text search database for fname (used by search)."""
+    from search import SearchIndex
+
+    db = SearchIndex(fname)
+    n = db.refresh(rebuild=rebuild)
+    typer.echo(f'{db.fname}: {len(db)} entries ({n} updated)')
+
+
+@app.command()
+def search(query: str, fname: str='cdl.bib', limit: int=10,
+           keys: bool=typer.Option(False, help='Only print the matching keys, ready to cite')):
+    """Search titles, authors, venues and years (e.g. "memory author:mann")."""
+    from search import SearchIndex
+
+    db = SearchIndex(fname)
+    db.refresh()
+    results = db.search(query, limit=limit)
+    if keys:
+        typer.echo(','.join(r[0] for r in results))
+        return
+    if len(results) == 0:
+        typer.echo('no matches')
+    for key, title, author, venue, year in results:
+        typer.echo(f'{key:<16} {title}')
+        typer.echo(f'{"":<16} {author}. {venue} ({year})')
+
+
+@app.command()
+def merge(other: str, fname: str='cdl.bib', outfile: str=None, verbose: bool=False):
+    """Add the entries of another .bib file that aren't already in fname."""
+    from merging import merge_bib
+
+    outfile = outfile or fname
+    result = merge_bib(fname, other, outfile=outfile, verbose=verbose)
+    print_merge_result(result, outfile, verbose)
+
+
+@app.command()
+def add(source: str=typer.Argument('-', help='.bib file containing the entries to add (default: read from stdin)'),
+        fname: str='cdl.bib', verbose: bool=False):
+    """Format new entries, give them keys and add them to fname, without checking the rest of it."""
+    from merging import add_entries
+
+    if source == '-':
+        text = sys.stdin.buffer.read()
+    else:
+        with open(source, 'rb') as f:
+            text = f.read()
+    result = add_entries(fname, text, verbose=verbose)
+    print_merge_result(result, fname, True)
+
+
+def print_merge_result(result, outfile, verbose):
+    if verbose:
+        for k, existing in result.duplicates.items():
+            typer.echo(f'skipped {k}: same title, authors and year as {existing}')
+        for old, new in result.renames.items():
+            typer.echo(f'renamed {old} to {new}')
+        for new, k in result.added.items():
+            typer.echo(f'added {k} as {new}' if new != k else f'added {k}')
+    for k, error in result.failed.items():
+        typer.echo(f'could not add {k}: {error}')
+    for k, problems in result.problems.items():
+        typer.echo(f'{k}: ' + '; '.join(problems))
+
+    typer.echo(f'added {len(result.added)} entries to {outfile} ({len(result.duplicates)} duplicates skipped, '
+               f'{len(result.renames)} existing keys renamed)')
+    if result.problems:
+        typer.echo('some added entries need manual corrections; run verify for details')
+
+
 @app.command()
 def compare(fname1: str, fname2: str, verbose: bool=False, outfile: str=None):
+    from helpers import compare_bibs
+
     if compare_bibs(fname1, fname2, verbose=verbose, outfile=outfile):
         typer.echo('files match!')
     else:
@@ -72,15 +300,17 @@ def compare(fname1: str, fname2: str, verbose: bool=False, outfile: str=None):
 
 @app.command()
 def commit(fname=bibfile, reference='github', verbose: bool=False, outfile=None):
+    from helpers import check_bib, compare_bibs
+
     def get_commit_fname():
         def log_exists(fname):
             return os.path.exists(fname + '.log')
         basename = 'change'
         
         if log_exists(basename):
-            basename += '-' + str(np.random.randint(10))
+            basename += '-' + str(random.randint(0, 9))
         while log_exists(basename):
-            basename += str(np.random.randint(10))
+            basename += str(random.randint(0, 9))
         return basename + '.log'
     
     #check integrity of fname
@@ -0,0 +1,399 @@
+"""
+Benchmarks for the bibcheck and bibverify tools.
+
+Run from the repository's root directory, e.g.:
+    python bibcheck/bench.py matching
+    python bibcheck/bench.py record --max 200 --outfile crossref.jsonl
+    python bibcheck/bench.py matching --responses crossref.jsonl
+    python bibcheck/bench.py accents
+    python bibcheck/bench.py startup
+    python bibcheck/bench.py load --max 500 --workers 1,5,20 --latency 0.2
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from contextlib import redirect_stderr, redirect_stdout
+from difflib import SequenceMatcher
+import io
+import json
+import random
+import re
+import subprocess
+import time
+
+import typer
+
+from helpers import load_bibliography
+
+app = typer.Typer()
+
+
+def timed(f, *args, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = f(*args)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def crossref_item(entry):
+    """Convert a parsed bibtex entry to a CrossRef-style work record."""
+    authors = []
+    for a in entry.get("author", "").split(" and "):
+        parts = a.split()
+        if parts:
+            authors.append({"given": " ".join(parts[:-1]), "family": parts[-1]})
+
+    item = {
+        "title": [entry.get("title", "")],
+        "author": authors,
+        "container-title": [entry.get("journal", entry.get("booktitle", ""))],
+        "volume": entry.get("volume", ""),
+        "issue": entry.get("number", ""),
+        "page": entry.get("pages", "").replace("--", "-"),
+        "DOI": f"10.5555/{entry['ID'].lower()}",
+    }
+    if entry.get("year", "").isdigit():
+        item["published"] = {"date-parts": [[int(entry["year"])]]}
+    return item
+
+
+def perturb(item, rng):
+    """Introduce the sorts of differences seen between bibtex entries and CrossRef."""
+    item = json.loads(json.dumps(item))
+    title = list(item["title"][0])
+    for _ in range(rng.randint(0, 3)):
+        if title:
+            del title[rng.randrange(len(title))]
+    item["title"] = ["".join(title)]
+    if len(item["author"]) > 2 and rng.random() < 0.2:
+        del item["author"][-1]
+    if rng.random() < 0.1 and item["volume"].isdigit():
+        item["volume"] = str(int(item["volume"]) + 1)
+    return item
+
+
+def synthesize_responses(entries, rng, n_candidates=3):
+    """
+    Synthesize search responses for the given entries: a (perturbed) copy of the
+    entry itself, plus unrelated decoys.
+    """
+    pool = list(entries)
+    responses = []
+    for e in entries:
+        items = [perturb(crossref_item(e), rng)]
+        items += [crossref_item(rng.choice(pool)) for _ in range(n_candidates - 1)]
+        rng.shuffle(items)
+        responses.append({"entry": e, "items": items})
+    return responses
+
+
+def load_responses(fname):
+    with open(fname, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# reference implementation of the matching logic used by bibverify 1.1
+def legacy_normalize(s):
+    if not s:
+        return ""
+    s = re.sub(r"\{[^}]*\}", "", s)
+    s = re.sub(r"\\[a-zA-Z]+", "", s)
+    s = re.sub(r"[^a-zA-Z0-9\s]", "", s)
+    s = re.sub(r"\s+", " ", s)
+    return s.strip().lower()
+
+
+def legacy_similarity(s1, s2):
+    if not s1 or not s2:
+        return 0.0
+    return SequenceMatcher(None, legacy_normalize(s1), legacy_normalize(s2)).ratio()
+
+
+def legacy_decisions(verifier, responses):
+    decisions = []
+    for r in responses:
+        entry, items = r["entry"], r["items"]
+        best, best_score = None, 0.0
+        for item in items:
+            item_title = item.get("title", [""])[0] if item.get("title") else ""
+            score = legacy_similarity(entry.get("title", ""), item_title)
+            item_year = item.get("published", {}).get("date-parts", [[None]])[0][0]
+            if entry.get("year") and item_year and str(item_year) != str(entry["year"]):
+                score *= 0.7
+            if score > best_score:
+                best, best_score = item, score
+        if best_score < 0.7:
+            decisions.append((None, False))
+            continue
+
+        bib_names = [n.lower() for n in verifier.extract_last_names(entry.get("author", ""))]
+        cr_names = [a.get("family", "").lower() for a in best.get("author", []) if a.get("family")]
+        matches = sum(
+            1 for b in bib_names if any(legacy_similarity(b, c) > 0.85 for c in cr_names)
+        )
+        author_sim = matches / max(len(bib_names), len(cr_names), 1)
+        title_sim = legacy_similarity(entry.get("title", ""), best["title"][0])
+        journal, cr_journal = entry.get("journal", ""), best.get("container-title", [""])[0]
+        journal_sim = legacy_similarity(journal, cr_journal) if journal and cr_journal else 1.0
+        confident = title_sim >= 0.85 and author_sim >= 0.7 and journal_sim >= 0.6
+        decisions.append((best.get("DOI"), confident))
+    return decisions
+
+
+def current_decisions(verifier, responses):
+    decisions = []
+    for r in responses:
+        entry = r["entry"]
+        best = verifier.best_match(r["items"], entry.get("title", ""), entry.get("year"))
+        if best is None:
+            decisions.append((None, False))
+            continue
+        title_sim = verifier.similarity_ratio(entry.get("title", ""), best["title"][0])
+        _, author_sim = verifier.compare_authors(entry.get("author", ""), best.get("author", []))
+        journal, cr_journal = entry.get("journal", ""), best.get("container-title", [""])[0]
+        journal_sim = verifier.similarity_ratio(journal, cr_journal) if journal and cr_journal else 1.0
+        confident = title_sim >= 0.85 and author_sim >= 0.7 and journal_sim >= 0.6
+        decisions.append((best.get("DOI"), confident))
+    return decisions
+
+
+@app.command()
+def record(fname: str = "cdl.bib", outfile: str = "crossref.jsonl", max: int = 100, seed: int = 0):
+    """Record CrossRef search responses for a random subset of entries."""
+    from bibverify import BibVerifier
+
+    verifier = BibVerifier()
+    entries = [e for e in load_bibliography(fname, verbose=False).values() if e.get("title")]
+    random.Random(seed).shuffle(entries)
+
+    with open(outfile, "w") as f:
+        for e in entries[:max]:
+            first_author = verifier.extract_last_names(e.get("author", ""))[:1]
+            items = verifier.search_crossref(e["title"], first_author[0] if first_author else None)
+            if items:
+                f.write(json.dumps({"entry": e, "items": items}) + "\n")
+    typer.echo(f"saved responses to {outfile}")
+
+
+@app.command()
+def matching(fname: str = "cdl.bib", responses: str = None, repeat: int = 3, seed: int = 0):
+    """Compare the speed and decisions of the current and legacy matching code."""
+    import matching as m
+    from bibverify import BibVerifier
+
+    verifier = BibVerifier()
+    if responses:
+        data = load_responses(responses)
+    else:
+        entries = [e for e in load_bibliography(fname, verbose=False).values() if e.get("title")]
+        data = synthesize_responses(entries, random.Random(seed))
+
+    legacy, t_legacy = timed(legacy_decisions, verifier, data, repeat=repeat)
+    m.normalize.cache_clear()
+    current, t_current = timed(current_decisions, verifier, data, repeat=repeat)
+
+    agree = sum(a == b for a, b in zip(legacy, current))
+    typer.echo(f"{len(data)} responses")
+    typer.echo(f"legacy:  {t_legacy:.3f}s")
+    typer.echo(f"current: {t_current:.3f}s ({t_legacy / t_current:.1f}x faster)")
+    typer.echo(f"matching decisions agree for {agree}/{len(data)} responses")
+
+
+# reference implementation of the accent removal used for keys by bibcheck 1.x
+def legacy_remove_accents_and_hyphens(s):
+    replace = {"{\\l}": "l", "{\\o}": "o", "{\\i}": "i", "{\\t}": "t"}
+    for key, val in replace.items():
+        s = s.replace(key, val)
+
+    accents = r"""\{?\\[`'^"~=.uvHtcdbkr]?\s?\{?\\?(\w*)\}?"""
+    s_list = [c for c in s]
+    for a in re.finditer(accents, s):
+        s_list[a.start()] = a.group(1)
+        s_list[(a.start() + 1) : a.end()] = "-" * (a.end() - a.start() - 1)
+    return "".join([c for c in s_list if c != "-"])
+
+
+def legacy_to_ascii(s):
+    from unidecode import unidecode
+
+    return legacy_remove_accents_and_hyphens(unidecode(s))
+
+
+@app.command()
+def accents(fname: str = "cdl.bib", repeat: int = 5):
+    """Compare the speed and output of the current and legacy accent transliteration."""
+    import helpers
+
+    bd = load_bibliography(fname, verbose=False)
+    names = sorted({a for e in bd.values() for f in ("author", "editor") if f in e for a in e[f].split(" and ")})
+
+    legacy, t_legacy = timed(lambda: [legacy_to_ascii(n) for n in names], repeat=repeat)
+    current, t_current = timed(lambda: [helpers.to_ascii(n) for n in names], repeat=repeat)
+
+    # citation keys, computed from scratch with each transliteration
+    def keys():
+        helpers.name_key.cache_clear()
+        helpers.name_parser.names.clear()
+        helpers.name_parser.reformatted.clear()
+        return [helpers.authors2key(e["author"], e.get("year", "")) for e in bd.values() if "author" in e]
+
+    current_keys, t_current_keys = timed(keys, repeat=repeat)
+    to_ascii = helpers.to_ascii
+    helpers.to_ascii = legacy_to_ascii
+    try:
+        legacy_keys, t_legacy_keys = timed(keys, repeat=repeat)
+    finally:
+        helpers.to_ascii = to_ascii
+
+    typer.echo(f"{len(names)} names")
+    typer.echo(f"legacy:  {t_legacy:.3f}s (keys: {t_legacy_keys:.3f}s)")
+    typer.echo(f"current: {t_current:.3f}s ({t_legacy / t_current:.1f}x faster; keys: {t_current_keys:.3f}s)")
+    typer.echo(f"transliterations agree for {sum(a == b for a, b in zip(legacy, current))}/{len(names)} names")
+    typer.echo(f"keys agree for {sum(a == b for a, b in zip(legacy_keys, current_keys))}/{len(current_keys)} entries")
+
+
+STARTUP_COMMANDS = [
+    ["bibcheck.py", "--help"],
+    ["bibverify.py", "--help"],
+    ["bibverify.py", "info"],
+]
+
+
+def run_time(args, repeat, cwd):
+    """Best wall time (seconds) of running python with the given arguments (as timeit)."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=cwd, capture_output=True, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def top_level_imports(args, cwd):
+    """Import times (seconds) of the top-level modules imported, from python -X importtime."""
+    result = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=cwd, capture_output=True, text=True)
+    imports = {}
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit() and not parts[2].startswith("  "):
+            imports[parts[2].strip()] = int(parts[1]) / 1e6
+    return imports
+
+
+def slowest_imports(args, cwd, n=5):
+    """The top-level modules (other than python's own) that take longest to import."""
+    baseline = top_level_imports(["-c", "pass"], cwd)
+    imports = [(t, m) for m, t in top_level_imports(args, cwd).items() if m not in baseline]
+    return sorted(imports, reverse=True)[:n]
+
+
+@app.command()
+def startup(repeat: int = 10, budget: float = 0.1, profile: bool = False):
+    """
+    Time the CLIs' --help and info commands, over the time python itself takes
+    to start, and fail if any exceeds the budget (seconds).
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    baseline = run_time(["-c", "pass"], repeat, root)
+    typer.echo(f"python startup: {baseline * 1000:.0f}ms")
+
+    over_budget = []
+    for args in STARTUP_COMMANDS:
+        t = run_time(args, repeat, root) - baseline
+        typer.echo(f"{' '.join(args):<22} +{t * 1000:.0f}ms")
+        if profile:
+            for seconds, module in slowest_imports(args, root):
+                typer.echo(f"    {module:<20} {seconds * 1000:.0f}ms")
+        if t > budget:
+            over_budget.append(" ".join(args))
+
+    if over_budget:
+        typer.echo(f"over the {budget * 1000:.0f}ms budget: {', '.join(over_budget)}")
+        raise typer.Exit(1)
+
+
+def subset(fname, outfile, n):
+    """Write the first n entries of fname (and any @string definitions) to outfile."""
+    import scanner
+
+    count = 0
+    with open(fname, "rb") as f, open(outfile, "wb") as out:
+        for e, raw in scanner.stream(f):
+            if e.key is not None:
+                if count == n:
+                    continue
+                count += 1
+            out.write(raw + b"\n\n")
+
+
+@app.command()
+def load(
+    fname: str = "cdl.bib",
+    max: int = 500,
+    workers: str = "1,2,5,10,20",
+    latency: float = 0.1,
+    jitter: float = 0.5,
+    error_rate: float = 0.0,
+    throttle_rate: float = 0.0,
+    rate_limit: float = None,
+    retry_after: int = 1,
+    seed: int = 0,
+):
+    """
+    Load-test bibverify against a mock CrossRef server at several worker counts,
+    reporting throughput, request latency, and whether entries were matched to
+    the right records.
+    """
+    import tempfile
+    from bibverify import BibVerifier
+    from mockcrossref import MockCrossRef, synthesize_corpus
+    from stores import DOIIndex
+
+    fd, bibfile = tempfile.mkstemp(suffix=".bib")
+    os.close(fd)
+    subset(fname, bibfile, max)
+    entries = load_bibliography(bibfile, verbose=False)
+
+    mock = MockCrossRef(synthesize_corpus(entries.values(), seed=seed), latency=latency, jitter=jitter,
+                        error_rate=error_rate, throttle_rate=throttle_rate, rate_limit=rate_limit,
+                        retry_after=retry_after, seed=seed)
+    url = mock.start()
+
+    typer.echo(f"{len(entries)} entries; mock latency {latency * 1000:g} ms (median), "
+               f"{error_rate:.0%} errors, {throttle_rate:.0%} throttled")
+    typer.echo(f"{'workers':>7} {'seconds':>8} {'entries/s':>9} {'requests':>8} {'retries':>7} "
+               f"{'p50 ms':>7} {'p90 ms':>7} {'p99 ms':>7} {'correct':>7} {'wrong':>5} {'same':>5}")
+    reference = None
+    try:
+        for n in [int(w) for w in workers.split(",")]:
+            verifier = BibVerifier(max_workers=n, dois=DOIIndex(None), api_url=url)
+            with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                results, elapsed = timed(verifier.verify_bibliography, bibfile)
+
+            # each synthesized record's DOI is derived from its entry's key
+            matched = verifier.dois.data
+            correct = sum(doi == f"10.5555/{k.lower()}" for k, doi in matched.items())
+            decisions = (sorted(matched.items()), sorted(results["verified"]))
+            reference = reference or decisions
+
+            m = verifier.metrics.snapshot()
+            lat = m["histograms"].get("crossref_request_seconds") or {}
+            ms = lambda q: f"{lat[q] * 1000:.0f}" if lat.get(q) is not None else "-"
+            typer.echo(f"{n:>7} {elapsed:>8.2f} {len(entries) / elapsed:>9.1f} "
+                       f"{m['counters'].get('crossref_requests_total', 0):>8} "
+                       f"{m['counters'].get('crossref_retries_total', 0):>7} "
+                       f"{ms('p50'):>7} {ms('p90'):>7} {ms('p99'):>7} "
+                       f"{correct:>7} {len(matched) - correct:>5} {'yes' if decisions == reference else 'NO':>5}")
+    finally:
+        mock.stop()
+        os.remove(bibfile)
+
+    typer.echo("correct/wrong: confident matches to the entry's own record / to another record; "
+               "same: decisions identical to the first run")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,266 @@
+"""
+Extraction of the entries cited by a LaTeX document.
+
+Documents that use cdl.bib make bibtex (or biber) parse the whole file on
+every build.  extract writes a small .bib file containing only the entries a
+document cites, found from its .bcf (biber), its .aux (bibtex), or, before
+the first build, by scanning its .tex files for citation commands.  Entries
+are copied verbatim using the entry index (see offsets.py), so nothing is
+parsed or reformatted.
+
+The output starts with a comment recording a hash of the cited keys and of
+the copied entries; when neither has changed, the output is left untouched
+(so its modification time doesn't trigger a rebuild).  @string definitions
+aren't copied.
+
+propagate_renames updates the citation commands in a tree of .tex files
+after keys have been renamed (see stores.RenameLog).  Each file is read and
+rewritten in a single pass: the citation commands (including all the key
+groups of multicite commands such as \cites) are found with one scan, and
+each key they contain is looked up in the rename map, so the cost doesn't
+depend on the number of renames.  Files are processed in parallel.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+import re
+
+import scanner
+from offsets import EntryIndex
+from stores import atomic_write
+
+
+AUX_CITATION = re.compile(r"\\(?:citation|abx@aux@cite)(?:\{[0-9]+\})?\{([^}]*)\}")
+AUX_INPUT = re.compile(r"\\@input\{([^}]*)\}")
+BCF_CITEKEY = re.compile(r"<bcf:citekey[^>]*>([^<]+)</bcf:citekey>")
+# a citation command, and each {keys} group of its arguments with the
+# optional (pre/post) and [pre/post] notes before it; biblatex's multicite
+# commands (\cites, \textcites(pre)(post)[1]{A}[2]{B}, ...) take any number
+# of groups
+TEX_CITATION = re.compile(r"\\([A-Za-z]*cite[A-Za-z]*)\*?")
+TEX_CITATION_KEYS = re.compile(r"\s*(?:(?:\([^)]*\)|\[[^\]]*\])\s*)*\{([^}]*)\}")
+TEX_INPUT = re.compile(r"\\(?:input|include|subfile)\s*\{([^}]*)\}")
+TEX_COMMENT = re.compile(r"(?<!\\)%.*")
+KEY = re.compile(r"[^,\s]+")
+
+HEADER = "% extracted by bibcheck.py extract"
+
+
+def read_text(fname):
+    with open(fname, "r", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def split_keys(s):
+    return [k.strip() for k in s.split(",") if k.strip()]
+
+
+def citation_key_spans(text):
+    """The (start, end) offsets of the key lists in the citation commands of text."""
+    for m in TEX_CITATION.finditer(text):
+        pos = m.end()
+        while True:
+            group = TEX_CITATION_KEYS.match(text, pos)
+            if group is None:
+                break
+            yield group.span(1)
+            pos = group.end()
+            if not m.group(1).endswith("cites"):
+                break
+
+
+def aux_keys(fname, seen=None):
+    # included files (\include{chapter}) have their own .aux files, which
+    # are named (relative to the main .aux) with \@input
+    seen = set() if seen is None else seen
+    seen.add(os.path.abspath(fname))
+    text = read_text(fname)
+    keys = [k for m in AUX_CITATION.finditer(text) for k in split_keys(m.group(1))]
+    for m in AUX_INPUT.finditer(text):
+        child = os.path.join(os.path.dirname(fname), m.group(1))
+        if os.path.exists(child) and os.path.abspath(child) not in seen:
+            keys.extend(aux_keys(child, seen))
+    return keys
+
+
+def bcf_keys(fname):
+    return [m.group(1).strip() for m in BCF_CITEKEY.finditer(read_text(fname))]
+
+
+def tex_keys(fname, seen=None):
+    seen = set() if seen is None else seen
+    seen.add(os.path.abspath(fname))
+    text = TEX_COMMENT.sub("", read_text(fname))
+    keys = [k for start, end in citation_key_spans(text) for k in split_keys(text[start:end])]
+    for m in TEX_INPUT.finditer(text):
+        child = os.path.join(os.path.dirname(fname), m.group(1).strip())
+        if not os.path.exists(child):
+            child += ".tex"
+        if os.path.exists(child) and os.path.abspath(child) not in seen:
+            keys.extend(tex_keys(child, seen))
+    return keys
+
+
+READERS = {".bcf": bcf_keys, ".aux": aux_keys, ".tex": tex_keys}
+
+
+def cited_keys(source):
+    """
+    The keys cited by a document, in order of first citation.  source is a
+    .bcf, .aux or .tex file, or the name of a document without an extension,
+    in which case the first of those that exists is used.  "*" (from
+    \\nocite{*}) stands for every entry.
+    """
+    base, ext = os.path.splitext(source)
+    if ext not in READERS:
+        base = source
+        found = [base + e for e in READERS if os.path.exists(base + e)]
+        if not found:
+            raise FileNotFoundError(f"no {', '.join(base + e for e in READERS)} found")
+        source, ext = found[0], os.path.splitext(found[0])[1]
+    return list(dict.fromkeys(READERS[ext](source)))
+
+
+def crossrefs(raw):
+    """Keys named by the crossref field of a raw entry."""
+    _, found, _ = scanner.fields(raw)
+    return [
+        raw[f.content_start : f.content_end].decode("utf-8").strip()
+        for f in found
+        if f.name == "crossref"
+    ]
+
+
+def signature(keys, index):
+    h = hashlib.sha1()
+    for k in keys:
+        h.update(k.encode("utf-8") + b"\0")
+        h.update((index.entries[k][2] if k in index else "").encode("ascii") + b"\0")
+    return h.hexdigest()
+
+
+def extract(bibfile, source, outfile, force=False):
+    """
+    Write the entries of bibfile cited by source (see cited_keys) to outfile,
+    in the order they appear in bibfile, followed by any entries they
+    crossref.  Returns (whether outfile was written, cited keys that aren't
+    in bibfile).
+
+    An existing outfile that wasn't written by extract is only overwritten
+    if force is True.
+    """
+    index = EntryIndex(bibfile)
+    keys = cited_keys(source)
+    if "*" in keys:
+        keys = list(index.keys())
+
+    # entries named by crossref fields must come along, and (for bibtex)
+    # follow the entries that refer to them
+    wanted = dict.fromkeys(keys)
+    referenced = set()
+    todo = [k for k in keys if k in index]
+    while todo:
+        for k in crossrefs(index.raw(todo.pop())):
+            referenced.add(k)
+            if k not in wanted:
+                wanted[k] = None
+                if k in index:
+                    todo.append(k)
+    missing = [k for k in wanted if k not in index]
+    found = sorted((k for k in wanted if k in index), key=lambda k: (k in referenced, index.entries[k][0]))
+
+    header = f"{HEADER} from {os.path.basename(bibfile)}; signature: {signature(sorted(wanted), index)}"
+    if os.path.exists(outfile):
+        with open(outfile, "r", encoding="utf-8", errors="replace") as f:
+            first = f.readline().rstrip("\n")
+        if first == header:
+            return False, missing
+        if not first.startswith(HEADER) and not force:
+            raise FileExistsError(f"{outfile} exists and wasn't written by extract")
+
+    with atomic_write(outfile, "wb") as f:
+        f.write((header + "\n\n").encode("utf-8"))
+        for k in found:
+            f.write(index.raw(k))
+            f.write(b"\n\n")
+    return True, missing
+
+
+def rename_citations(text, renames):
+    """
+    Replace the keys in the citation commands of text according to renames
+    ({old key: new key}).  Returns the new text and the number of keys
+    replaced.
+    """
+    replaced = 0
+
+    def rename(m):
+        nonlocal replaced
+        new = renames.get(m.group(0))
+        if new is None:
+            return m.group(0)
+        replaced += 1
+        return new
+
+    parts = []
+    last = 0
+    for start, end in citation_key_spans(text):
+        parts.append(text[last:start])
+        parts.append(KEY.sub(rename, text[start:end]))
+        last = end
+    parts.append(text[last:])
+    return "".join(parts), replaced
+
+
+def propagate_file(fname, renames, dry_run=False):
+    # undecodable bytes are carried through unchanged
+    with open(fname, "rb") as f:
+        text = f.read().decode("utf-8", "surrogateescape")
+    text, replaced = rename_citations(text, renames)
+    if replaced and not dry_run:
+        with atomic_write(fname, "wb") as f:
+            f.write(text.encode("utf-8", "surrogateescape"))
+    return replaced
+
+
+def tex_files(root, extensions=(".tex",)):
+    for directory, subdirs, files in os.walk(root):
+        subdirs[:] = [d for d in subdirs if not d.startswith(".")]
+        for f in files:
+            if f.endswith(extensions):
+                yield os.path.join(directory, f)
+
+
+# the rename map, set once in each worker process rather than sent with
+# every file
+worker_renames = None
+
+
+def init_worker(renames):
+    global worker_renames
+    worker_renames = renames
+
+
+def propagate_worker(args):
+    fname, dry_run = args
+    return fname, propagate_file(fname, worker_renames, dry_run)
+
+
+def propagate_renames(root, renames, workers=None, dry_run=False, extensions=(".tex",)):
+    """
+    Update the citations of renamed keys in the files under root (see
+    rename_citations), using a pool of worker processes.  Returns {file:
+    number of keys replaced} for the files that cite renamed keys; with
+    dry_run=True, the files aren't changed.
+    """
+    files = sorted(tex_files(root, extensions))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(files) < 2:
+        init_worker(renames)
+        results = map(propagate_worker, [(f, dry_run) for f in files])
+        return {f: n for f, n in results if n}
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(renames,)) as pool:
+        chunksize = max(1, len(files) // (4 * workers))
+        results = pool.map(propagate_worker, [(f, dry_run) for f in files], chunksize=chunksize)
+        return {f: n for f, n in results if n}
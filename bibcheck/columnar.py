@@ -0,0 +1,97 @@
+"""
+Columnar view of a parsed bibliography, for vectorized checks.
+
+load_bibliography returns a dictionary of per-entry dictionaries, which is
+convenient for editing but means every check loops over entries in Python.
+Columns stores the same data as one pandas column per field (missing values
+are NaN, so each column doubles as a null mask), and provides the checks
+that can be run on whole columns at once.  Checks that can't be vectorized
+are only run on the entries (or distinct values) that need them.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# page values whose correct form can be determined without helpers.valid_pages
+SINGLE_PAGE = r"[0-9]+"
+PAGE_RANGE = r"(?P<first>[0-9]{1,15})-{1,2}(?P<last>[0-9]{1,15})"
+
+
+def duplicate_groups(values):
+    """
+    Lists of the indices of matching (non-unique) values, ordered by value
+    (the same result as helpers.duplicate_inds).
+    """
+    s = pd.Series(values, dtype=object)
+    groups = s.groupby(s, sort=True).indices
+    return [list(map(int, inds)) for _, inds in sorted(groups.items()) if len(inds) > 1]
+
+
+class Columns:
+    def __init__(self, bd, fields=None):
+        # fields: only load these fields (and ID and force), rather than all of them
+        records = list(bd.values())
+        if fields is not None:
+            fields = set(fields) | {"ID", "force"}
+            records = [{f: v for f, v in e.items() if f in fields} for e in records]
+        self.frame = pd.DataFrame.from_records(records)
+        if "ID" not in self.frame:
+            self.frame["ID"] = pd.Series(dtype=object)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def present(self, field):
+        """Boolean mask of the entries that have the given field."""
+        if field not in self.frame:
+            return pd.Series(False, index=self.frame.index)
+        return self.frame[field].notna()
+
+    def vals(self, field):
+        """The values of a field, with "" for entries that don't have it (as helpers.get_vals)."""
+        if field not in self.frame:
+            return pd.Series("", index=self.frame.index, dtype=object)
+        return self.frame[field].fillna("")
+
+    def map_unique(self, field, f):
+        """Apply f to each distinct value of a field (rather than to every entry)."""
+        vals = self.vals(field)
+        return vals.map({v: f(v) for v in vals.unique()})
+
+    def key_bases(self, author_key):
+        """
+        Target citation keys, without suffixes: author_key(authors) computed
+        once per distinct author list, plus the last two digits of the year.
+        """
+        return self.map_unique("author", author_key) + self.vals("year").astype(str).str[-2:]
+
+    def simple_pages(self):
+        """
+        Find the page values whose correct form follows from the column alone:
+        empty, single numbers and increasing numeric ranges ("12-15" or
+        "12--15").  Returns a mask of those entries and the correct pages
+        (the unchanged value for the other entries, which need valid_pages).
+        """
+        pages = self.vals("pages")
+        targets = pages.copy()
+
+        ranges = pages.str.extract(f"^{PAGE_RANGE}$")
+        is_range = ranges["first"].notna()
+        first = pd.to_numeric(ranges["first"][is_range]).astype(np.int64)
+        last = pd.to_numeric(ranges["last"][is_range]).astype(np.int64)
+        increasing = (first < last).reindex(pages.index, fill_value=False).astype(bool)
+        targets[increasing] = ranges["first"][increasing] + "--" + ranges["last"][increasing]
+
+        simple = (pages == "") | pages.str.fullmatch(SINGLE_PAGE).fillna(False).astype(bool) | increasing
+        return simple, targets
+
+    def extraneous(self, keep_fields):
+        """
+        Mask of the entries (without a force field) that have fields that
+        aren't in keep_fields.
+        """
+        extra = [f for f in self.frame.columns if f not in keep_fields]
+        if not extra:
+            return pd.Series(False, index=self.frame.index)
+        return self.frame[extra].notna().any(axis=1) & ~self.present("force")
@@ -0,0 +1,110 @@
+"""
+The entries of a .bib file that were changed according to git.
+
+For pre-commit hooks and CI: the hunks of `git diff` (of the staged changes,
+or of the changes since a given revision) are mapped, with the scanner, onto
+the entries that contain the changed lines, so that checks can be run on just
+those entries.  Keys of entries that were deleted outright are read from the
+removed lines of the diff.
+"""
+
+from bisect import bisect_right
+import os
+import re
+import subprocess
+
+import scanner
+
+
+# (first line, number of lines) of the new version in each hunk header; the
+# count is omitted when it's 1, and is 0 when lines were only removed (after
+# the given line)
+HUNK = re.compile(rb"^@@ -[0-9]+(?:,[0-9]+)? \+([0-9]+)(?:,([0-9]+))? @@", re.M)
+REMOVED_ENTRY = re.compile(rb"^-[ \t]*@[ \t]*([A-Za-z]+)[ \t\r\n]*\{[ \t]*([^,\s}]+)", re.M)
+NEWLINE = re.compile(rb"\n")
+
+
+class GitError(Exception):
+    pass
+
+
+def git(bibfile, *args):
+    """Run git (in the directory of bibfile) and return its output."""
+    try:
+        result = subprocess.run(
+            ["git", *args],
+            cwd=os.path.dirname(os.path.abspath(bibfile)),
+            capture_output=True,
+        )
+    except FileNotFoundError:
+        raise GitError("git is not installed")
+    if result.returncode != 0:
+        raise GitError(f"git {args[0]} failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return result.stdout
+
+
+def contents(bibfile, staged=False):
+    """The contents (bytes) of bibfile, or of its staged version."""
+    if staged:
+        return git(bibfile, "show", ":./" + os.path.basename(bibfile))
+    with open(bibfile, "rb") as f:
+        return f.read()
+
+
+def diff(bibfile, staged=False, since=None):
+    """
+    The diff (with no context lines) of the staged changes to bibfile, and/or
+    of its changes since revision since.
+    """
+    args = ["diff", "-U0", "--no-color", "--no-ext-diff"]
+    if staged:
+        args.append("--cached")
+    if since is not None:
+        args.append(since)
+    return git(bibfile, *args, "--", os.path.basename(bibfile))
+
+
+def changed_lines(d):
+    return [(int(m.group(1)), 1 if m.group(2) is None else int(m.group(2))) for m in HUNK.finditer(d)]
+
+
+def removed_keys(d):
+    """Keys of the entries whose first line was removed (or changed)."""
+    return [
+        m.group(2).decode("utf-8")
+        for m in REMOVED_ENTRY.finditer(d)
+        if m.group(1).lower() not in scanner.NON_ENTRIES
+    ]
+
+
+def changed_entries(buf, lines, entries=None):
+    """
+    The entries (scanner.Entry) of buf that overlap the given changed line
+    ranges (as returned by changed_lines).  entries: the scanned entries of
+    buf, if already known.
+    """
+    if entries is None:
+        entries = list(scanner.scan(buf))
+    entries = [e for e in entries if e.key is not None]
+    starts = [0] + [m.end() for m in NEWLINE.finditer(buf)]  # offset of each line
+
+    def line_start(i):  # 0-based
+        return starts[i] if i < len(starts) else len(buf)
+
+    ends = [e.end for e in entries]
+    changed = {}
+    for first, count in lines:
+        if count == 0:
+            # lines were removed between line first and the next one; only
+            # the entry that spans that point (if any) changed
+            a = b = line_start(first)
+            inside = lambda e: e.start < a < e.end
+        else:
+            a, b = line_start(first - 1), line_start(first - 1 + count)
+            inside = lambda e: e.start < b
+        for e in entries[bisect_right(ends, a) :]:
+            if e.start >= max(a + 1, b):
+                break
+            if inside(e):
+                changed[e.start] = e
+    return [changed[s] for s in sorted(changed)]
@@ -1,6 +1,7 @@
 from unidecode import unidecode as decode
 from string import ascii_lowercase
 from urllib import request as get
+from functools import lru_cache
 from tqdm import tqdm
 
 import bibtexparser as bp
@@ -11,6 +12,14 @@ import re
 import itertools
 import os
 import sys
+import time
+
+import gitdiff
+import patcher
+import scanner
+from columnar import Columns, duplicate_groups
+from names import NameParser, plain
+from stores import VenueAuthority
 
 
 def read(fname):
@@ -28,6 +37,7 @@ def load_key(fname):
 
 prefixes = read("prefixes.txt")
 suffixes = read("suffixes.txt")
+name_parser = NameParser(prefixes, suffixes)
 uncaps = read("uncaps.txt")
 force_caps = read("caps.txt")
 address_codes = read("addresses.txt")
@@ -46,15 +56,19 @@ def printv(s, verbose=True, **kwargs):
         print(s, **kwargs)
 
 
+def bib_parser():
+    return bp.bparser.BibTexParser(
+        ignore_nonstandard_types=True, common_strings=True, homogenize_fields=True
+    )
+
+
 def load_bibliography(fname, verbose=True):
     if fname == "github":
         fname = LATEST_BIBFILE
 
     printv(f"loading {fname}...", verbose=verbose, end="")
 
-    parser = bp.bparser.BibTexParser(
-        ignore_nonstandard_types=True, common_strings=True, homogenize_fields=True
-    )
+    parser = bib_parser()
     if os.path.exists(fname):
         with open(fname, "r") as b:
             bibdata = bp.load(b, parser=parser)
@@ -65,22 +79,96 @@ def load_bibliography(fname, verbose=True):
     return bibdata.get_entry_dict()
 
 
+def load_changed(bibfile, staged=False, since=None, verbose=True):
+    """
+    Parse only the entries of bibfile that were changed according to git (the
+    staged changes and/or the changes since revision since), plus the other
+    entries with the same key bases as the changed (or deleted) ones, which
+    the duplicate and key suffix checks compare them with.  With staged=True,
+    the staged version of the file is read.
+
+    Returns the entries (as load_bibliography), the changed keys, and any of
+    the returned keys that occur more than once in the file.
+    """
+    printv(f"finding changed entries in {bibfile}...", verbose=verbose, end="")
+    buf = gitdiff.contents(bibfile, staged=staged)
+    d = gitdiff.diff(bibfile, staged=staged, since=since)
+    entries = list(scanner.scan(buf))
+    changed = gitdiff.changed_entries(buf, gitdiff.changed_lines(d), entries)
+    changed_keys = [e.key for e in changed]
+
+    # @string definitions apply to every entry
+    parser = bib_parser()
+    strings = [buf[e.start : e.end] for e in entries if e.type == "string"]
+    parsed = parser.parse(b"\n".join(strings + [buf[e.start : e.end] for e in changed]).decode("utf-8"))
+
+    # the rest of the file is assumed to have passed the checks, so entries
+    # that aren't changed already have their target key base
+    bases = {key_base(k) for k in changed_keys + gitdiff.removed_keys(d)}
+    for e in parsed.entries:
+        try:
+            bases.add(authors2key(e["author"], e["year"]))
+        except Exception:
+            pass  # reported by the key checks
+    seen = set(changed_keys)
+    related = [e for e in entries if e.key is not None and e.key not in seen and key_base(e.key) in bases]
+    if related:
+        parser.parse(b"\n".join(buf[e.start : e.end] for e in related).decode("utf-8"))
+    printv(f"{len(changed_keys)} changed, {len(related)} with the same key bases", verbose=verbose)
+
+    keys = seen | {e.key for e in related}
+    counts = {}
+    for e in entries:
+        if e.key in keys:
+            counts[e.key] = counts.get(e.key, 0) + 1
+    repeated = sorted(k for k, n in counts.items() if n > 1)
+    return parser.bib_database.get_entry_dict(), changed_keys, repeated
+
+
+def stream_bibliography(fname):
+    # parse and yield entries one at a time as they are read from fname, rather
+    # than loading the whole file first.  a single parser is reused so that
+    # @string definitions apply to the entries that follow them.
+    parser = bib_parser()
+    with open(fname, "rb") as f:
+        for _, raw in scanner.stream(f):
+            entries = parser.parse(raw.decode("utf-8")).entries
+            for e in entries:
+                yield e
+            entries.clear()
+
+
+class AsciiTable(dict):
+    # str.translate table mapping characters to their closest ASCII
+    # equivalents (as given by unidecode); characters beyond the precomputed
+    # range are added as they are encountered
+    def __missing__(self, c):
+        self[c] = decode(chr(c))
+        return self[c]
+
+
+ascii_table = AsciiTable((c, decode(chr(c))) for c in range(0x250))
+
+latex_letters = {"{\\l}": "l", "{\\o}": "o", "{\\i}": "i", "{\\t}": "t"}
+
+# accent macros (\'{e}, {\"u}, \c c, ...) and hyphens, removed in a single scan
+latex_accents = re.compile(r"""\{?\\[`'^"~=.uvHtcdbkr]?\s?\{?\\?(\w*)\}?|-""")
+
+
 def remove_accents_and_hyphens(s):
-    replace = {"{\\l}": "l", "{\\o}": "o", "{\\i}": "i", "{\\t}": "t"}
-    for key, val in replace.items():
+    if "\\" not in s:
+        return s.replace("-", "")
+    for key, val in latex_letters.items():
         s = s.replace(key, val)
+    return latex_accents.sub(lambda m: m.group(1) or "", s)
 
-    accents = r"""\{?\\[`'^"~=.uvHtcdbkr]?\s?\{?\\?(\w*)\}?"""
-    accented_chars = [x for x in re.finditer(accents, s)]
-
-    s_list = [c for c in s]
-    hyphen = "-"
-    for a in accented_chars:
-        next_len = a.end() - a.start()
-        s_list[a.start()] = a.group(1)
-        s_list[(a.start() + 1) : a.end()] = hyphen * (next_len - 1)
 
-    return "".join([c for c in s_list if c != hyphen])
+def to_ascii(s):
+    # transliterate unicode characters and latex accents to plain ascii
+    # letters, and remove hyphens
+    if not s.isascii():
+        s = s.translate(ascii_table)
+    return remove_accents_and_hyphens(s)
 
 
 def match(names, template):
@@ -125,29 +213,20 @@ def remove_curlies(s, join=""):  # only removes *matching* curly braces
 
 
 def remove_non_letters(s):
-    remove_chars = [
-        ",",
-        ".",
-        "!",
-        "?",
-        "'",
-        '"',
-        "{",
-        "}",
-        "-",
-        "\\",
-        ":",
-        "(",
-        ")",
-        "[",
-        "]",
-        "+",
-        "/",
-        "*",
-    ]
-    for c in remove_chars:
-        s = s.replace(c, "")
-    return s
+    # removes , . ! ? ' " { } - \ : ( ) [ ] + / *
+    return plain(s)
+
+
+@lru_cache(maxsize=None)
+def caps_index(caps):
+    # lowercase --> capitalization for a tuple of words that must be
+    # capitalized a certain way (when several match, the last one is used)
+    return {f.lower(): f for f in caps}
+
+
+def forced_caps(word, caps):
+    # the required capitalization of word, if it's in caps (or None)
+    return caps_index(tuple(caps)).get(remove_non_letters(word.lower()))
 
 
 def char_match(x, y, ignore_case=True):
@@ -157,91 +236,56 @@ def char_match(x, y, ignore_case=True):
     return remove_non_letters(x.strip()) == remove_non_letters(y.strip())
 
 
-def rearrange(name, preserve_non_letters=False):
-    original_name = name
-
-    # remove suffixes and convert to list
-    if preserve_non_letters:
-        name = [x.strip() for x in name.split(",")]
-    else:
-        name = [remove_non_letters(x.strip()) for x in name.split(",")]
-    sxs = [n for n in name if n.lower() in suffixes]
-    name = [n for n in name if n.lower() not in suffixes]
-
-    if len(name) == 2:  # last, first (+ middle)
-        if preserve_non_letters and len(name[0].split(" ")) > 1:
-            if not (
-                (len(name[0]) >= 2) and (name[0][0] == "{") and (name[0][-1] == "}")
-            ):
-                name[0] = "{" + name[0] + "}"
-        x = " ".join([name[1], name[0]])
-    elif len(name) == 1:  # first (+ middle) + last
-        x = name[0]
-    elif len(name) == 0:
-        raise Exception(f"no non-suffix names: {original_name}")
-    elif len(name) > 2:
-        raise Exception(f"too many commas: {original_name}")
-    return x
-
-
-def last_name(names):
-    # remove suffixes and non-letters
-    names = [
-        remove_non_letters(n)
-        for n in rearrange(names).split(" ")
-        if not (n.lower() in suffixes)
-    ]
-
-    # start at the end and move backward
-    x = []
-    found_prefix = False
-    for n in reversed(names):
-        if (n.lower() in prefixes) and (n != n.upper()):
-            found_prefix = True
-        elif found_prefix or len(x) > 0:
-            break
-        x.append(n)
-    if found_prefix:
-        return "".join(reversed(x))
-    else:
-        return x[0]
+def last_name(name):
+    return name_parser.last_name(name)
 
 
 def last_names_from_str(x):
     # pass in a single string (and-separated) or list of authors and get back a list of last names
     if type(x) == str:
-        return [last_name(n) for n in x.split(" and ")]
+        return name_parser.last_names(x)
     elif type(x) == list:
         return [last_name(n) for n in x]
     else:
         return [""]
 
 
+# the suffix that distinguishes keys with the same base (a, b, ..., aa, ...)
+KEY_SUFFIX = re.compile(r"(?<=[0-9])[a-z]+$")
+
+
+def key_base(key):
+    return KEY_SUFFIX.sub("", key)
+
+
 def authors2key(authors, year):
-    def key(author):
-        # convert accented unicode characters to closest ascii equivalent
-        author = decode(author)
+    return author_key(authors) + str(year)[-2:]
 
-        # re-arrange author name to FIRST [MIDDLE] LAST [SUFFIX]
-        author = remove_accents_and_hyphens(author)
-        # author = reformat_author(author)
-        author = remove_curlies(author)
-        author = reformat_author(author)
 
-        # get first 4 letters of last name
-        return last_name(author)[:4]
+@lru_cache(maxsize=None)
+def name_key(author):  # the part of the citation key contributed by one author
+    # convert accented unicode characters and latex accents to their closest
+    # ascii equivalents
+    author = to_ascii(author)
 
-    yr_str = str(year)[-2:]
+    # re-arrange author name to FIRST [MIDDLE] LAST [SUFFIX]
+    author = remove_curlies(author)
+    author = reformat_author(author)
 
+    # get first 4 letters of last name
+    return last_name(author)[:4]
+
+
+def author_key(authors):  # the part of the citation key that precedes the year
     authors = authors.split(" and ")
     if len(authors) == 0:
         raise Exception("Author information missing, no key generated")
     elif len(authors) == 1:
-        return key(authors[0]) + yr_str
+        return name_key(authors[0])
     elif len(authors) == 2:
-        return key(authors[0]) + key(authors[1]) + yr_str
+        return name_key(authors[0]) + name_key(authors[1])
     elif len(authors) >= 3:
-        return key(authors[0]) + "Etal" + yr_str
+        return name_key(authors[0]) + "Etal"
     else:
         raise Exception("Something went wrong...")
 
@@ -300,11 +344,7 @@ def check_entries(
 def duplicate_inds(x):
     # for the list x, return a new list containing 0 or more
     # lists of the indices of matching (non-unique) elements
-    y = []
-    unique_vals, counts = np.unique(x, return_counts=True)
-    for v in [v for i, v in enumerate(unique_vals) if counts[i] > 1]:
-        y.append([i for i, j in enumerate(x) if j == v])
-    return y
+    return duplicate_groups(x)
 
 
 def find_duplicates(ids, authors, titles, verbose=True):
@@ -379,49 +419,38 @@ def get_key_suffixes(n):
 # If keys match aside from suffix then still allow the bibtex file to "pass"
 # as long as all "matching" keys are unique and all have suffixes and the
 # suffixes span a, b, c, ..., etc. without gaps
-def check_key_suffixes(bd):
+def check_key_suffixes(bd, target_ids=None):
+    # target_ids: the key bases (authors2key) of the entries, if already known
     ids = get_vals(bd, "ID")
-    authors = get_vals(bd, "author")
-    years = get_vals(bd, "year")
+    if target_ids is None:
+        target_ids = list(Columns(bd).key_bases(author_key))
 
-    target_ids = [authors2key(a, y) for a, y in zip(authors, years)]
-
-    checked = []
-    bad_keys = []
+    # corrections are tracked by position rather than by key, so that
+    # entries that share a key (e.g. in a stream of entries, which isn't
+    # deduplicated by the parser) each get their own target
+    checked = set()
+    targets = list(ids)
 
     # for duplicate base keys, ensure correct suffixes
     same_base = duplicate_inds(target_ids)
     for inds in same_base:
         next_base = target_ids[inds[0]]
         target_keys = [next_base + x for x in get_key_suffixes(len(inds))]
-        actual_keys = list(np.array(ids)[inds])
+        actual_keys = [ids[i] for i in inds]
 
-        correct_keys = [a for a in actual_keys if a in target_keys]
         missing_keys = [t for t in target_keys if t not in actual_keys]
-        i = 0
-        for a in actual_keys:
-            checked.append(a)
-            if a not in target_keys:
-                bad_keys.append([a, missing_keys[i]])
-                i += 1
+        kept = set()
+        for i in inds:
+            checked.add(i)
+            if ids[i] not in target_keys or ids[i] in kept:
+                targets[i] = missing_keys.pop(0)
+            else:
+                kept.add(ids[i])
 
     # for non-duplicate base keys, ensure *no* suffixes
-    for i, t in zip(ids, target_ids):
+    for i, t in enumerate(target_ids):
         if i not in checked:
-            if not (i == t):
-                bad_keys.append([i, t])
-
-    # now generate a list of actual ids and target ids, where the targets are
-    # in the same order of the actual ids
-    targets = []
-    for i in ids:
-        correction = [b[1] for b in bad_keys if b[0] == i]
-        if len(correction) == 0:
-            targets.append(i)
-        elif len(correction) == 1:
-            targets.append(correction[0])
-        else:
-            raise Exception(f"same key was corrected multiple times: {i}")
+            targets[i] = t
 
     return targets
 
@@ -548,21 +577,30 @@ def valid_pages(p):
         return False, [p, "--".join(ps)]
 
 
-def generate_correct_pages(bd):
-    ids = get_vals(bd, "ID")
-    pages = get_vals(bd, "pages")
-
-    target_pages = [valid_pages(p)[1][1] for p in pages]
-
-    unfixable = [
-        (i, valid_pages(p)) for i, p in zip(ids, target_pages) if not valid_pages(p)[0]
-    ]
+def generate_correct_pages(bd, cols=None):
+    # empty pages, single pages and increasing numeric ranges are checked on
+    # the whole column at once; only the rest go through valid_pages
+    cols = cols if cols is not None else Columns(bd)
+    ids = list(cols.vals("ID"))
+    pages = list(cols.vals("pages"))
+    simple, target_pages = cols.simple_pages()
+    target_pages = list(target_pages)
+
+    unfixable = []
+    for i in np.flatnonzero(~simple.to_numpy()):
+        target_pages[i] = valid_pages(pages[i])[1][1]
+        if not valid_pages(target_pages[i])[0]:
+            unfixable.append((ids[i], valid_pages(target_pages[i])))
     return target_pages, unfixable
 
 
-def format_journal_name(n, key=journal_key, force_caps=force_caps):
+def format_journal_name(n, key=journal_key, force_caps=force_caps, venues=None):
+    # venues (a VenueAuthority) supplies canonical names learned by bibverify
+    # for journals that aren't in the key
     if (n.lower() in key.keys()) and (type(key[n.lower()]) == str):
         n = key[n.lower()]
+    elif venues is not None and venues.canonical([n]):
+        n = venues.canonical([n])
     else:
         n = n.lower()
 
@@ -587,12 +625,8 @@ def format_journal_name(n, key=journal_key, force_caps=force_caps):
             words[i] = w
             continue
 
-        correct_caps = [
-            f for f in force_caps if f.lower() == remove_non_letters(core.lower())
-        ]
-
-        if len(correct_caps) >= 1:
-            c = correct_caps[-1]
+        c = forced_caps(core, force_caps)
+        if c is not None:
             if not (c[0] == "{" and c[-1] == "}"):
                 c = insert_non_letters("{" + c + "}", remove_curlies(core, join=" "))
             # Add back prefix and suffix (but not the outer braces we removed, since c already has them)
@@ -621,30 +655,7 @@ def format_journal_name(n, key=journal_key, force_caps=force_caps):
 # ...
 # AAA --> A A A
 def reformat_author(author):
-    if len(author.split(" and ")) > 1:
-        return " and ".join([reformat_author(a) for a in author.split(" and ")])
-
-    try:
-        author = rearrange(author, preserve_non_letters=True)
-    except:
-        pass
-
-    unclumped = []
-    names = author.split(" ")
-
-    for n in names:
-        # remove periods
-        n = n.replace(".", "")
-        if (remove_non_letters(n.lower()) not in suffixes) and (n == n.upper()):
-            if n.find("-") >= 0:
-                n = "-".join([reformat_author(c) for c in n.split("-")])
-            else:
-                for c in list(n):
-                    unclumped.append(c)
-                continue
-        unclumped.append(n)
-
-    return " ".join(unclumped)
+    return name_parser.reformat(author)
 
 
 def get_fields(bd):
@@ -664,31 +675,31 @@ def get_fields(bd):
     return fields
 
 
-def polish_database(bd, errors, autofix=False, verbose=True, return_removed=False):
+def polish_database(
+    bd, errors, autofix=False, verbose=True, return_removed=False, cols=None, prune=True
+):
     keep_fields = read("keep_fields.txt")
+    cols = cols if cols is not None else Columns(bd)
 
     removed = {}
-    printv("searching for extra fields...", verbose=verbose)
-    x = {}
-    for b in tqdm(bd.keys()):
-        # printv(f'checking item {b} for extraneous fields...', verbose=verbose)
-        next_item = {}
-        if "force" in list(bd[b].keys()):
-            printv(
-                f"\tforce flag found: skipping pruning of entry [{b}]", verbose=verbose
-            )
-            x[b] = bd[b]
-            continue
-        for k in bd[b].keys():
-            if k in keep_fields:
-                next_item[k] = bd[b][k]
-            else:
-                if b in removed.keys():
-                    removed[b].append(k)
-                else:
-                    removed[b] = [k]
+    x = {b: dict(e) for b, e in bd.items()}
+
+    # only entries that are forced or have extra fields need a closer look
+    if prune:
+        printv("searching for extra fields...", verbose=verbose)
+        forced = cols.present("force")
+        flagged = forced | cols.extraneous(keep_fields)
+        for b, force in tqdm(zip(cols.vals("ID")[flagged], forced[flagged])):
+            if force:
+                printv(
+                    f"\tforce flag found: skipping pruning of entry [{b}]",
+                    verbose=verbose,
+                )
+                continue
+            removed[b] = [k for k in bd[b].keys() if k not in keep_fields]
+            for k in removed[b]:
+                del x[b][k]
                 printv(f"\textraneous field detected: {b}[{k}]", verbose=verbose)
-        x[b] = next_item
 
     if autofix:
         printv("\nautocorrecting...", verbose=verbose)
@@ -697,7 +708,7 @@ def polish_database(bd, errors, autofix=False, verbose=True, return_removed=Fals
                 raise Exception(f"key {i} not found, aborting")
             elif "force" in list(bd[i].keys()):
                 printv(
-                    f"\tforce flag found: skipping corrections of entry [{b}]",
+                    f"\tforce flag found: skipping corrections of entry [{i}]",
                     verbose=verbose,
                 )
                 continue
@@ -720,20 +731,23 @@ def polish_database(bd, errors, autofix=False, verbose=True, return_removed=Fals
         return entries_list
 
 
+def entry2str(e, order, indent="\t"):
+    # an entry as written to cdl.bib: one capitalized field per line, in the
+    # given order (fields not in order are left out)
+    s = "@" + e["ENTRYTYPE"] + "{" + e["ID"] + ","
+    at_least_one = False
+    for k in order:
+        if (k not in ["ENTRYTYPE", "ID"]) and (k in e.keys()):
+            s += "\n" + indent + k.capitalize() + " = {" + e[k] + "},"
+            at_least_one = True
+    if at_least_one:
+        s = s[:-1]  # remove last comma
+
+    return s + "}" + "\n"
+
+
 def write_bib(fname, biblist, order, indent="\t"):
-    def entry2str(e):
-        s = "@" + e["ENTRYTYPE"] + "{" + e["ID"] + ","
-        at_least_one = False
-        for k in order:
-            if (k not in ["ENTRYTYPE", "ID"]) and (k in e.keys()):
-                s += "\n" + indent + k.capitalize() + " = {" + e[k] + "},"
-                at_least_one = True
-        if at_least_one:
-            s = s[:-1]  # remove last comma
-
-        return s + "}" + "\n"
-
-    bibtex_str = "\n".join([entry2str(b) for b in biblist])
+    bibtex_str = "\n".join([entry2str(b, order, indent) for b in biblist])
     print(bibtex_str, file=open(fname, "w+"))
 
 
@@ -863,15 +877,11 @@ def format_title(title):
             prefix, core, suffix = strip_leading_trailing_non_letters(w)
             # Only check core if it has letters
             if core:
-                caps_match = [
-                    f
-                    for f in force_caps
-                    if f.lower() == remove_non_letters(core.lower())
-                ]
-                if len(caps_match) > 0:
+                caps_match = forced_caps(core, force_caps)
+                if caps_match is not None:
                     # Apply braces only to the core, then add back prefix and suffix
                     core_with_braces = insert_non_letters(
-                        "{" + caps_match[-1] + "}", remove_curlies(core, join=" ")
+                        "{" + caps_match + "}", remove_curlies(core, join=" ")
                     )
                     w = prefix + core_with_braces + suffix
                 elif not ends_in_punctuation(prev_w):
@@ -887,109 +897,263 @@ def format_title(title):
         )
     ) and (
         remove_non_letters(reformatted_title[0].lower())
-        not in [f.lower() for f in force_caps]
+        not in caps_index(tuple(force_caps))
     ):
         reformatted_title[0] = reformatted_title[0].capitalize()
 
     return " ".join([r for r in reformatted_title if len(r) > 0])
 
 
-def check_bib(bibfile, autofix=False, outfile=None, verbose=True):
-    bd = load_bibliography(bibfile)
+def check_entry(entry, keep_fields=None, venues=None):
+    # run the checks that only depend on a single entry (i.e., everything in
+    # check_bib except for the duplicate and key suffix checks).  returns
+    # (fixes, problems): fixes maps each field that needs correcting to its
+    # corrected value; problems lists issues that can't be autocorrected.
+    if "force" in entry.keys():
+        return {}, []
+    if keep_fields is None:
+        keep_fields = read("keep_fields.txt")
 
-    ids = get_vals(bd, "ID")
-    authors = get_vals(bd, "author")
-    years = get_vals(bd, "year")
-    titles = get_vals(bd, "title")
-    pages = get_vals(bd, "pages")
-    journals = get_vals(bd, "journal")
-    book_titles = get_vals(bd, "booktitle")
-    publishers = get_vals(bd, "publisher")
-    editors = get_vals(bd, "editor")
-    addresses = get_vals(bd, "address")
-
-    # check for duplicate keys
+    fixes = {}
+    problems = []
+
+    def check(field, target, same=lambda x, y: x == y):
+        if field in entry.keys():
+            t = target(entry[field])
+            if not same(entry[field], t):
+                fixes[field] = t
+
+    check("ID", lambda i: authors2key(entry.get("author", ""), entry.get("year", "")), same=same_id)
+
+    if "pages" in entry.keys():
+        target_pages = valid_pages(entry["pages"])[1][1]
+        if not valid_pages(target_pages)[0]:
+            problems.append(f'ambiguous or incorrect pages: "{entry["pages"]}"')
+        elif target_pages != entry["pages"]:
+            fixes["pages"] = target_pages
+
+    check("journal", lambda j: format_journal_name(j, venues=venues))
+    check("booktitle", format_journal_name)
+    check("title", format_title)
+    check("publisher", lambda p: format_journal_name(p, key=publisher_key))
+    check("author", reformat_author)
+    check("editor", reformat_author)
+    check(
+        "address",
+        lambda a: format_journal_name(a, key=address_key, force_caps=address_codes),
+    )
+
+    for k in extraneous_fields(entry, keep_fields):
+        problems.append(f"non-essential field: {k}")
+
+    return fixes, problems
+
+
+def extraneous_fields(entry, keep_fields=None):
+    # fields that polish_database would remove from the entry
+    if "force" in entry.keys():
+        return []
+    if keep_fields is None:
+        keep_fields = read("keep_fields.txt")
+    return [k for k in entry.keys() if k not in keep_fields]
+
+
+# the checks run by check_bib, in the order they run.  each rule declares the
+# fields it reads (only those are loaded into columns), the field it corrects
+# (if any) and a rough cost class: on cdl.bib, cheap rules take well under a
+# second, moderate ones about a second and expensive ones much longer
+RULES = {}
+COST_CLASSES = ["cheap", "moderate", "expensive"]
+
+
+class Rule:
+    def __init__(self, name, reads, corrects, cost, description, check):
+        assert cost in COST_CLASSES, f"unknown cost class: {cost}"
+        self.name = name
+        self.reads = reads  # None: all fields
+        self.corrects = corrects
+        self.cost = cost
+        self.description = description
+        self.check = check  # check(checks) --> list of (key, value, target)
+
+
+def rule(name, reads, description, corrects=None, cost="cheap"):
+    def register(check):
+        RULES[name] = Rule(name, reads, corrects, cost, description, check)
+        return check
+
+    return register
+
+
+def format_rule(name, field, target, description, cost="cheap"):
+    # a rule that compares each value of a field with target(value); target
+    # is computed once per distinct value
+    @rule(name, ["ID", field], description, corrects=field, cost=cost)
+    def check(c):
+        targets = list(c.cols.map_unique(field, target))
+        return check_entries(field, c.bd, targets, verbose=c.verbose)
+
+    return check
+
+
+class Checks:
+    # the bibliography (and anything computed from it that several rules
+    # need), as seen by the rules
+    def __init__(self, bd, cols, venues, verbose=True):
+        self.bd = bd
+        self.cols = cols
+        self.venues = venues
+        self.verbose = verbose
+        self.repeated_keys = []  # keys used by more than one entry in the file
+        self._key_bases = None
+
+    def vals(self, field):
+        return list(self.cols.vals(field))
+
+    def key_bases(self):
+        if self._key_bases is None:
+            self._key_bases = list(self.cols.key_bases(author_key))
+        return self._key_bases
+
+
+@rule("duplicates", ["ID", "author", "title"], "no duplicate keys or author/title combinations", cost="moderate")
+def check_duplicates(c):
+    ids = c.vals("ID")
     duplicate_keys, redundant_keys = find_duplicates(
-        ids, authors, titles, verbose=verbose
+        ids, c.vals("author"), c.vals("title"), verbose=c.verbose
     )
+    if len(c.repeated_keys) > 0:
+        printv("Keys used by more than one entry in the file:", verbose=c.verbose)
+        printv("\n".join(c.repeated_keys), verbose=c.verbose)
+    duplicate_keys = list(duplicate_keys) + [k for k in c.repeated_keys if k not in duplicate_keys]
     assert len(duplicate_keys) == 0, "duplicate keys found: " + ", ".join(
         duplicate_keys
     )
     assert len(redundant_keys) == 0, "redundant keys found: " + ", ".join(
         [str([ids[i] for i in d]) for d in redundant_keys]
     )
-    printv("\n", verbose=verbose)
+    printv("\n", verbose=c.verbose)
+    return []
+
+
+@rule("key", ["ID", "author", "year"], "key bases match the authors and year", corrects="ID", cost="moderate")
+def check_key_bases(c):
+    return check_entries("ID", c.bd, c.key_bases(), same=same_id, verbose=c.verbose)
 
-    # check for bibitem key bases
-    fix_dict = {}
-    fix_dict["ID"] = check_entries(
-        "ID",
-        bd,
-        [authors2key(a, y) for a, y in zip(authors, years)],
-        same=same_id,
-        verbose=verbose,
-    )
 
-    # check for bibitem key suffixes
-    target_keys = check_key_suffixes(bd)
-    fix_dict["ID"].extend(check_entries("ID", bd, target_keys, verbose=verbose))
+@rule("key-suffix", ["ID", "author", "year"], "keys with the same base have suffixes a, b, ...", corrects="ID", cost="moderate")
+def check_key_suffix_rule(c):
+    target_keys = check_key_suffixes(c.bd, c.key_bases())
+    return check_entries("ID", c.bd, target_keys, verbose=c.verbose)
 
-    # check page numbers: ambiguous pages
-    target_pages, unfixable = generate_correct_pages(bd)
+
+@rule("pages", ["ID", "pages"], "page numbers and ranges are valid and formatted", corrects="pages")
+def check_pages(c):
+    # ambiguous pages
+    target_pages, unfixable = generate_correct_pages(c.bd, c.cols)
     if len(unfixable) > 0:
         msg = f"The following page numbers are ambiguous or incorrect: \n"
         msg += "\n".join([f"{i}: {p}" for i, p in unfixable])
         raise Exception(msg)
     else:
-        printv("No ambiguous page numbers were found.", verbose=verbose)
-    printv("\n", verbose=verbose)
+        printv("No ambiguous page numbers were found.", verbose=c.verbose)
+    printv("\n", verbose=c.verbose)
 
-    # check page numbers: correctable formatting
-    fix_dict["pages"] = check_entries("pages", bd, target_pages, verbose=verbose)
+    # correctable formatting
+    return check_entries("pages", c.bd, target_pages, verbose=c.verbose)
 
-    # check journal names
-    fix_dict["journal"] = check_entries(
-        "journal", bd, [format_journal_name(j) for j in journals], verbose=verbose
-    )
 
-    # check book titles
-    fix_dict["booktitle"] = check_entries(
-        "booktitle", bd, [format_journal_name(b) for b in book_titles], verbose=verbose
-    )
+@rule("journal", ["ID", "journal"], "journal names are written out in full", corrects="journal", cost="expensive")
+def check_journals(c):
+    targets = list(c.cols.map_unique("journal", lambda j: format_journal_name(j, venues=c.venues)))
+    return check_entries("journal", c.bd, targets, verbose=c.verbose)
 
-    # check article titles
-    fix_dict["title"] = check_entries(
-        "title", bd, [format_title(t) for t in titles], verbose=verbose
-    )
 
-    # check publishers
-    fix_dict["publisher"] = check_entries(
-        "publisher",
-        bd,
-        [format_journal_name(p, key=publisher_key) for p in publishers],
-        verbose=verbose,
-    )
+format_rule("booktitle", "booktitle", format_journal_name, "book titles are written out in full", cost="moderate")
+format_rule("title", "title", format_title, "titles are in sentence case", cost="moderate")
+format_rule(
+    "publisher",
+    "publisher",
+    lambda p: format_journal_name(p, key=publisher_key),
+    "publisher names are written out in full",
+    cost="moderate",
+)
+format_rule("author", "author", reformat_author, "author names are formatted")
+format_rule("editor", "editor", reformat_author, "editor names are formatted")
+format_rule(
+    "address",
+    "address",
+    lambda a: format_journal_name(a, key=address_key, force_caps=address_codes),
+    "addresses are formatted and abbreviated",
+)
 
-    # check author names
-    fix_dict["author"] = check_entries(
-        "author", bd, [reformat_author(a) for a in authors], verbose=verbose
-    )
 
-    # check editor names
-    fix_dict["editor"] = check_entries(
-        "editor", bd, [reformat_author(e) for e in editors], verbose=verbose
-    )
+# applied by polish_database, after the other rules
+@rule("fields", None, "only the fields in keep_fields.txt are used")
+def check_fields(c):
+    return []
+
+
+def select_rules(only=None, skip=None):
+    # the rules to run, given lists of rule names to run (only) or not (skip)
+    unknown = [r for r in (only or []) + (skip or []) if r not in RULES]
+    if unknown:
+        raise ValueError(
+            f"unknown rule(s): {', '.join(unknown)} (available: {', '.join(RULES)})"
+        )
+    return [
+        r
+        for name, r in RULES.items()
+        if (only is None or name in only) and name not in (skip or [])
+    ]
 
-    # check addresses
-    fix_dict["address"] = check_entries(
-        "address",
-        bd,
-        [
-            format_journal_name(a, key=address_key, force_caps=address_codes)
-            for a in addresses
-        ],
-        verbose=verbose,
-    )
+
+def check_bib(
+    bibfile,
+    autofix=False,
+    outfile=None,
+    verbose=True,
+    only=None,
+    skip=None,
+    timings=None,
+    staged=False,
+    since=None,
+    venues=None,
+):
+    # only, skip: lists of the rules to run or skip (see RULES); timings: if
+    # given, a dictionary that is filled in with the time spent on each rule.
+    # staged, since: only check the entries changed according to git (see
+    # load_changed).  venues: a venue authority file learned by bibverify
+    # (e.g. cdl.venues.json), whose canonical journal names are suggested for
+    # names that aren't in journal_key.xls.  it isn't used unless given, so
+    # that the results don't depend on local bibverify runs
+    rules = select_rules(only, skip)
+    if timings is None:
+        timings = {}
+
+    start = time.perf_counter()
+    repeated = []
+    if staged or since is not None:
+        bd, _, repeated = load_changed(bibfile, staged=staged, since=since, verbose=verbose)
+    else:
+        bd = load_bibliography(bibfile)
+    timings["load"] = time.perf_counter() - start
+
+    # only load the fields the selected rules read
+    reads = set()
+    for r in rules:
+        reads = None if reads is None or r.reads is None else reads | set(r.reads)
+    venues = VenueAuthority(venues) if venues else None
+    c = Checks(bd, Columns(bd, reads), venues, verbose=verbose)
+    c.repeated_keys = repeated
+
+    fix_dict = {}
+    for r in rules:
+        start = time.perf_counter()
+        fixes = r.check(c)
+        if r.corrects is not None:
+            fix_dict.setdefault(r.corrects, []).extend(fixes)
+        timings[r.name] = time.perf_counter() - start
 
     # reorganize fix_dict by key
     fields = fix_dict.keys()
@@ -1001,9 +1165,19 @@ def check_bib(bibfile, autofix=False, outfile=None, verbose=True):
             errors[i[0]][k] = i[2]
 
     # remove extra fields, correct entries if autofix = True
+    start = time.perf_counter()
+    prune = "fields" in [r.name for r in rules]
     polished_bd, removed = polish_database(
-        bd, errors, autofix=autofix, verbose=verbose, return_removed=True
+        bd,
+        errors,
+        autofix=autofix,
+        verbose=verbose,
+        return_removed=True,
+        cols=c.cols,
+        prune=prune,
     )
+    if prune:
+        timings["fields"] += time.perf_counter() - start
     if not autofix:
         assert len(removed) == 0, (
             "the following entries have non-essential fields: " + ", ".join(removed)
@@ -1011,12 +1185,39 @@ def check_bib(bibfile, autofix=False, outfile=None, verbose=True):
 
     if outfile is not None:
         keep_fields = read("keep_fields.txt")
-        keep_fields.sort()
-        write_bib(outfile, polished_bd, keep_fields)
+        if os.path.exists(bibfile):
+            # rewrite only the corrected and removed fields, leaving the rest
+            # of the file (and so the diff) untouched
+            patches = {}
+            if autofix:
+                patches = autofix_patches(bd, errors, removed, keep_fields)
+            patcher.patch_bibliography(
+                bibfile, outfile, patches, aliases=bib_parser().alt_dict
+            )
+        else:
+            keep_fields.sort()
+            write_bib(outfile, polished_bd, keep_fields)
 
     return errors, polished_bd
 
 
+def autofix_patches(bd, errors, removed, keep_fields):
+    # the edits made by polish_database (with autofix=True), in the form
+    # expected by patcher.patch_bibliography: {key: {field: value or None}}
+    patches = {}
+    for k, fixes in errors.items():
+        if "force" not in bd[k].keys():
+            patches[k] = {f: v for f, v in fixes.items() if f in keep_fields}
+    for k, fields in removed.items():
+        patches.setdefault(k, {}).update({f: None for f in fields})
+    return patches
+
+
+def get_renames(errors):
+    # map old keys to new keys for every entry whose key was corrected
+    return {k: v["ID"] for k, v in errors.items() if "ID" in v and v["ID"] != k}
+
+
 def compare_bibs(a, b, verbose=True, return_summary=False, outfile=None):
     if type(a) == str:
         a = load_bibliography(a)
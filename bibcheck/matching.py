@@ -0,0 +1,101 @@
+"""
+Fuzzy string matching used by bibverify to compare entries with CrossRef records.
+
+Similarity is the normalized indel (longest common subsequence) ratio,
+2 * LCS(a, b) / (len(a) + len(b)), computed with a bit-parallel LCS algorithm
+so that each comparison costs O(len(b)) big-integer operations.  Every
+comparison accepts a cutoff; when the lengths alone rule out reaching it, the
+comparison returns 0.0 without doing any work.
+"""
+
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+import re
+
+
+BRACED = re.compile(r"\{[^}]*\}")
+COMMANDS_AND_PUNCTUATION = re.compile(r"\\[a-zA-Z]+|[^a-zA-Z0-9\s]")
+
+
+@lru_cache(maxsize=65536)
+def normalize(s):
+    """Remove LaTeX braces and commands, punctuation and extra whitespace; lowercase."""
+    if not s:
+        return ""
+    s = BRACED.sub("", s)
+    s = COMMANDS_AND_PUNCTUATION.sub("", s)
+    return " ".join(s.split()).lower()
+
+
+@lru_cache(maxsize=65536)
+def _match_masks(s):
+    masks = {}
+    for i, c in enumerate(s):
+        masks[c] = masks.get(c, 0) | (1 << i)
+    return masks
+
+
+def lcs_length(a, b):
+    """Length of the longest common subsequence of a and b (Hyyro's bit-vector algorithm)."""
+    if len(a) > len(b):
+        a, b = b, a
+    if not a:
+        return 0
+
+    masks = _match_masks(a)
+    full = (1 << len(a)) - 1
+    v = full
+    for c in b:
+        u = v & masks.get(c, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(a) - bin(v).count("1")
+
+
+def ratio(a, b, cutoff=0.0):
+    """
+    Similarity (0-1) of two already-normalized strings.
+
+    Returns 0.0 if the similarity is guaranteed to be below cutoff.
+    """
+    if a == b:
+        return 1.0
+    total = len(a) + len(b)
+    if 2 * min(len(a), len(b)) < cutoff * total:
+        return 0.0
+    score = 2 * lcs_length(a, b) / total
+    return score if score >= cutoff else 0.0
+
+
+def similarity(s1, s2, cutoff=0.0):
+    """Normalize two raw strings and compute their similarity."""
+    if not s1 or not s2:
+        return 0.0
+    return ratio(normalize(s1), normalize(s2), cutoff=cutoff)
+
+
+def count_name_matches(names1, names2, threshold=0.85):
+    """
+    Count the names in names1 that are more than threshold-similar to some
+    name in names2.
+
+    Exact matches are found with a set lookup; only the remaining names are
+    compared fuzzily, and only against names whose lengths could possibly
+    exceed the threshold.
+    """
+    names1 = [normalize(n) for n in names1]
+    names2 = sorted((normalize(n) for n in names2), key=len)
+    exact = set(names2)
+    lengths = [len(n) for n in names2]
+
+    matches = 0
+    for n in names1:
+        if n in exact:
+            matches += 1
+            continue
+
+        # ratio > t requires t * (len(n) + len(m)) < 2 * min(len(n), len(m))
+        lo = bisect_left(lengths, threshold * len(n) / (2 - threshold))
+        hi = bisect_right(lengths, (2 - threshold) * len(n) / threshold)
+        if any(ratio(n, m, cutoff=threshold) > threshold for m in names2[lo:hi]):
+            matches += 1
+    return matches
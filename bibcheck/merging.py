@@ -0,0 +1,334 @@
+"""
+Adding entries to cdl.bib: merging other .bib files (e.g. personal
+bibliographies) into it, or adding a few new entries.
+
+A fingerprint index of the target file (the normalized title, author
+surnames and year of each entry, read with the scanner rather than
+bibtexparser) is built once, along with an index of its key bases.
+Incoming entries are then streamed through it one at a time: duplicates (of
+the target, or of earlier incoming entries) are dropped before they are
+parsed, and new entries are corrected with the single-entry checks
+(check_entry), stripped of non-essential fields, given keys that continue
+the target's key suffix sequences, and written in the target's format (one
+capitalized field per line, in alphabetical order; see helpers.entry2str).  When a new entry shares the key
+base of an existing entry without a suffix, the existing entry is renamed
+(e.g. Mann21 --> Mann21a), and the rename is applied to the key-indexed
+sidecars.
+
+Adding a few entries (add_entries) doesn't need the fingerprint index: an
+entry with the same title, authors and year would also have the same key
+base, so only the entries that share its key base are compared with it.
+Keys are assigned from a key base index that is saved next to the .bib file
+and kept up to date as entries are added, so nothing else in the file is
+read or checked.
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+import json
+import os
+import re
+
+import patcher
+import scanner
+from helpers import (
+    bib_parser,
+    check_entry,
+    entry2str,
+    extraneous_fields,
+    get_key_suffixes,
+    key_base,
+    last_name,
+    printv,
+    read,
+    reformat_author,
+    remove_curlies,
+    to_ascii,
+)
+from offsets import EntryIndex
+from stores import atomic_write, carry_sidecars, sidecar_path
+
+
+# added: {new key: incoming key}; duplicates: {incoming key: key of the
+# matching entry}; renames: {existing key: new key}; problems: {new key:
+# [problems check_entry couldn't correct]}; failed: {incoming key: error}
+MergeResult = namedtuple("MergeResult", ["added", "duplicates", "renames", "problems", "failed"])
+
+FINGERPRINT_FIELDS = {"title", "author", "year"}
+NON_ALNUM = re.compile(r"[^a-z0-9]")
+
+
+def normalize(s):
+    # lowercase ascii letters and digits only, so that case, accents, braces
+    # and punctuation don't matter
+    return NON_ALNUM.sub("", to_ascii(s).lower())
+
+
+@lru_cache(maxsize=None)
+def surname(author):
+    return normalize(last_name(reformat_author(remove_curlies(to_ascii(author)))))
+
+
+def fingerprint(title, author, year):
+    """
+    A fingerprint of an entry's title, author surnames and year, or None if
+    it has no title.
+    """
+    title = normalize(title)
+    if not title:
+        return None
+    try:
+        surnames = " ".join(surname(a.strip()) for a in " ".join(author.split()).split(" and "))
+    except Exception:
+        surnames = normalize(author)
+    return title, surnames, normalize(year)
+
+
+def raw_values(raw, names):
+    # the (first) values of the given fields of a raw entry, with whitespace
+    # collapsed
+    _, found, _ = scanner.fields(raw)
+    values = {}
+    for f in found:
+        if f.name in names and f.name not in values:
+            values[f.name] = " ".join(raw[f.content_start : f.content_end].decode("utf-8").split())
+    return values
+
+
+def raw_fingerprint(raw):
+    v = raw_values(raw, FINGERPRINT_FIELDS)
+    return fingerprint(v.get("title", ""), v.get("author", ""), v.get("year", ""))
+
+
+def target_index(index):
+    """Fingerprint (--> key) and key base (--> keys) indices of the entries in an EntryIndex."""
+    fingerprints = {}
+    bases = {}
+    for key in index.keys():
+        fp = raw_fingerprint(index.raw(key))
+        if fp is not None:
+            fingerprints.setdefault(fp, key)
+        bases.setdefault(key_base(key), []).append(key)
+    return fingerprints, bases
+
+
+def assign_keys(base, existing, n):
+    """
+    Keys for n new entries with the given key base, and renames ({old: new})
+    for the existing keys with that base, so that together they have the
+    suffixes a, b, c, ... (or no suffix, if there's only one).
+    """
+    total = len(existing) + n
+    targets = [base] if total == 1 else [base + s for s in get_key_suffixes(total)]
+    free = [t for t in targets if t not in existing]
+    renames = {}
+    for k in existing:
+        if k not in targets:
+            renames[k] = free.pop(0)
+    return free, renames
+
+
+def format_entry(entry, keep_fields):
+    """
+    The fixes (see patcher.patch_entry) that format a parsed entry and remove
+    its non-essential fields, and the problems that can't be fixed.
+    """
+    fixes, problems = check_entry(entry, keep_fields)
+    fixes.update({f: None for f in extraneous_fields(entry, keep_fields)})
+    return fixes, [p for p in problems if not p.startswith("non-essential field")]
+
+
+def formatted_entry(entry, fixes, key, keep_fields):
+    """A parsed entry with fixes applied and the given key, written as in cdl.bib (bytes)."""
+    entry = {**entry, **fixes, "ID": key}
+    entry = {f: " ".join(v.split()) for f, v in entry.items() if v is not None}
+    return entry2str(entry, sorted(keep_fields)).encode("utf-8")
+
+
+def merge_bib(bibfile, other, outfile=None, verbose=True):
+    """
+    Merge the entries of other into bibfile, saving the result to outfile
+    (bibfile by default).  New entries are appended; the rest of bibfile is
+    copied unchanged, apart from renamed keys.  Returns a MergeResult.
+    """
+    outfile = outfile or bibfile
+    index = EntryIndex(bibfile)
+    printv(f"indexing {bibfile}...", verbose=verbose, end="")
+    fingerprints, bases = target_index(index)
+    printv(f"done ({len(index)} entries)", verbose=verbose)
+
+    parser = bib_parser()
+    keep_fields = read("keep_fields.txt")
+    duplicates, problems, failed = {}, {}, {}
+    seen = {}  # fingerprint --> number of the incoming entry kept so far
+    new = {}  # key base --> [(number, incoming key, entry, fixes, problems)]
+    n = -1
+
+    printv(f"reading {other}...", verbose=verbose, end="")
+    with open(other, "rb") as f:
+        for e, raw in scanner.stream(f):
+            if e.key is None:
+                # a single parser is reused so that @string definitions
+                # apply to the entries that follow them
+                parser.parse(raw.decode("utf-8")).entries.clear()
+                continue
+
+            # duplicates are found before parsing (which takes longer than
+            # anything else here)
+            try:
+                fp = raw_fingerprint(raw)
+            except ValueError as ex:
+                failed[e.key] = str(ex)
+                continue
+            if fp is not None and fp in fingerprints:
+                duplicates[e.key] = fingerprints[fp]
+                continue
+            if fp is not None and fp in seen:
+                duplicates[e.key] = seen[fp]  # resolved to its new key below
+                continue
+
+            entries = parser.parse(raw.decode("utf-8")).entries
+            if len(entries) == 0:  # e.g. a nonstandard entry type
+                continue
+            entry = dict(entries[0])
+            entries.clear()
+            try:
+                fixes, entry_problems = format_entry(entry, keep_fields)
+            except Exception as ex:
+                failed[e.key] = str(ex)
+                continue
+
+            n += 1
+            if fp is not None:
+                seen[fp] = n
+            base = key_base(fixes.get("ID") or e.key)
+            new.setdefault(base, []).append((n, e.key, entry, fixes, entry_problems))
+    printv(f"done ({n + 1} new entries)", verbose=verbose)
+
+    added, renames, entries = {}, {}, []
+    new_keys = {}  # number --> new key
+    for base, incoming in new.items():
+        keys, group_renames = assign_keys(base, bases.get(base, []), len(incoming))
+        renames.update(group_renames)
+        for key, (n, incoming_key, entry, fixes, entry_problems) in zip(keys, incoming):
+            added[key] = incoming_key
+            new_keys[n] = key
+            if entry_problems:
+                problems[key] = entry_problems
+            entries.append(formatted_entry(entry, fixes, key, keep_fields))
+    duplicates = {
+        k: new_keys[v] if isinstance(v, int) else renames.get(v, v) for k, v in duplicates.items()
+    }
+
+    patcher.patch_bibliography(
+        bibfile, outfile, {old: {"ID": k} for old, k in renames.items()}, aliases=parser.alt_dict
+    )
+    with open(outfile, "ab") as f:
+        for raw in entries:
+            f.write(b"\n" + raw)
+    carry_sidecars(bibfile, outfile, renames)
+    index.close()
+    return MergeResult(added, duplicates, renames, problems, failed)
+
+
+class KeyBaseIndex:
+    """
+    Key base --> suffixes of the keys in a .bib file ("" for a key without
+    a suffix), saved next to it (cdl.bib --> cdl.keybases.json).  It is only
+    rebuilt (from the keys in the entry index) if the file was changed by
+    something else since it was saved.
+    """
+
+    def __init__(self, index, fname=None):
+        self.index = index
+        self.fname = fname or sidecar_path(index.bibfile, "keybases")
+        self.bases = {}
+        self.digest = None  # EntryIndex.digest of the indexed file
+
+        if os.path.exists(self.fname):
+            with open(self.fname, "r") as f:
+                saved = json.load(f)
+            self.bases = saved["bases"]
+            self.digest = saved["digest"]
+        if self.digest != index.digest:
+            self.rebuild()
+
+    def rebuild(self):
+        self.bases = {}
+        for k in self.index.keys():
+            self.add(k)
+        self.save()
+
+    def keys(self, base):
+        return [base + s for s in self.bases.get(base, [])]
+
+    def add(self, key):
+        base = key_base(key)
+        self.bases.setdefault(base, []).append(key[len(base) :])
+
+    def remove(self, key):
+        base = key_base(key)
+        self.bases[base].remove(key[len(base) :])
+        if not self.bases[base]:
+            del self.bases[base]
+
+    def save(self):
+        self.digest = self.index.digest
+        with atomic_write(self.fname) as f:
+            json.dump({"digest": self.digest, "bases": self.bases}, f)
+
+
+def add_entries(bibfile, text, verbose=True):
+    """
+    Format the entries in text (bytes) and append them to bibfile, with keys
+    that continue the suffix sequences of their key bases (renaming an
+    existing entry without a suffix if necessary).  Entries with the same
+    title, authors and year as an existing entry are skipped.  Returns a
+    MergeResult.
+    """
+    index = EntryIndex(bibfile)
+    bases = KeyBaseIndex(index)
+    parser = bib_parser()
+    keep_fields = read("keep_fields.txt")
+    added, duplicates, renames, problems, failed = {}, {}, {}, {}, {}
+
+    for e in scanner.scan(text):
+        raw = text[e.start : e.end]
+        entries = parser.parse(raw.decode("utf-8")).entries
+        if e.key is None or len(entries) == 0:
+            entries.clear()
+            continue
+        entry = dict(entries[0])
+        entries.clear()
+        try:
+            fixes, entry_problems = format_entry(entry, keep_fields)
+            fp = raw_fingerprint(raw)
+        except Exception as ex:
+            failed[e.key] = str(ex)
+            continue
+
+        base = key_base(fixes.get("ID") or e.key)
+        existing = bases.keys(base)
+        same = [k for k in existing if fp is not None and raw_fingerprint(index.raw(k)) == fp]
+        if same:
+            duplicates[e.key] = same[0]
+            continue
+
+        keys, group_renames = assign_keys(base, existing, 1)
+        for old, new in group_renames.items():
+            printv(f"renaming {old} to {new}", verbose=verbose)
+            index.replace(old, patcher.patch_entry(index.raw(old), {"ID": new}, aliases=parser.alt_dict))
+            bases.remove(old)
+            bases.add(new)
+        renames.update(group_renames)
+
+        index.append(formatted_entry(entry, fixes, keys[0], keep_fields))
+        bases.add(keys[0])
+        added[keys[0]] = e.key
+        if entry_problems:
+            problems[keys[0]] = entry_problems
+
+    bases.save()
+    carry_sidecars(bibfile, bibfile, renames)
+    index.close()
+    return MergeResult(added, duplicates, renames, problems, failed)
@@ -0,0 +1,187 @@
+"""
+Run metrics for bibverify: counters, gauges and latency histograms.
+
+Metrics are exported as a Prometheus text file (for node_exporter's textfile
+collector, or just for grepping) and as a JSON summary.  Both can also be
+rewritten periodically while a run is in progress.
+"""
+
+from contextlib import contextmanager
+import bisect
+import json
+import math
+import threading
+import time
+
+from stores import atomic_write
+
+
+# upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile (by linear interpolation within its bucket)."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) - 1 else lower
+                return lower + (upper - lower) * (rank - seen) / c
+            seen += c
+        return self.buckets[-2]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Metrics:
+    """
+    A thread-safe collection of named counters, gauges and histograms.
+
+    descriptions maps metric names to help strings for the Prometheus output.
+    """
+
+    def __init__(self, prefix="bibverify", descriptions=None):
+        self.prefix = prefix
+        self.descriptions = descriptions or {}
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+        self.stopping = None
+
+    def inc(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_counter(self, name, value):
+        with self.lock:
+            self.counters[name] = value
+
+    def set(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def add(self, name, n):
+        with self.lock:
+            self.gauges[name] = self.gauges.get(name, 0) + n
+            peak = f"{name}_max"
+            self.gauges[peak] = max(self.gauges.get(peak, 0), self.gauges[name])
+
+    def observe(self, name, value):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    @contextmanager
+    def in_flight(self, name):
+        """Track the number of concurrent executions of a block (and its peak, as name_max)."""
+        self.add(name, 1)
+        try:
+            yield
+        finally:
+            self.add(name, -1)
+
+    def rate(self, name):
+        """Average rate (per second) of a counter since the metrics were created."""
+        elapsed = time.time() - self.started
+        return self.counters.get(name, 0) / elapsed if elapsed > 0 else 0.0
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "elapsed": round(time.time() - self.started, 3),
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {k: h.summary() for k, h in self.histograms.items()},
+            }
+
+    def prometheus(self):
+        """Render the metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def header(name, kind):
+            full = f"{self.prefix}_{name}"
+            if name in self.descriptions:
+                lines.append(f"# HELP {full} {self.descriptions[name]}")
+            lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"{header(name, 'counter')} {value}")
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"{header(name, 'gauge')} {value}")
+            for name, h in sorted(self.histograms.items()):
+                full = header(name, "histogram")
+                cumulative = 0
+                for bound, c in zip(h.buckets, h.counts):
+                    cumulative += c
+                    le = "+Inf" if bound == math.inf else f"{bound:g}"
+                    lines.append(f'{full}_bucket{{le="{le}"}} {cumulative}')
+                lines.append(f"{full}_sum {h.sum}")
+                lines.append(f"{full}_count {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, prom_file=None, json_file=None, extra=None):
+        """
+        Write the Prometheus text file and/or JSON summary (with any extra
+        fields merged in).  Files are replaced atomically, so a reader never
+        sees a partial snapshot.
+        """
+        outputs = []
+        if prom_file:
+            outputs.append((prom_file, self.prometheus()))
+        if json_file:
+            outputs.append((json_file, json.dumps(dict(self.snapshot(), **(extra or {})), indent=1) + "\n"))
+        for fname, text in outputs:
+            with atomic_write(fname) as f:
+                f.write(text)
+
+    def start_snapshots(self, interval, write):
+        """Call write() every interval seconds (in a background thread) until stop_snapshots is called."""
+        self.stopping = threading.Event()
+
+        def run(stopping):
+            while not stopping.wait(interval):
+                write()
+
+        threading.Thread(target=run, args=(self.stopping,), daemon=True).start()
+
+    def stop_snapshots(self):
+        if self.stopping is not None:
+            self.stopping.set()
+            self.stopping = None
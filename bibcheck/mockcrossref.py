@@ -0,0 +1,218 @@
+"""
+A local mock of the CrossRef REST API, for benchmarking and testing bibverify
+without hitting api.crossref.org.
+
+It serves `/works?query=...` searches and `/works/{doi}` lookups from a corpus
+of CrossRef-style work records: either synthesized from a .bib file (one
+slightly perturbed record per entry, as in bench.py) or recorded with
+`python bibcheck/bench.py record`.  Response latency, error and 429 rates, and
+a rate limit can be configured.
+
+Run from the repository's root directory, e.g.:
+    python bibcheck/mockcrossref.py --port 8787 --latency 0.2 --throttle-rate 0.01
+    python bibverify.py verify cdl.bib --api-url http://127.0.0.1:8787
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+import json
+import math
+import random
+import threading
+import time
+
+import typer
+
+import matching
+
+
+def synthesize_corpus(entries, seed=0):
+    """One (perturbed) CrossRef record per entry, with DOI 10.5555/<lowercase key>."""
+    from bench import crossref_item, perturb
+
+    rng = random.Random(seed)
+    return [perturb(crossref_item(e), rng) for e in entries]
+
+
+def recorded_corpus(fname):
+    """The distinct records in a file of responses saved by `bench.py record`."""
+    from bench import load_responses
+
+    items = {}
+    for r in load_responses(fname):
+        for item in r["items"]:
+            items.setdefault(item.get("DOI"), item)
+    return list(items.values())
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # the default (5) drops connections under load
+
+
+class MockCrossRef:
+    """
+    Serves a corpus of work records over HTTP in the shape of the CrossRef API.
+
+    latency is the median response time in seconds, and jitter the standard
+    deviation of its logarithm (latencies are lognormal).  error_rate and
+    throttle_rate are the fractions of requests answered with a 500 or a 429
+    (with a Retry-After of retry_after seconds).  If rate_limit is given,
+    requests beyond that many per second are also answered with a 429.
+    """
+
+    def __init__(self, items, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 rate_limit=None, retry_after=1, seed=0):
+        self.items = items
+        self.by_doi = {item["DOI"].lower(): item for item in items if item.get("DOI")}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tokens = rate_limit or 0
+        self.refilled = time.monotonic()
+        self.server = None
+
+        # inverted index of title words, for searches
+        self.index = defaultdict(list)
+        for i, item in enumerate(items):
+            for word in set(matching.normalize((item.get("title") or [""])[0]).split()):
+                self.index[word].append(i)
+
+    def search(self, query, rows=20):
+        """Records sharing the most title words with the query."""
+        hits = Counter()
+        for word in set(matching.normalize(query).split()):
+            hits.update(self.index.get(word, ()))
+        return [self.items[i] for i, _ in hits.most_common(rows)]
+
+    def work(self, doi):
+        return self.by_doi.get(doi.lower())
+
+    def delay(self):
+        if self.latency <= 0:
+            return 0.0
+        with self.lock:
+            return self.latency * math.exp(self.rng.gauss(0, self.jitter))
+
+    def admit(self):
+        """Decide how to answer the next request: None (normally), 429 or 500."""
+        with self.lock:
+            r = self.rng.random()
+            if self.rate_limit:
+                now = time.monotonic()
+                self.tokens = min(self.rate_limit, self.tokens + (now - self.refilled) * self.rate_limit)
+                self.refilled = now
+                if self.tokens < 1:
+                    return 429
+                self.tokens -= 1
+        if r < self.error_rate:
+            return 500
+        if r < self.error_rate + self.throttle_rate:
+            return 429
+        return None
+
+    def handle(self, path, query):
+        """Return (status, headers, body) for a GET request."""
+        time.sleep(self.delay())
+        headers = {
+            "X-Rate-Limit-Limit": str(self.rate_limit or 50),
+            "X-Rate-Limit-Interval": "1s",
+        }
+        status = self.admit()
+        if status == 429:
+            return 429, dict(headers, **{"Retry-After": str(self.retry_after)}), {"status": "error", "message": "rate limited"}
+        if status == 500:
+            return 500, headers, {"status": "error", "message": "internal server error"}
+
+        if path == "/works":
+            items = self.search(query.get("query", [""])[0], int(query.get("rows", ["20"])[0]))
+            select = query.get("select", [""])[0]
+            if select:
+                fields = select.split(",")
+                items = [{k: v for k, v in item.items() if k in fields} for item in items]
+            return 200, headers, {"status": "ok", "message": {"items": items, "total-results": len(items)}}
+
+        if path.startswith("/works/"):
+            item = self.work(unquote(path[len("/works/"):]))
+            if item is None:
+                return 404, headers, {"status": "error", "message": "Resource not found."}
+            return 200, headers, {"status": "ok", "message": item}
+
+        return 404, headers, {"status": "error", "message": "Resource not found."}
+
+    def start(self, host="127.0.0.1", port=0):
+        """Serve in a background thread; returns the base URL (port 0 picks a free port)."""
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, headers, body = mock.handle(url.path, parse_qs(url.query))
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = Server((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def main(
+    bibfile: str = typer.Option("cdl.bib", "--bib", help="Synthesize the corpus from this .bib file"),
+    responses: str = typer.Option(None, "--responses", help="Serve responses recorded by `bench.py record` instead"),
+    host: str = typer.Option("127.0.0.1", "--host"),
+    port: int = typer.Option(8787, "--port"),
+    latency: float = typer.Option(0.0, "--latency", help="Median response time (seconds)"),
+    jitter: float = typer.Option(0.5, "--jitter", help="Standard deviation of log latency"),
+    error_rate: float = typer.Option(0.0, "--error-rate", help="Fraction of requests answered with a 500"),
+    throttle_rate: float = typer.Option(0.0, "--throttle-rate", help="Fraction of requests answered with a 429"),
+    rate_limit: float = typer.Option(None, "--rate-limit", help="Requests per second allowed before answering with 429s"),
+    retry_after: int = typer.Option(1, "--retry-after", help="Retry-After of 429 responses (seconds)"),
+    seed: int = typer.Option(0, "--seed"),
+):
+    """Run a mock CrossRef API server."""
+    if responses:
+        items = recorded_corpus(responses)
+    else:
+        from helpers import load_bibliography
+
+        items = synthesize_corpus(load_bibliography(bibfile, verbose=False).values(), seed=seed)
+
+    mock = MockCrossRef(items, latency=latency, jitter=jitter, error_rate=error_rate,
+                        throttle_rate=throttle_rate, rate_limit=rate_limit, retry_after=retry_after, seed=seed)
+    url = mock.start(host, port)
+    typer.echo(f"serving {len(items)} records at {url} (ctrl-c to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    typer.run(main)
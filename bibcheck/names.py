@@ -0,0 +1,207 @@
+"""
+Structured parsing of BibTeX author (and editor) lists.
+
+Each name in an author list is tokenized once into its BibTeX parts: first
+(given names and initials), von (particles such as "van der"), last and jr
+(suffixes such as "Jr." or "III"), with braces preserved: a braced group
+such as "{Geo Team}" is a single word.  Parsed names are cached, so citation
+keys, author/editor formatting, duplicate detection and bibverify's
+comparison with CrossRef all share one parse of each distinct name instead
+of re-splitting the string for every purpose.
+"""
+
+from functools import lru_cache
+from typing import NamedTuple, Tuple
+import os
+import re
+
+# characters ignored when comparing name parts (as helpers.remove_non_letters)
+NON_LETTERS = str.maketrans("", "", ",.!?'\"{}-\\:()[]+/*")
+
+# a latex command followed by its argument, within a braced word ("{\v C}adik")
+SPACED_COMMAND = re.compile(r"\\[A-Za-z]+\s+")
+
+
+def plain(s):
+    return s.translate(NON_LETTERS)
+
+
+def split_outside_braces(s, sep):
+    """
+    Split s on the character sep, except within braces, so that braced groups
+    such as corporate names ("{Geo Team}") stay in one piece.  If the braces
+    aren't balanced (e.g. in part of a braced name that contains " and "),
+    s is split everywhere.
+    """
+    if "{" not in s:
+        return s.split(sep)
+    parts = []
+    depth = start = 0
+    for i, c in enumerate(s):
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            depth = max(depth - 1, 0)
+        elif c == sep and depth == 0:
+            parts.append(s[start:i])
+            start = i + 1
+    if depth != 0 or s.count("{") != s.count("}"):
+        return s.split(sep)
+    parts.append(s[start:])
+    return parts
+
+
+class Name(NamedTuple):
+    raw: str
+    first: Tuple[str, ...]  # in order, including any suffix words within the name
+    von: Tuple[str, ...]
+    last: Tuple[str, ...]
+    jr: Tuple[str, ...]  # suffixes given as separate comma parts ("Smith, John, Jr.")
+    surname_part: str = None  # the surname, if the name was given as "Last, First"
+
+    def words(self):
+        return self.first + self.von + self.last
+
+
+class NameParser:
+    """
+    Parses names using the given lists of (lowercase) surname prefixes and
+    name suffixes; see prefixes.txt and suffixes.txt.
+    """
+
+    def __init__(self, prefixes, suffixes):
+        self.prefixes = frozenset(prefixes)
+        self.suffixes = frozenset(suffixes)
+        self.names = {}
+        self.reformatted = {}
+
+    def is_suffix(self, word):
+        return plain(word).lower() in self.suffixes
+
+    def is_prefix(self, word):
+        word = plain(word)
+        return word.lower() in self.prefixes and word != word.upper()
+
+    def parse(self, name):
+        """Parse a single name (cached).  Returns None if it has no or too many non-suffix comma parts."""
+        if name not in self.names:
+            self.names[name] = self._parse(name)
+        return self.names[name]
+
+    def _parse(self, name):
+        parts = [p.strip() for p in split_outside_braces(name, ",")]
+        jr = tuple(p for p in parts if self.is_suffix(p))
+        parts = [p for p in parts if not self.is_suffix(p)]
+        if len(parts) == 2:  # last, first (+ middle)
+            words = split_outside_braces(parts[1], " ") + split_outside_braces(parts[0], " ")
+            surname_part = parts[0]
+        elif len(parts) == 1:  # first (+ middle) + last
+            words = split_outside_braces(parts[0], " ")
+            surname_part = None
+        else:
+            return None
+
+        # the surname is the last word (ignoring suffixes), preceded by any
+        # prefixes; a trailing run of prefixes ("... de la") also counts
+        names = [i for i, w in enumerate(words) if not self.is_suffix(w)]
+        last = von = len(words)
+        found_prefix = False
+        for i in reversed(names):
+            if self.is_prefix(words[i]):
+                found_prefix = True
+            elif found_prefix or last < len(words):
+                break
+            if last == len(words):
+                last = i
+            von = i
+        if last == len(words):
+            return Name(name, tuple(words), (), (), jr, surname_part)
+        return Name(name, tuple(words[:von]), tuple(words[von:last]), tuple(words[last:]), jr, surname_part)
+
+    def parse_list(self, authors):
+        """Parse an " and "-separated list of names."""
+        return [self.parse(a) for a in authors.split(" and ")]
+
+    def last_name(self, name):
+        """
+        The surname of a name, without spaces or non-letters, e.g.
+        "vanBeethoven" (as used in citation keys and duplicate detection).
+        """
+        parsed = self.parse(name)
+        if parsed is None:
+            raise Exception(f"no or too many non-suffix names: {name}")
+        # (a braced word may contain spaces)
+        surname = [
+            plain(SPACED_COMMAND.sub("", w)).replace(" ", "") for w in parsed.von + parsed.last if not self.is_suffix(w)
+        ]
+        if not surname:
+            raise Exception(f"no surname: {name}")
+        return "".join(surname)
+
+    def last_names(self, authors):
+        return [self.last_name(a) for a in authors.split(" and ")]
+
+    def surnames(self, authors):
+        """
+        The surnames (von and last parts, e.g. "van Beethoven") of an author
+        list, for comparison with the family names of other sources.
+        """
+        surnames = []
+        for a in authors.split(" and "):
+            parsed = self.parse(a.strip())
+            if parsed is not None and parsed.last:
+                surname = " ".join(w for w in parsed.von + parsed.last if not self.is_suffix(w))
+                if surname.startswith("{") and surname.endswith("}"):
+                    surname = surname[1:-1].strip()
+                surnames.append(surname)
+            elif a.split():
+                surnames.append(a.split()[-1])
+        return surnames
+
+    def reformat(self, authors):
+        """
+        Format an author list as "First Middle Last" names separated by
+        " and ", with clumped initials separated ("AA" or "A.A." --> "A A").
+        """
+        if authors not in self.reformatted:
+            self.reformatted[authors] = " and ".join(self._reformat(a) for a in authors.split(" and "))
+        return self.reformatted[authors]
+
+    def _reformat(self, name):
+        parsed = self.parse(name)
+        if parsed is None:
+            words = name.split(" ")
+        elif parsed.surname_part is not None:
+            # multi-word surnames are braced so they stay together
+            surname = parsed.surname_part
+            if len(surname.split(" ")) > 1 and not (len(surname) >= 2 and surname[0] == "{" and surname[-1] == "}"):
+                surname = "{" + surname + "}"
+            words = list(parsed.words()[: -len(split_outside_braces(parsed.surname_part, " "))]) + [surname]
+        else:
+            words = list(parsed.words())
+
+        unclumped = []
+        for n in words:
+            if len(n) >= 2 and n[0] == "{" and n[-1] == "}":  # braced words are kept as they are
+                unclumped.append(n)
+                continue
+            n = n.replace(".", "")
+            if not self.is_suffix(n.lower()) and n == n.upper():
+                if n.find("-") >= 0:
+                    n = "-".join([self.reformat(c) for c in n.split("-")])
+                else:
+                    unclumped.extend(n)
+                    continue
+            unclumped.append(n)
+        return " ".join(unclumped)
+
+
+def read_words(fname):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), fname)) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+@lru_cache(maxsize=None)
+def default_parser():
+    """A parser using bibcheck's prefixes.txt and suffixes.txt (for use without helpers)."""
+    return NameParser(read_words("prefixes.txt"), read_words("suffixes.txt"))
@@ -0,0 +1,143 @@
+"""
+Byte-offset index of the entries in a .bib file, for random access by key.
+
+The index (key --> offset, length and hash of the raw entry) is built with the
+scanner, without parsing any fields, and is saved next to the .bib file
+(cdl.bib --> cdl.offsets.json).  It is refreshed when the file's size or
+modification time changes; if entries were only appended, only the new part
+of the file is scanned.  The .bib file itself is read through mmap, so
+looking up an entry only touches the pages it occupies.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+
+import scanner
+from stores import atomic_write, sidecar_path
+
+
+def raw_hash(raw):
+    return hashlib.sha1(raw).hexdigest()
+
+
+class EntryIndex:
+    def __init__(self, bibfile, fname=None):
+        self.bibfile = bibfile
+        self.fname = fname or sidecar_path(bibfile, "offsets")
+        self.entries = {}  # key --> [offset, length, hash]
+        self.stat = None  # [size, mtime_ns] of the indexed file
+        self.digest = None  # hash of the indexed file's contents
+        self.file = None
+        self.buf = None
+
+        if os.path.exists(self.fname):
+            with open(self.fname, "r") as f:
+                saved = json.load(f)
+            self.entries = saved["entries"]
+            self.stat = saved["stat"]
+            self.digest = saved["digest"]
+        self.refresh()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def keys(self):
+        return self.entries.keys()
+
+    def open(self):
+        self.close()
+        self.file = open(self.bibfile, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def close(self):
+        if self.buf is not None and not isinstance(self.buf, bytes):
+            self.buf.close()
+        if self.file is not None:
+            self.file.close()
+        self.file = self.buf = None
+
+    def file_stat(self):
+        st = os.stat(self.bibfile)
+        return [st.st_size, st.st_mtime_ns]
+
+    def scan(self, start=0):
+        for e in scanner.scan(self.buf, start):
+            if e.key is not None:
+                self.entries[e.key] = [e.start, e.end - e.start, raw_hash(self.buf[e.start : e.end])]
+
+    def refresh(self):
+        """
+        Bring the index up to date with the file.  Returns False if it already
+        was, and True if (part of) the file had to be scanned.
+        """
+        stat = self.file_stat()
+        if self.buf is None:
+            self.open()
+        if stat == self.stat:
+            return False
+        self.open()
+
+        # if the file was only appended to, only scan what follows the last
+        # indexed entry
+        last = max(self.entries.values(), default=None)
+        if self.stat is not None and last and stat[0] > self.stat[0] \
+                and raw_hash(self.buf[: self.stat[0]]) == self.digest:
+            self.scan(last[0] + last[1])
+        else:
+            self.entries = {}
+            self.scan()
+
+        self.stat = stat
+        self.digest = raw_hash(self.buf)
+        self.save()
+        return True
+
+    def save(self):
+        with atomic_write(self.fname) as f:
+            json.dump({"stat": self.stat, "digest": self.digest, "entries": self.entries}, f)
+
+    def raw(self, key):
+        """Return the raw bytes of the entry with the given key (or None)."""
+        if key not in self.entries:
+            return None
+        offset, length, _ = self.entries[key]
+        return bytes(self.buf[offset : offset + length])
+
+    def append(self, raw):
+        """Append an entry (bytes) to the end of the file and index it."""
+        sep = b"\n" if len(self.buf) and self.buf[-1:] != b"\n" else b""
+        with open(self.bibfile, "ab") as f:
+            f.write(sep + b"\n" + raw + (b"" if raw.endswith(b"\n") else b"\n"))
+        self.refresh()
+
+    def replace(self, key, raw):
+        """
+        Replace the entry with the given key by raw (bytes), rewriting the file
+        and shifting the offsets of the entries that follow it.
+        """
+        offset, length, _ = self.entries[key]
+        with atomic_write(self.bibfile, "wb") as f:
+            f.write(self.buf[:offset])
+            f.write(raw)
+            f.write(self.buf[offset + length :])
+            self.close()
+
+        delta = len(raw) - length
+        for v in self.entries.values():
+            if v[0] > offset:
+                v[0] += delta
+        del self.entries[key]
+        new = next(scanner.scan(raw), None)
+        if new is not None and new.key is not None:
+            self.entries[new.key] = [offset, len(raw), raw_hash(raw)]
+
+        self.stat = self.file_stat()
+        self.open()
+        self.digest = raw_hash(self.buf)
+        self.save()
@@ -0,0 +1,81 @@
+"""
+Apply corrections to a .bib file by rewriting only the affected bytes.
+
+Rather than re-serializing the whole bibliography (which reorders fields and
+rewrites every line), each corrected value is replaced in place, removed
+fields are cut out, and everything else, including comments, whitespace and
+field order, is copied through unchanged.  The file is processed in a single
+streaming pass.
+"""
+
+import scanner
+from stores import atomic_write
+
+
+def patch_entry(raw, fixes, aliases=None):
+    """
+    Apply fixes to a single raw entry (bytes) and return the patched entry.
+
+    fixes maps (lowercase) field names to new values, or to None to remove the
+    field; "ID" renames the entry's key.  Fields that are corrected but
+    missing from the entry are added at the end.  aliases maps alternative
+    field names (e.g. bibtexparser's "authors" --> "author") to the names used
+    in fixes.
+    """
+    aliases = aliases or {}
+    (key_start, key_end), found, tail = scanner.fields(raw)
+
+    edits = []  # (start, end, replacement)
+    seen = set()
+    for f in found:
+        name = aliases.get(f.name, f.name)
+        if name not in fixes:
+            continue
+        seen.add(name)
+        value = fixes[name]
+        if value is None:
+            edits.append((f.start, f.end, b""))
+        elif raw[f.value_start : f.value_start + 1] == b"{":
+            edits.append((f.content_start, f.content_end, value.encode("utf-8")))
+        else:
+            edits.append((f.value_start, f.end, b"{" + value.encode("utf-8") + b"}"))
+
+    if fixes.get("ID"):
+        edits.append((key_start, key_end, fixes["ID"].encode("utf-8")))
+
+    # new fields copy the separator and capitalization of the entry's last field
+    sep, capitalize = b",\n\t", True
+    if found:
+        sep = raw[found[-1].start : found[-1].name_start]
+        capitalize = raw[found[-1].name_start : found[-1].name_start + 1].isupper()
+    for name, value in fixes.items():
+        if name in seen or name in ("ID", "ENTRYTYPE") or value is None:
+            continue
+        label = name.capitalize() if capitalize else name
+        edits.append((tail, tail, sep + f"{label} = {{{value}}}".encode("utf-8")))
+
+    patched = []
+    pos = 0
+    for start, end, replacement in sorted(edits, key=lambda e: (e[0], e[1])):
+        patched += [raw[pos:start], replacement]
+        pos = end
+    patched.append(raw[pos:])
+    return b"".join(patched)
+
+
+def patch_bibliography(infile, outfile, patches, aliases=None):
+    """
+    Copy infile to outfile (which may be infile), applying patches, a
+    dictionary of {key: fixes} (see patch_entry).
+
+    Returns the number of entries that were changed.
+    """
+    changed = 0
+    with open(infile, "rb") as f, atomic_write(outfile, "wb") as out:
+        for e, raw in scanner.stream(f, gaps=True):
+            if e is not None and e.key in patches:
+                patched = patch_entry(raw, patches[e.key], aliases)
+                changed += patched != raw
+                raw = patched
+            out.write(raw)
+    return changed
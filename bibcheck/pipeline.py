@@ -0,0 +1,93 @@
+"""
+Bounded producer/consumer pipelines.
+
+Items from a source iterable flow through a sequence of stages, each run by
+its own pool of worker threads and connected to the next stage by a bounded
+queue.  A slow stage (e.g. network verification) therefore overlaps with the
+stages that feed it, and a fast producer (e.g. the parser) can only run a
+fixed number of items ahead of its consumers: the items in flight are bounded
+by the queue sizes, however large the input is (whatever the stage
+functions themselves keep is up to them).
+"""
+
+import queue
+import threading
+
+
+DONE = object()  # end-of-stream marker passed between stages
+
+
+class Failure:
+    """Wraps an exception raised by the source or a stage, so it can be re-raised by the consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def produce(source, out):
+    try:
+        for item in source:
+            out.put(item)
+    except Exception as e:
+        out.put(Failure(e))
+    out.put(DONE)
+
+
+def work(fn, inq, out, remaining, lock):
+    while True:
+        item = inq.get()
+        if item is DONE:
+            inq.put(DONE)  # let this stage's other workers see it too
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                out.put(DONE)
+            return
+        if isinstance(item, Failure):
+            out.put(item)
+            continue
+        try:
+            result = fn(item)
+        except Exception as e:
+            result = Failure(e)
+        if result is not None:
+            out.put(result)
+
+
+def run(source, stages, queue_size=64):
+    """
+    Run the items of source through stages, a list of (function, number of
+    workers) pairs, and yield the results of the last stage as they complete.
+
+    Each function is called with one item and returns the item to pass on
+    (or None to drop it).  Results are not necessarily yielded in input order
+    when a stage has more than one worker.  If the source or a stage raises an
+    exception, the remaining items are still processed and the (first)
+    exception is re-raised at the end.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    threads = [threading.Thread(target=produce, args=(source, queues[0]), daemon=True)]
+    for i, (fn, n) in enumerate(stages):
+        remaining, lock = [n], threading.Lock()
+        threads += [
+            threading.Thread(target=work, args=(fn, queues[i], queues[i + 1], remaining, lock), daemon=True)
+            for _ in range(n)
+        ]
+    for t in threads:
+        t.start()
+
+    failure = None
+    while True:
+        item = queues[-1].get()
+        if item is DONE:
+            break
+        if isinstance(item, Failure):
+            failure = failure or item.error
+            continue
+        yield item
+
+    for t in threads:
+        t.join()
+    if failure is not None:
+        raise failure
@@ -0,0 +1,125 @@
+"""
+Stratified random sampling of bibliography entries, for estimating error rates
+without checking every entry.
+
+Entries are stratified by entry type, decade, and venue.  Strata that are too
+small to be sampled meaningfully are collapsed (first by venue, then decade,
+then entry type) so that every stratum is expected to contribute at least two
+sampled entries.
+"""
+
+from collections import Counter, defaultdict
+from statistics import NormalDist
+import math
+import random
+
+
+def z_score(confidence):
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def sample_size(population, confidence=0.95, margin=0.02, p=0.5):
+    """Entries needed to estimate a proportion within +/- margin (Cochran, with finite population correction)."""
+    n0 = z_score(confidence) ** 2 * p * (1 - p) / margin**2
+    return min(population, math.ceil(n0 / (1 + (n0 - 1) / population)))
+
+
+def stratum(entry):
+    year = entry.get("year", "")
+    decade = year[:3] + "0s" if len(year) == 4 and year.isdigit() else "unknown"
+    venue = entry.get("journal", entry.get("booktitle", "")).lower() or "none"
+    return entry.get("ENTRYTYPE", "unknown"), decade, venue
+
+
+def stratify(entries, n):
+    """
+    Assign each entry (a dictionary of key --> entry) to a stratum, collapsing
+    strata whose expected sample size would be less than two.
+
+    Returns a dictionary of stratum --> list of keys.
+    """
+    min_size = 2 * len(entries) / max(n, 1)
+    labels = {k: stratum(e) for k, e in entries.items()}
+
+    # collapse venue, then decade, then entry type in strata that are too small
+    for level in [2, 1, 0]:
+        counts = Counter(labels.values())
+        for k, s in labels.items():
+            if counts[s] < min_size:
+                labels[k] = s[:level] + ("*",) * (3 - level)
+
+    strata = defaultdict(list)
+    for k, s in labels.items():
+        strata[s].append(k)
+    return dict(strata)
+
+
+def allocate(strata, n):
+    """Proportionally allocate n samples to strata (largest remainder method; at least one per stratum)."""
+    total = sum(len(keys) for keys in strata.values())
+    quotas = {s: n * len(keys) / total for s, keys in strata.items()}
+    allocation = {s: max(1, math.floor(q)) for s, q in quotas.items()}
+
+    remainders = sorted(strata, key=lambda s: quotas[s] - math.floor(quotas[s]), reverse=True)
+    for s in remainders[: max(0, n - sum(allocation.values()))]:
+        allocation[s] += 1
+    return {s: min(a, len(strata[s])) for s, a in allocation.items()}
+
+
+def draw(entries, n, seed=0):
+    """
+    Draw a stratified random sample of n entries.
+
+    Returns (sample, strata), where sample is a dictionary of stratum --> list of
+    sampled keys and strata is a dictionary of stratum --> list of all keys.
+    """
+    rng = random.Random(seed)
+    strata = stratify(entries, n)
+    allocation = allocate(strata, n)
+    sample = {s: rng.sample(sorted(strata[s]), allocation[s]) for s in sorted(strata)}
+    return sample, strata
+
+
+def wilson_interval(successes, n, confidence=0.95):
+    if n == 0:
+        return 0.0, 1.0
+    z = z_score(confidence)
+    p = successes / n
+    center = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+    spread = z * math.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+    return max(0.0, center - spread), min(1.0, center + spread)
+
+
+def estimate(outcomes, strata, confidence=0.95):
+    """
+    Estimate a population proportion from a stratified sample.
+
+    outcomes maps stratum --> list of 0/1 outcomes for its sampled entries, and
+    strata maps stratum --> list of all of its keys.
+
+    Returns (estimate, lower, upper).  Strata without any outcomes are left
+    out, and the others reweighted to make up for them.  The interval is the
+    usual normal approximation for stratified sampling (with finite population
+    correction); if no stratum shows any variation it falls back on a Wilson
+    score interval for the pooled sample.
+    """
+    total = sum(len(strata[s]) for s, x in outcomes.items() if x)
+    p_hat = 0.0
+    variance = 0.0
+    for s, x in outcomes.items():
+        if len(x) == 0:
+            continue
+        N, n = len(strata[s]), len(x)
+        w = N / total
+        p = sum(x) / n
+        p_hat += w * p
+        if n > 1:
+            variance += w**2 * (1 - n / N) * p * (1 - p) / (n - 1)
+
+    if variance == 0:
+        pooled = [v for x in outcomes.values() for v in x]
+        lower, upper = wilson_interval(sum(pooled), len(pooled), confidence)
+        return p_hat, min(lower, p_hat), max(upper, p_hat)
+
+    spread = z_score(confidence) * math.sqrt(variance)
+    return p_hat, max(0.0, p_hat - spread), min(1.0, p_hat + spread)
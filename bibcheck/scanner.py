@@ -0,0 +1,156 @@
+"""
+Fast scanning of raw .bib files.
+
+The scanner finds the extent of each @entry{...} by matching braces, without
+parsing field values, so entries can be streamed, indexed, or sliced out of a
+file without loading the whole bibliography into bibtexparser.  It works on
+bytes (including mmap objects); offsets are byte offsets.
+"""
+
+from collections import namedtuple
+import re
+
+
+ENTRY_START = re.compile(rb"@[ \t]*([A-Za-z]+)[ \t\r\n]*\{")
+BRACES = re.compile(rb"[{}]")
+
+FIELD_NAME = re.compile(rb"[ \t\r\n,]*([A-Za-z_][A-Za-z0-9_\-:.+]*)[ \t\r\n]*=[ \t\r\n]*")
+QUOTED = re.compile(rb'[{}"]')
+BARE = re.compile(rb"[^,}]*")
+
+# type is lowercase; key is None for @string, @preamble and @comment blocks
+Entry = namedtuple("Entry", ["type", "key", "start", "end"])
+
+# offsets within an entry: the field runs from start (the end of the previous
+# field, or of the key, so that it includes the separating comma) to end; its
+# value runs from value_start to end, and its contents (without delimiters)
+# from content_start to content_end.  name is lowercase.
+Field = namedtuple("Field", ["name", "start", "name_start", "value_start", "content_start", "content_end", "end"])
+
+NON_ENTRIES = {b"string", b"preamble", b"comment"}
+
+
+def entry_end(buf, pos, end=None):
+    """
+    Return the offset just past the brace that closes the entry whose body
+    starts at pos (just after its opening brace), or None if the entry is
+    incomplete.
+    """
+    depth = 1
+    end = len(buf) if end is None else end
+    while depth:
+        m = BRACES.search(buf, pos, end)
+        if m is None:
+            return None
+        depth += 1 if buf[m.start()] == ord("{") else -1
+        pos = m.end()
+    return pos
+
+
+def scan(buf, pos=0, end=None):
+    """
+    Yield an Entry for each complete entry in buf[pos:end].
+
+    Scanning stops at the first incomplete entry; the end offset of the last
+    yielded entry tells the caller where to resume once more data is available.
+    """
+    end = len(buf) if end is None else end
+    while True:
+        m = ENTRY_START.search(buf, pos, end)
+        if m is None:
+            return
+        close = entry_end(buf, m.end(), end)
+        if close is None:
+            return
+
+        kind = m.group(1).lower()
+        key = None
+        if kind not in NON_ENTRIES:
+            comma = buf.find(b",", m.end(), close)
+            key = bytes(buf[m.end() : comma if comma >= 0 else close - 1]).strip().decode("utf-8")
+        yield Entry(kind.decode("ascii"), key, m.start(), close)
+        pos = close
+
+
+def stream(f, chunk_size=1 << 16, gaps=False):
+    """
+    Read a binary file object incrementally, yielding (Entry, raw bytes) for
+    each complete entry.  Offsets are relative to the start of the file.
+
+    If gaps is True, the text between (and after) entries is also yielded, as
+    (None, raw bytes), so that the pieces add up to the whole file.
+    """
+    buf = b""
+    offset = 0  # file offset of buf[0]
+    while True:
+        chunk = f.read(chunk_size)
+        buf += chunk
+
+        resume = 0
+        for e in scan(buf):
+            if gaps and e.start > resume:
+                yield None, buf[resume : e.start]
+            yield Entry(e.type, e.key, e.start + offset, e.end + offset), buf[e.start : e.end]
+            resume = e.end
+        buf = buf[resume:]
+        offset += resume
+
+        if not chunk:
+            if gaps and buf:
+                yield None, buf
+            return
+
+
+def value_end(buf, pos, end):
+    """Return (content_start, content_end, end) of the field value starting at pos."""
+    if buf[pos : pos + 1] == b"{":
+        close = entry_end(buf, pos + 1, end)
+        if close is None:
+            raise ValueError(f"unbalanced braces at offset {pos}")
+        return pos + 1, close - 1, close
+    if buf[pos : pos + 1] == b'"':
+        depth = 0
+        for m in QUOTED.finditer(buf, pos + 1, end):
+            c = buf[m.start() : m.end()]
+            if c == b"{":
+                depth += 1
+            elif c == b"}":
+                depth -= 1
+            elif depth == 0:
+                return pos + 1, m.start(), m.end()
+        raise ValueError(f"unterminated quoted value at offset {pos}")
+    m = BARE.match(buf, pos, end)
+    stop = pos + len(m.group(0).rstrip())
+    return pos, stop, stop
+
+
+def fields(raw):
+    """
+    Locate the key and fields of a single raw entry (as yielded by stream).
+
+    Returns ((key_start, key_end), [Field, ...], tail), where tail is the end
+    of the last field (or of the key), i.e. where a new field could be added.
+    """
+    m = ENTRY_START.match(raw)
+    if m is None:
+        raise ValueError("not an entry")
+    close = len(raw) - 1  # the entry's closing brace
+    comma = raw.find(b",", m.end(), close)
+    key_end = comma if comma >= 0 else close
+    key_start = m.end()
+    while key_start < key_end and raw[key_start : key_start + 1].isspace():
+        key_start += 1
+    while key_end > key_start and raw[key_end - 1 : key_end].isspace():
+        key_end -= 1
+
+    found = []
+    pos = key_end
+    while True:
+        f = FIELD_NAME.match(raw, pos, close)
+        if f is None:
+            break
+        content_start, content_end, end = value_end(raw, f.end(), close)
+        found.append(Field(f.group(1).decode("ascii").lower(), pos, f.start(1), f.end(),
+                           content_start, content_end, end))
+        pos = end
+    return (key_start, key_end), found, pos
@@ -0,0 +1,153 @@
+"""
+Full-text search of a .bib file.
+
+The entries are copied into a SQLite database next to the .bib file
+(cdl.bib --> cdl.search.sqlite), with an FTS5 index over their titles,
+authors, venues (journal or book title) and years.  The database records
+the hash of each entry (from the entry index, see offsets.py), so when the
+.bib file changes only the entries whose hashes changed are re-read; when
+it hasn't changed (same size and modification time), searches go straight
+to the database.  Field values are read with the scanner, so neither
+bibtexparser nor pandas is needed.
+"""
+
+import os
+import re
+import sqlite3
+
+import scanner
+from offsets import EntryIndex
+
+
+COLUMNS = ["title", "author", "venue", "year"]
+WEIGHTS = [10.0, 5.0, 2.0, 1.0]  # for bm25, in the order of COLUMNS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE,
+    hash TEXT,
+    type TEXT,
+    title TEXT,
+    author TEXT,
+    venue TEXT,
+    year TEXT,
+    raw TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS fts USING fts5(
+    title, author, venue, year,
+    content='entries', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO fts(rowid, title, author, venue, year)
+    VALUES (new.id, new.title, new.author, new.venue, new.year);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO fts(fts, rowid, title, author, venue, year)
+    VALUES ('delete', old.id, old.title, old.author, old.venue, old.year);
+END;
+"""
+
+LATEX_COMMAND = re.compile(r"\\[A-Za-z]+\s*|\\.")  # \textit, \'
+WORD = re.compile(r"\w+")
+
+
+def database_path(bibfile):
+    base, _ = os.path.splitext(bibfile)
+    return f"{base}.search.sqlite"
+
+
+def plain_text(value):
+    # latex commands, accents and braces removed; unicode accents are
+    # ignored by the tokenizer
+    return " ".join(LATEX_COMMAND.sub("", value).replace("{", "").replace("}", "").split())
+
+
+def entry_row(key, digest, raw):
+    e = next(scanner.scan(raw))
+    _, found, _ = scanner.fields(raw)
+    values = {}
+    for f in found:
+        values.setdefault(f.name, plain_text(raw[f.content_start : f.content_end].decode("utf-8")))
+    venue = values.get("journal") or values.get("booktitle") or ""
+    return (key, digest, e.type, values.get("title", ""), values.get("author", ""), venue,
+            values.get("year", ""), raw.decode("utf-8"))
+
+
+def fts_query(query):
+    """
+    Translate a search into an FTS5 query: every word must match the start
+    of a word in the entry, and "author:mann" restricts a word to a column.
+    """
+    terms = []
+    for word in query.split():
+        column, sep, rest = word.partition(":")
+        if sep and column.lower() in COLUMNS:
+            column, word = column.lower(), rest
+        else:
+            column = None
+        for token in WORD.findall(word):
+            term = f'"{token}"*'
+            terms.append(f"{column} : {term}" if column else term)
+    return " ".join(terms)
+
+
+class SearchIndex:
+    def __init__(self, bibfile, fname=None):
+        self.bibfile = bibfile
+        self.fname = fname or database_path(bibfile)
+        self.db = sqlite3.connect(self.fname)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def file_stat(self):
+        st = os.stat(self.bibfile)
+        return f"{st.st_size} {st.st_mtime_ns}"
+
+    def refresh(self, rebuild=False):
+        """
+        Bring the database up to date with the .bib file.  Returns the number
+        of entries that were added, updated or removed.
+        """
+        stat = self.file_stat()
+        saved = self.db.execute("SELECT value FROM meta WHERE name = 'stat'").fetchone()
+        if not rebuild and saved is not None and saved[0] == stat:
+            return 0
+
+        index = EntryIndex(self.bibfile)
+        old = {} if rebuild else dict(self.db.execute("SELECT key, hash FROM entries"))
+        changed = [k for k, (_, _, h) in index.entries.items() if old.get(k) != h]
+        removed = [k for k in old if k not in index]
+        with self.db:
+            if rebuild:
+                self.db.execute("DELETE FROM entries")
+            self.db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in changed + removed])
+            self.db.executemany(
+                "INSERT INTO entries (key, hash, type, title, author, venue, year, raw) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [entry_row(k, index.entries[k][2], index.raw(k)) for k in changed],
+            )
+            self.db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('stat', ?)", (stat,))
+        index.close()
+        return len(changed) + len(removed)
+
+    def search(self, query, limit=10):
+        """
+        The best matches for query (see fts_query), as (key, title, author,
+        venue, year) tuples, best first.
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        weights = ", ".join(str(w) for w in WEIGHTS)
+        return self.db.execute(
+            f"""SELECT e.key, e.title, e.author, e.venue, e.year
+                FROM fts JOIN entries e ON e.id = fts.rowid
+                WHERE fts MATCH ? ORDER BY bm25(fts, {weights}) LIMIT ?""",
+            (match, limit),
+        ).fetchall()
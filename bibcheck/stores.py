@@ -0,0 +1,325 @@
+"""
+Persistent sidecar stores shared by bibcheck and bibverify.
+
+Each store is a small JSON file that lives next to the .bib file it describes
+(e.g., cdl.bib --> cdl.verified.json) and is keyed by citation key.
+"""
+
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# fields that bibverify actually compares against CrossRef; an entry only needs
+# to be re-verified when one of these changes
+VERIFIED_FIELDS = ["title", "author", "year", "journal", "volume", "number", "pages"]
+
+
+# "warning" results (e.g. no confident match in CrossRef) can change as records
+# are added to CrossRef, so they are only reused for this long (in seconds)
+WARNING_TTL = 30 * 24 * 3600
+
+
+# sidecars whose records are keyed by citation key, and so must follow key renames
+KEYED_SIDECARS = ["verified", "dois"]
+
+
+def sidecar_path(bibfile, name):
+    """Return the path of the `name` sidecar for bibfile (cdl.bib --> cdl.<name>.json)."""
+    base, _ = os.path.splitext(bibfile)
+    return f"{base}.{name}.json"
+
+
+def entry_hash(entry, fields=VERIFIED_FIELDS):
+    """Hash the given fields of a parsed entry (missing fields hash as empty)."""
+    content = json.dumps([entry.get(f, "") for f in fields], ensure_ascii=False)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def file_lock(fname):
+    """
+    Hold an exclusive lock on fname + ".lock" (shared by all processes on
+    this machine).  Without fcntl (on Windows) nothing is locked.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(fname + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def atomic_write(fname, mode="w"):
+    """
+    Open a temporary file next to fname for writing, and replace fname with
+    it once the block finishes, so that an interrupted write can't leave a
+    truncated file behind.  If the block raises, fname is left unchanged.
+    """
+    tmp = f"{fname}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, mode) as f:
+            yield f
+        os.replace(tmp, fname)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class JSONStore:
+    """A thread-safe dictionary that is persisted as a JSON file."""
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.lock = threading.Lock()
+        self.data = {}
+        self.changed = set()  # keys set, moved or removed since the last save
+        if fname and os.path.exists(fname):
+            with open(fname, "r") as f:
+                self.data = json.load(f)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.changed.add(key)
+
+    def remove(self, key):
+        with self.lock:
+            if self.data.pop(key, None) is not None:
+                self.changed.add(key)
+
+    def update(self, records):
+        with self.lock:
+            self.data.update(records)
+            self.changed.update(records)
+
+    def rename(self, renames):
+        """Move records to new keys, given a dictionary of {old key: new key}."""
+        with self.lock:
+            moved = {new: self.data.pop(old) for old, new in renames.items() if old in self.data}
+            self.data.update(moved)
+            self.changed.update(old for old, new in renames.items() if new in moved)
+            self.changed.update(moved)
+        return len(moved)
+
+    def save(self, merge=True):
+        """
+        Write the store to disk.
+
+        If merge is True, only the keys changed by this process are written
+        into the current contents of the file, so that several processes
+        (e.g. verification shards on one machine) can share a store.  The
+        file is locked from the time it is re-read until it is replaced, so
+        processes saving at the same time don't lose each other's keys.
+        (Without fcntl, i.e. on Windows, they aren't locked; shards should
+        then save to separate files.)
+        """
+        if not (self.fname and self.changed):
+            return
+        with self.lock, file_lock(self.fname):
+            if merge and os.path.exists(self.fname):
+                with open(self.fname, "r") as f:
+                    data = json.load(f)
+                for k in self.changed:
+                    if k in self.data:
+                        data[k] = self.data[k]
+                    else:
+                        data.pop(k, None)
+                self.data = data
+
+            with atomic_write(self.fname) as f:
+                json.dump(self.data, f, indent=1, sort_keys=True, ensure_ascii=False)
+                f.write("\n")
+            self.changed = set()
+
+
+class VerificationStore(JSONStore):
+    """
+    Results of previous bibverify runs, keyed by citation key.
+
+    A stored result is only reused if both the hash of the entry's verified
+    fields and the verifier version match the current ones, and (for
+    warnings) if it is less than warning_ttl seconds old.
+    """
+
+    def __init__(self, fname, version, warning_ttl=WARNING_TTL):
+        super().__init__(fname)
+        self.version = version
+        self.warning_ttl = warning_ttl
+
+    def lookup(self, entry):
+        record = self.get(entry.get("ID"))
+        if record is None:
+            return None
+        if record.get("version") != self.version or record.get("hash") != entry_hash(entry):
+            return None
+        if record.get("status") == "warning" and time.time() - record.get("checked", 0) > self.warning_ttl:
+            return None
+        return record
+
+    def record(self, entry, status, discrepancies=None, corrections=None):
+        self.set(
+            entry.get("ID"),
+            {
+                "hash": entry_hash(entry),
+                "version": self.version,
+                "status": status,
+                "discrepancies": discrepancies or [],
+                "corrections": corrections or {},
+                "checked": time.time(),
+            },
+        )
+
+    def change_time(self, entry):
+        """
+        When the entry was first seen to differ from its stored result (the
+        time is saved with the record), or None if it has no stored result or
+        hasn't changed since.
+        """
+        record = self.get(entry.get("ID"))
+        if record is None:
+            return None
+        current = entry_hash(entry)
+        if record.get("hash") == current:
+            return None
+        if record.get("changed_hash") != current:
+            record = {**record, "changed_hash": current, "changed": time.time()}
+            self.set(entry.get("ID"), record)
+        return record["changed"]
+
+
+class RenameLog(JSONStore):
+    """
+    Old citation key --> current key, for every key renamed by bibcheck, so
+    that documents citing the old keys can be updated (see
+    citations.propagate_renames).  Renames are composed: after A --> B and
+    then B --> C, both A and B map to C.  A key that is given to an entry
+    again (B --> A after A --> C) is dropped from the log, so the log never
+    maps a current key elsewhere.
+    """
+
+    def record(self, renames):
+        updates = {old: renames[new] for old, new in self.data.items() if new in renames}
+        updates.update(renames)
+        for old, new in updates.items():
+            if old == new:
+                self.remove(old)
+            else:
+                self.set(old, new)
+        for new in set(renames.values()):
+            if new in self.data and new not in renames:
+                self.remove(new)
+
+    def pending(self, keys):
+        """The renames, without those whose old key is in keys (the keys of the current bibliography)."""
+        return {old: new for old, new in self.data.items() if old not in keys}
+
+
+class DOIIndex(JSONStore):
+    """
+    Citation key --> DOI mapping, learned from confident CrossRef matches.
+
+    cdl.bib doesn't store DOIs (the doi field is pruned by bibcheck), so this
+    lets later bibverify runs use the direct DOI lookup instead of a search.
+    """
+
+    def lookup(self, key):
+        return self.get(key)
+
+    def record(self, key, doi):
+        if doi and self.get(key) != doi:
+            self.set(key, doi)
+
+
+def venue_key(name):
+    """Normalize a venue name for lookup (case, punctuation, braces and & vs. and are ignored)."""
+    name = name.lower().replace("&", " and ")
+    return " ".join(re.findall(r"[a-z0-9]+", name))
+
+
+class VenueAuthority(JSONStore):
+    """
+    ISSN and container-title variants --> canonical journal name.
+
+    Learned from confident CrossRef matches: the journal name used by the
+    matched entry becomes the canonical name for the ISSNs and titles that
+    CrossRef reports for it.  Keys are "issn:<ISSN>" or "name:<venue key>";
+    the first canonical name learned for a key is kept.
+    """
+
+    def canonical(self, names=(), issns=()):
+        """Return the canonical name for any of the given ISSNs or names (ISSNs first), or None."""
+        for issn in issns:
+            name = self.get(f"issn:{issn}")
+            if name:
+                return name
+        for n in names:
+            name = self.get(f"name:{venue_key(n)}")
+            if name:
+                return name
+        return None
+
+    def same_venue(self, journal, names=(), issns=()):
+        """True if the given ISSNs or names are known variants of journal."""
+        name = self.canonical(names, issns)
+        return name is not None and venue_key(name) == venue_key(journal)
+
+    def record(self, journal, names=(), issns=()):
+        keys = [f"issn:{i}" for i in issns] + [f"name:{venue_key(n)}" for n in names]
+        for k in keys:
+            if k != f"name:{venue_key(journal)}" and k not in self:
+                self.set(k, journal)
+
+
+def carry_sidecars(src_bib, dst_bib, renames):
+    """
+    Apply key renames ({old key: new key}) to the key-indexed sidecars of
+    src_bib and save them as the sidecars of dst_bib (which may be src_bib),
+    and add them to the rename log.
+    """
+    for name in KEYED_SIDECARS:
+        src = sidecar_path(src_bib, name)
+        if not os.path.exists(src):
+            continue
+        store = JSONStore(src)
+        store.rename(renames)
+        if sidecar_path(dst_bib, name) == src:
+            store.save()
+        else:
+            store.fname = sidecar_path(dst_bib, name)
+            store.changed = set(store.data)
+            store.save(merge=False)
+
+    # the rename log follows the bibliography too, with these renames added
+    src = sidecar_path(src_bib, "renames")
+    if renames or os.path.exists(src):
+        log = RenameLog(src)
+        log.record(renames)
+        if sidecar_path(dst_bib, "renames") == src:
+            log.save()
+        else:
+            log.fname = sidecar_path(dst_bib, "renames")
+            log.changed = set(log.data)
+            log.save(merge=False)
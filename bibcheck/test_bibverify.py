@@ -0,0 +1,196 @@
+"""
+Tests of bibverify's local logic (no CrossRef requests are made).
+
+Run with `python bibcheck/test_bibverify.py` (or pytest).
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from bibverify import VERIFIER_VERSION, BibVerifier, SingleFlight
+from stores import VerificationStore
+
+
+ARTICLE = {"ID": "Mann21", "ENTRYTYPE": "article", "title": "A title", "author": "A Mann", "year": "2021",
+           "journal": "Nature", "volume": "5", "pages": "1--2"}
+
+
+def screen(**fields):
+    return BibVerifier().prescreen({**ARTICLE, **fields})
+
+
+def test_prescreen_network():
+    assert screen() == ("network", [])
+    # arXiv preprints give their DOI as the volume, deliberately
+    assert screen(volume="doi.org/10.48550/arXiv.2404.14619") == ("network", [])
+    # a DOI in the pages field is corrected from CrossRef
+    assert screen(pages="10.1038/s41586-021-1") == ("network", [])
+    assert screen(title="", doi="10.1/x") == ("network", [])
+
+
+def test_prescreen_broken():
+    assert screen(volume="75(3)") == ("broken", ["Volume field includes the issue number: '75(3)'"])
+    assert screen(volume="https://doi.org/10.1/x")[0] == "broken"
+    assert screen(volume="doi:10.1/x")[0] == "broken"
+    assert screen(year="1066") == ("broken", ["Year out of range: 1066"])
+    category, problems = screen(volume="5 (2)", year="3021")
+    assert category == "broken" and len(problems) == 2
+
+
+def test_prescreen_skip():
+    assert screen(force="True") == ("skip", [])
+    assert screen(year="in press") == ("skip", ["Year 'in press' is not a number; not checked against CrossRef"])
+    assert screen(title="") == ("skip", ["No title or DOI to look up"])
+
+
+def test_prescreen_once():
+    class Counting(BibVerifier):
+        screened = 0
+
+        def prescreen(self, entry):
+            self.screened += 1
+            return super().prescreen(entry)
+
+    with tempfile.TemporaryDirectory() as d:
+        bibfile = os.path.join(d, "cdl.bib")
+        with open(bibfile, "w") as f:
+            f.write("@article{Mann21,\n\tAuthor = {A Mann},\n\tTitle = {One},\n\tVolume = {75(3)},\n\tYear = {2021}}\n\n"
+                    "@article{Smit20,\n\tAuthor = {B Smith},\n\tTitle = {Two},\n\tYear = {in press}}\n")
+        verifier = Counting()
+        verifier.verify_bibliography(bibfile, use_parallel=False)
+        assert verifier.screened == 2
+        assert verifier.prescreened_count == 2
+        assert (verifier.error_count, verifier.warning_count) == (1, 1)
+        assert verifier.discrepancies[0]["id"] == "Mann21"
+
+
+def entry(key, title="A title"):
+    return {**ARTICLE, "ID": key, "title": title}
+
+
+def test_schedule():
+    with tempfile.TemporaryDirectory() as d:
+        store = VerificationStore(os.path.join(d, "cdl.verified.json"), VERIFIER_VERSION)
+        verifier = BibVerifier(store=store)
+        for i, key in enumerate(["Old", "Recent", "Changed1", "Changed2", "Stale"]):
+            store.record(entry(key), "verified")
+            store.data[key]["checked"] = 1000.0 + i
+        store.data["Stale"]["version"] = "0.1"  # verified by an older verifier
+
+        entries = {k: entry(k) for k in ["Recent", "Old", "Stale", "Changed1", "New", "Changed2"]}
+        entries["Changed1"] = entry("Changed1", "An edited title")
+        assert [k for k, _ in verifier.schedule(entries)] == ["New", "Changed1", "Stale", "Old", "Recent", "Changed2"]
+
+        # the time a change was first seen is kept, so entries changed later
+        # (here, Changed2) come first
+        first_seen = store.data["Changed1"]["changed"]
+        time.sleep(0.01)
+        entries["Changed2"] = entry("Changed2", "Another edit")
+        assert [k for k, _ in verifier.schedule(entries)] == ["New", "Changed2", "Changed1", "Stale", "Old", "Recent"]
+        assert store.data["Changed1"]["changed"] == first_seen
+
+        # once it is verified again, an entry is no longer changed
+        store.record(entries["Changed2"], "verified")
+        assert store.change_time(entries["Changed2"]) is None
+
+
+def test_deferred():
+    with tempfile.TemporaryDirectory() as d:
+        store = VerificationStore(os.path.join(d, "cdl.verified.json"), VERIFIER_VERSION)
+        store.record(entry("Known"), "error", ["Volume mismatch"], {"volume": "6"})
+        verifier = BibVerifier(store=store)
+        verifier.deadline = time.monotonic() - 1  # the budget is already spent
+
+        # entries without a stored result are deferred; the others report it
+        assert verifier.verify_entry_wrapper(("New", entry("New"))) == ("New", None, [], {})
+        assert verifier.verify_entry_wrapper(("Known", entry("Known"))) == (
+            "Known", False, ["Volume mismatch"], {"volume": "6"}
+        )
+        assert (verifier.deferred_count, verifier.cached_count, verifier.error_count) == (1, 1, 1)
+
+
+def run_concurrently(flight, key, fn, n):
+    # n callers of flight.do(key, fn); returns their results (or exceptions)
+    # once fn has been entered and released
+    results = [None] * n
+
+    def call(i):
+        try:
+            results[i] = flight.do(key, fn)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def wait_for_callers(flight, n):
+    # until all n callers are either running or waiting for the one call
+    while flight.issued + flight.coalesced < n:
+        time.sleep(0.001)
+
+
+def test_single_flight():
+    flight = SingleFlight()
+    entered, release = threading.Event(), threading.Event()
+    calls = []
+
+    def lookup():
+        calls.append(1)
+        entered.set()
+        release.wait()
+        return {"DOI": "10.1/x"}
+
+    threads, results = run_concurrently(flight, "title:A title", lookup, 8)
+    assert entered.wait(5)
+    wait_for_callers(flight, 8)
+    assert list(flight.in_flight) == ["title:A title"]
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1 and (flight.issued, flight.coalesced) == (1, 7)
+    assert all(r == {"DOI": "10.1/x"} for r in results)
+    assert flight.in_flight == {}
+
+    # a later call runs again
+    assert flight.do("title:A title", lambda: "again") == "again"
+    assert flight.issued == 2
+
+
+def test_single_flight_error():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def failing():
+        calls.append(1)
+        release.wait()
+        raise ConnectionError("CrossRef is down")
+
+    threads, results = run_concurrently(flight, "doi:10.1/x", failing, 5)
+    wait_for_callers(flight, 5)
+    release.set()
+    for t in threads:
+        t.join()
+
+    # every caller sees the one call's exception, and the key is cleared
+    assert len(calls) == 1
+    assert all(isinstance(r, ConnectionError) for r in results)
+    assert len({id(r) for r in results}) == 1
+    assert flight.in_flight == {}
+    assert flight.do("doi:10.1/x", lambda: "ok") == "ok"
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("ok")
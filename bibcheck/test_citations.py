@@ -0,0 +1,119 @@
+"""
+Tests of updating citations after keys are renamed (citations.py).
+
+Run with `python bibcheck/test_citations.py` (or pytest).
+"""
+
+import os
+import tempfile
+
+from citations import cited_keys, extract, propagate_renames, rename_citations
+from offsets import EntryIndex
+from stores import RenameLog
+
+
+TEX = r"""As shown by \citet{Mann21} and others \citep[e.g.,][p. 2]{Smit20, Mann21}.
+Mann21 isn't a citation. % \cite{Mann21} in a comment is updated too
+"""
+
+BIB = """@article{Mann21,
+	Author = {C Mann},
+	Title = {A newer paper},
+	Year = {2021}}
+
+@article{Mann21a,
+	Author = {A Mann},
+	Title = {One thing},
+	Year = {2021}}
+"""
+
+MULTICITE = r"""\documentclass{article}
+See \cites{Mann21}{Smit20} and \textcites(see)(p. 2)[1]{Jone19}[ch. 2]{Mann21a, Gone99}.
+\parencite[e.g.,][5]{Mann21}, \citeauthor*{Smit20} {not keys}
+"""
+
+
+def test_cited_keys():
+    with tempfile.TemporaryDirectory() as d:
+        texfile = os.path.join(d, "paper.tex")
+        with open(texfile, "w") as f:
+            f.write(MULTICITE)
+        assert cited_keys(texfile) == ["Mann21", "Smit20", "Jone19", "Mann21a", "Gone99"]
+
+
+def test_extract_multicite():
+    with tempfile.TemporaryDirectory() as d:
+        bibfile, texfile = os.path.join(d, "cdl.bib"), os.path.join(d, "paper.tex")
+        outfile = os.path.join(d, "paper.cited.bib")
+        with open(bibfile, "w") as f:
+            f.write(BIB + "\n@article{Jone19,\n\tTitle = {Three},\n\tYear = {2019}}\n")
+        with open(texfile, "w") as f:
+            f.write(MULTICITE)
+
+        written, missing = extract(bibfile, texfile, outfile)
+        assert written and missing == ["Smit20", "Gone99"]
+        with open(outfile) as f:
+            text = f.read()
+        assert [k for k in ("Mann21,", "Mann21a,", "Jone19,") if "@article{" + k in text] == [
+            "Mann21,", "Mann21a,", "Jone19,"
+        ]
+        assert extract(bibfile, texfile, outfile) == (False, ["Smit20", "Gone99"])
+
+
+def test_rename_citations():
+    text, n = rename_citations(TEX, {"Mann21": "Mann21a", "Smit20": "Smit20b"})
+    assert n == 4
+    assert text == TEX.replace("{Mann21}", "{Mann21a}").replace("{Smit20, Mann21}", "{Smit20b, Mann21a}")
+    assert rename_citations(TEX, {}) == (TEX, 0)
+
+
+def test_rename_multicite():
+    renames = {"Old1": "New1", "Old2": "New2"}
+    assert rename_citations(r"\cites{Old1}{Old2}", renames) == (r"\cites{New1}{New2}", 2)
+    assert rename_citations(r"\textcites(pre)(post)[1]{Old1}[2]{Old2}", renames) == (
+        r"\textcites(pre)(post)[1]{New1}[2]{New2}", 2
+    )
+    assert rename_citations(r"\parencites[see][]{Old1, X} [p. 3]{Old2} text", renames) == (
+        r"\parencites[see][]{New1, X} [p. 3]{New2} text", 2
+    )
+    # only the first group of an ordinary citation command holds keys
+    assert rename_citations(r"\cite{Old1}{Old2}", renames) == (r"\cite{New1}{Old2}", 1)
+
+
+def test_propagate_twice():
+    with tempfile.TemporaryDirectory() as d:
+        bibfile, texfile = os.path.join(d, "cdl.bib"), os.path.join(d, "papers", "paper.tex")
+        os.mkdir(os.path.dirname(texfile))
+        with open(texfile, "w") as f:
+            f.write(TEX)
+
+        # Mann21 was renamed, and a new entry was then given the key Mann21
+        log = RenameLog(os.path.join(d, "cdl.renames.json"))
+        log.record({"Mann21": "Mann21a"})
+        log.record({"Smit20": "Smit20a"})
+        assert propagate_renames(d, log.data, workers=1, dry_run=True) == {texfile: 4}
+        assert propagate_renames(d, log.data, workers=1) == {texfile: 4}
+        with open(bibfile, "w") as f:
+            f.write(BIB)
+        with open(texfile, "a") as f:
+            f.write("\\cite{Mann21}\n")
+        log.record({"Mann21b": "Mann21"})
+
+        # the new citation of Mann21 is kept, and a second run changes nothing
+        index = EntryIndex(bibfile)
+        pending = log.pending(index)
+        index.close()
+        assert pending == {"Smit20": "Smit20a", "Mann21b": "Mann21"}
+        for _ in range(2):
+            assert propagate_renames(d, pending, workers=2) == {}
+        with open(texfile) as f:
+            text = f.read()
+        assert text.endswith("\\cite{Mann21}\n")
+        assert "{Smit20a, Mann21a}" in text
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("ok")
@@ -0,0 +1,96 @@
+"""
+Tests of mapping git diffs onto .bib entries (gitdiff.py).
+
+Run with `python bibcheck/test_gitdiff.py` (or pytest).
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+
+from gitdiff import GitError, changed_entries, changed_lines, contents, diff, removed_keys
+
+
+BIB = """@article{Mann21,
+	Author = {A Mann},
+	Title = {One},
+	Year = {2021}}
+
+@article{Smit20,
+	Author = {B Smith},
+	Title = {Two},
+	Year = {2020}}
+
+@article{Jone19,
+	Author = {C Jones},
+	Title = {Three},
+	Year = {2019}}
+"""
+
+
+def keys(buf, d):
+    return [e.key for e in changed_entries(buf, changed_lines(d))]
+
+
+def test_changed_lines():
+    d = b"@@ -3 +3 @@\n-x\n+y\n@@ -10,2 +9,0 @@\n-a\n-b\n@@ -20,0 +19,3 @@\n+c\n+d\n+e\n"
+    assert changed_lines(d) == [(3, 1), (9, 0), (19, 3)]
+
+
+def test_removed_keys():
+    d = b"-@article{Smit20,\n-\tAuthor = {B Smith},\n-@string{nat = {Nature}}\n+@article{Smit20a,\n"
+    assert removed_keys(d) == ["Smit20"]
+
+
+def test_changed_entries():
+    buf = BIB.encode("utf-8")
+    assert keys(buf, b"@@ -7 +7 @@\n") == ["Smit20"]  # a changed title
+    assert keys(buf, b"@@ -4,3 +4,3 @@\n") == ["Mann21", "Smit20"]  # lines spanning two entries
+    assert keys(buf, b"@@ -5 +5 @@\n") == []  # the blank line between entries
+    assert keys(buf, b"@@ -8,2 +7,0 @@\n") == ["Smit20"]  # lines removed from an entry
+    assert keys(buf, b"@@ -10,6 +9,0 @@\n") == []  # a whole entry removed
+    assert keys(buf, b"@@ -15,0 +16,5 @@\n") == []  # nothing added within the file
+
+
+def test_git():
+    if shutil.which("git") is None:
+        return
+    with tempfile.TemporaryDirectory() as d:
+        bibfile = os.path.join(d, "cdl.bib")
+
+        def run(*args):
+            subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@t", *args], cwd=d, check=True,
+                           capture_output=True)
+
+        run("init", "-q")
+        with open(bibfile, "w") as f:
+            f.write(BIB)
+        run("add", "cdl.bib")
+        run("commit", "-q", "-m", "add")
+
+        # edit one entry, delete another, and stage the changes
+        with open(bibfile, "w") as f:
+            f.write(BIB.replace("{Two}", "{Two, again}").split("@article{Jone19")[0].rstrip() + "\n")
+        run("add", "cdl.bib")
+        with open(bibfile, "a") as f:
+            f.write("\n@misc{Unst22,\n\tTitle = {Unstaged},\n\tYear = {2022}}\n")
+
+        changes = diff(bibfile, staged=True)
+        assert keys(contents(bibfile, staged=True), changes) == ["Smit20"]
+        assert removed_keys(changes) == ["Jone19"]
+        assert keys(contents(bibfile), diff(bibfile, since="HEAD")) == ["Smit20", "Unst22"]
+
+        try:
+            diff(bibfile, since="no-such-revision")
+        except GitError:
+            pass
+        else:
+            raise AssertionError("expected a GitError")
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("ok")
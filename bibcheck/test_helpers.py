@@ -0,0 +1,98 @@
+"""
+Tests of bibcheck's rule registry (helpers.RULES, select_rules and check_bib).
+
+Run with `python bibcheck/test_helpers.py` (or pytest).
+"""
+
+import os
+import tempfile
+
+import helpers
+from helpers import RULES, check_bib, select_rules
+
+
+BIB = """@article{Mann21,
+	Author = {A Mann},
+	Journal = {Nature},
+	Pages = {1-2},
+	Title = {One thing},
+	Volume = {5},
+	Year = {2021}}
+
+@article{Smth20,
+	Author = {B Smith},
+	Journal = {Nature},
+	Pages = {10--12},
+	Title = {Two things},
+	Volume = {6},
+	Year = {2020}}
+
+@article{Jone19,
+	Author = {C Jones},
+	Journal = {Science},
+	Pages = {20-5},
+	Title = {Three things},
+	Volume = {7},
+	Year = {2019}}
+"""
+
+
+def run(**kwargs):
+    with tempfile.TemporaryDirectory() as d:
+        bibfile = os.path.join(d, "test.bib")
+        with open(bibfile, "w") as f:
+            f.write(BIB)
+        errors, _ = check_bib(bibfile, verbose=False, **kwargs)
+        return errors
+
+
+def test_select_rules():
+    assert [r.name for r in select_rules()] == list(RULES)
+    assert [r.name for r in select_rules(only=["pages", "key"])] == ["key", "pages"]  # in registry order
+    assert "journal" not in [r.name for r in select_rules(skip=["journal"])]
+    for only, skip in ((["page"], None), (None, ["pages", "nonsense"])):
+        try:
+            select_rules(only, skip)
+        except ValueError as e:
+            assert "unknown rule(s)" in str(e) and "pages" in str(e)
+        else:
+            raise AssertionError("expected a ValueError")
+
+
+def test_only():
+    loaded = []
+
+    class RecordingColumns(helpers.Columns):
+        def __init__(self, bd, fields=None):
+            loaded.append(fields)
+            super().__init__(bd, fields)
+
+    columns = helpers.Columns
+    helpers.Columns = RecordingColumns
+    try:
+        timings = {}
+        errors = run(only=["pages"], timings=timings)
+    finally:
+        helpers.Columns = columns
+
+    # only the pages rule runs, on only the fields it reads
+    assert set(timings) == {"load", "pages"}
+    assert loaded == [{"ID", "pages"}]
+    assert errors == {"Mann21": {"pages": "1--2"}, "Jone19": {"pages": "20--25"}}
+
+    # with the same fixes as a full run
+    full = run()
+    assert {k: {"pages": v["pages"]} for k, v in full.items() if "pages" in v} == errors
+    assert full["Smth20"]["ID"] == "Smit20"
+
+
+def test_skip():
+    without_pages = {k: {f: x for f, x in v.items() if f != "pages"} for k, v in run().items()}
+    assert run(skip=["pages"]) == {k: v for k, v in without_pages.items() if v}
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("ok")
@@ -0,0 +1,143 @@
+"""
+Tests of adding entries to a .bib file (merging.py).
+
+Run with `python bibcheck/test_merging.py` (or pytest).
+"""
+
+import os
+import tempfile
+
+from merging import KeyBaseIndex, add_entries, assign_keys, merge_bib
+from offsets import EntryIndex
+
+
+TARGET = """@article{Mann21,
+	Author = {A Mann},
+	Journal = {Nature},
+	Title = {One thing},
+	Year = {2021}}
+
+@article{Smit20a,
+	Author = {B Smith},
+	Journal = {Nature},
+	Title = {Two things},
+	Year = {2020}}
+
+@article{Smit20b,
+	Author = {B Smith},
+	Journal = {Science},
+	Title = {Three things},
+	Year = {2020}}
+"""
+
+INCOMING = """@article{mann2021,
+  author = {Mann, A.}, title = {{One Thing}}, journal = {Nature}, year = {2021}
+}
+
+@article{mann2021b,
+  author = {Mann, A.}, title = {Another thing}, journal = {Nature}, year = {2021},
+  doi = {10.1/x}, pages = {1-2}
+}
+"""
+
+
+def test_assign_keys():
+    assert assign_keys("Mann21", [], 1) == (["Mann21"], {})
+    assert assign_keys("Mann21", [], 2) == (["Mann21a", "Mann21b"], {})
+    assert assign_keys("Mann21", ["Mann21"], 1) == (["Mann21b"], {"Mann21": "Mann21a"})
+    assert assign_keys("Smit20", ["Smit20a", "Smit20b"], 2) == (["Smit20c", "Smit20d"], {})
+    # gaps in the existing suffixes are filled first
+    assert assign_keys("Smit20", ["Smit20a", "Smit20c"], 1) == (["Smit20b"], {})
+
+
+def test_merge_bib():
+    with tempfile.TemporaryDirectory() as d:
+        bibfile, other = os.path.join(d, "cdl.bib"), os.path.join(d, "other.bib")
+        with open(bibfile, "w") as f:
+            f.write(TARGET)
+        with open(other, "w") as f:
+            f.write(INCOMING)
+
+        result = merge_bib(bibfile, other, verbose=False)
+        assert result.added == {"Mann21b": "mann2021b"}
+        assert result.duplicates == {"mann2021": "Mann21a"}
+        assert result.renames == {"Mann21": "Mann21a"}
+
+        # new entries are formatted like the rest of the file
+        with open(bibfile) as f:
+            merged = f.read()
+        assert merged == TARGET.replace("{Mann21,", "{Mann21a,") + """
+@article{Mann21b,
+	Author = {A Mann},
+	Journal = {Nature},
+	Pages = {1--2},
+	Title = {Another thing},
+	Year = {2021}}
+"""
+
+
+def test_key_base_index():
+    with tempfile.TemporaryDirectory() as d:
+        bibfile = os.path.join(d, "cdl.bib")
+        with open(bibfile, "w") as f:
+            f.write(TARGET)
+        index = EntryIndex(bibfile)
+        bases = KeyBaseIndex(index)
+        assert bases.keys("Mann21") == ["Mann21"]
+        assert sorted(bases.keys("Smit20")) == ["Smit20a", "Smit20b"]
+        assert bases.keys("Jone19") == []
+        bases.remove("Mann21")
+        bases.add("Mann21a")
+        bases.save()
+        index.close()
+
+        # the saved index is reused while the file is unchanged...
+        index = EntryIndex(bibfile)
+        assert KeyBaseIndex(index).keys("Mann21") == ["Mann21a"]
+        index.close()
+
+        # ...and rebuilt from the file's keys once something else changes it
+        with open(bibfile, "a") as f:
+            f.write("\n@misc{Jone19,\n\tTitle = {Four},\n\tYear = {2019}}\n")
+        index = EntryIndex(bibfile)
+        bases = KeyBaseIndex(index)
+        assert bases.keys("Mann21") == ["Mann21"]
+        assert bases.keys("Jone19") == ["Jone19"]
+        index.close()
+
+
+def test_add_entries():
+    with tempfile.TemporaryDirectory() as d:
+        bibfile = os.path.join(d, "cdl.bib")
+        with open(bibfile, "w") as f:
+            f.write(TARGET)
+
+        # (entries are added one by one, so the duplicate is found before
+        # the existing entry is renamed)
+        result = add_entries(bibfile, INCOMING.encode("utf-8"), verbose=False)
+        assert result.added == {"Mann21b": "mann2021b"}
+        assert result.duplicates == {"mann2021": "Mann21"}
+        assert result.renames == {"Mann21": "Mann21a"}
+
+        # the same result as merge, formatted like the rest of the file
+        with open(bibfile) as f:
+            assert f.read() == TARGET.replace("{Mann21,", "{Mann21a,") + """
+@article{Mann21b,
+\tAuthor = {A Mann},
+\tJournal = {Nature},
+\tPages = {1--2},
+\tTitle = {Another thing},
+\tYear = {2021}}
+"""
+
+        # adding an entry again finds the duplicate through the saved key bases
+        result = add_entries(bibfile, INCOMING.encode("utf-8"), verbose=False)
+        assert result.added == {}
+        assert result.duplicates == {"mann2021": "Mann21a", "mann2021b": "Mann21b"}
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("ok")
@@ -0,0 +1,49 @@
+"""
+Tests of the author name parser (names.py).
+
+Run with `python bibcheck/test_names.py` (or pytest).
+"""
+
+from names import default_parser, split_outside_braces
+
+
+parser = default_parser()
+
+
+def test_split_outside_braces():
+    assert split_outside_braces("A {Geo Team} B", " ") == ["A", "{Geo Team}", "B"]
+    assert split_outside_braces("{Smith, Jones}, A", ",") == ["{Smith, Jones}", " A"]
+    assert split_outside_braces("{Centers for Disease Control", " ") == ["{Centers", "for", "Disease", "Control"]
+
+
+def test_parse():
+    name = parser.parse("Ludwig van Beethoven")
+    assert (name.first, name.von, name.last) == (("Ludwig",), ("van",), ("Beethoven",))
+    name = parser.parse("van Beethoven, Ludwig")
+    assert (name.first, name.von, name.last, name.surname_part) == (
+        ("Ludwig",), ("van",), ("Beethoven",), "van Beethoven"
+    )
+    name = parser.parse("Smith, John, Jr.")
+    assert (name.first, name.last, name.jr) == (("John",), ("Smith",), ("Jr.",))
+
+
+def test_braced_groups():
+    # braced corporate names and surnames are single words
+    assert parser.parse("{Geo Team}").last == ("{Geo Team}",)
+    assert parser.parse("R {La Joie}").last == ("{La Joie}",)
+    assert parser.surnames("{Geo Team} and R {La Joie}") == ["Geo Team", "La Joie"]
+    assert parser.last_names("{Geo Team} and R {La Joie} and M {\\v C}adik") == ["GeoTeam", "LaJoie", "Cadik"]
+    assert parser.reformat("{National Center for PTSD (VA)}") == "{National Center for PTSD (VA)}"
+    assert parser.reformat("La Joie, R") == "R {La Joie}"
+
+
+def test_reformat():
+    assert parser.reformat("JD Manning and A.B. Smith") == "J D Manning and A B Smith"
+    assert parser.reformat("Beethoven, LV") == "L V Beethoven"
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("ok")
@@ -0,0 +1,172 @@
+"""
+Tests of the byte-offset entry index (offsets.py).
+
+Run with `python bibcheck/test_offsets.py` (or pytest).
+"""
+
+import os
+import tempfile
+
+from offsets import EntryIndex
+
+
+BIB = b"""% comment
+@article{Mann21,
+	Author = {A Mann},
+	Year = {2021}}
+
+@article{Smit20,
+	Author = {B Smith},
+	Year = {2020}}
+
+@article{Jone19,
+	Author = {C Jones},
+	Year = {2019}}
+"""
+
+NEW = b"@misc{Unst22,\n\tTitle = {New},\n\tYear = {2022}}"
+
+
+class RecordingIndex(EntryIndex):
+    """An EntryIndex that records where each scan of the file started."""
+
+    def scan(self, start=0):
+        self.scans = getattr(self, "scans", []) + [start]
+        super().scan(start)
+
+
+def write(fname, data):
+    with open(fname, "wb") as f:
+        f.write(data)
+
+
+def read(fname):
+    with open(fname, "rb") as f:
+        return f.read()
+
+
+def check(index):
+    # every indexed entry is where the index says it is, both in the index's
+    # view and in the file, and a fresh index agrees
+    data = read(index.bibfile)
+    for key, (offset, length, _) in index.entries.items():
+        raw = data[offset : offset + length]
+        assert raw.startswith(b"@") and raw.endswith(b"}") and (b"{" + key.encode() + b",") in raw
+        assert index.raw(key) == raw
+    fresh = EntryIndex(index.bibfile, fname=index.fname + ".fresh")
+    assert fresh.entries == index.entries
+    fresh.close()
+
+
+def test_index():
+    with tempfile.TemporaryDirectory() as d:
+        bibfile = os.path.join(d, "cdl.bib")
+        write(bibfile, BIB)
+        index = EntryIndex(bibfile)
+        assert list(index.keys()) == ["Mann21", "Smit20", "Jone19"]
+        assert index.raw("Smit20") == b"@article{Smit20,\n\tAuthor = {B Smith},\n\tYear = {2020}}"
+        assert index.raw("Missing") is None
+        assert index.refresh() is False
+        index.close()
+
+        # a saved index is reused without scanning the file
+        index = RecordingIndex(bibfile)
+        assert not hasattr(index, "scans")
+        assert index.raw("Jone19").startswith(b"@article{Jone19,")
+        index.close()
+
+
+def test_append():
+    with tempfile.TemporaryDirectory() as d:
+        bibfile = os.path.join(d, "cdl.bib")
+        write(bibfile, BIB)
+        EntryIndex(bibfile).close()
+
+        index = RecordingIndex(bibfile)
+        index.append(NEW)
+        # only the appended part is scanned
+        assert index.scans == [len(BIB.rstrip(b"\n"))]
+        assert read(bibfile) == BIB + b"\n" + NEW + b"\n"
+        assert index.raw("Unst22") == NEW
+        check(index)
+        index.close()
+
+
+def test_no_trailing_newline():
+    with tempfile.TemporaryDirectory() as d:
+        bibfile = os.path.join(d, "cdl.bib")
+        write(bibfile, BIB.rstrip(b"\n"))
+        index = EntryIndex(bibfile)
+        index.append(NEW)
+        assert read(bibfile) == BIB + b"\n" + NEW + b"\n"
+        check(index)
+
+        index.replace("Jone19", b"@article{Jone19,\n\tYear = {2019}}")
+        write(bibfile, read(bibfile).rstrip(b"\n"))
+        index.refresh()
+        assert index.raw("Unst22") == NEW
+        check(index)
+        index.close()
+
+
+def test_external_edit():
+    with tempfile.TemporaryDirectory() as d:
+        bibfile = os.path.join(d, "cdl.bib")
+        write(bibfile, BIB)
+        EntryIndex(bibfile).close()
+
+        # an edit before the end of the file (here, making it longer) means
+        # the whole file is rescanned
+        write(bibfile, BIB.replace(b"{A Mann}", b"{A Mann and B Smith}") + b"\n" + NEW + b"\n")
+        index = RecordingIndex(bibfile)
+        assert index.scans == [0]
+        assert list(index.keys()) == ["Mann21", "Smit20", "Jone19", "Unst22"]
+        check(index)
+
+        # as does removing an entry
+        write(bibfile, BIB.replace(b"@article{Smit20,\n\tAuthor = {B Smith},\n\tYear = {2020}}\n\n", b""))
+        index.refresh()
+        assert index.scans == [0, 0]
+        assert list(index.keys()) == ["Mann21", "Jone19"]
+        check(index)
+        index.close()
+
+
+def test_replace():
+    with tempfile.TemporaryDirectory() as d:
+        bibfile = os.path.join(d, "cdl.bib")
+        write(bibfile, BIB)
+        index = EntryIndex(bibfile)
+
+        longer = b"@article{Mann21,\n\tAuthor = {A Mann},\n\tTitle = {A much longer entry},\n\tYear = {2021}}"
+        index.replace("Mann21", longer)
+        assert index.raw("Mann21") == longer
+        assert index.raw("Smit20") == b"@article{Smit20,\n\tAuthor = {B Smith},\n\tYear = {2020}}"
+        check(index)
+
+        shorter = b"@article{Smit20,\n\tYear = {2020}}"
+        index.replace("Smit20", shorter)
+        assert index.raw("Smit20") == shorter
+        assert index.raw("Jone19").startswith(b"@article{Jone19,")
+        check(index)
+
+        # a replacement with a different key renames the entry in the index
+        index.replace("Mann21", longer.replace(b"{Mann21,", b"{Mann21a,"))
+        assert "Mann21" not in index and index.raw("Mann21a").startswith(b"@article{Mann21a,")
+        assert sorted(index.keys(), key=lambda k: index.entries[k][0]) == ["Mann21a", "Smit20", "Jone19"]
+        check(index)
+        index.close()
+
+        # the file is otherwise unchanged
+        assert read(bibfile) == BIB.replace(b"{Mann21,", b"{Mann21a,").replace(
+            b"\tAuthor = {A Mann},\n", b"\tAuthor = {A Mann},\n\tTitle = {A much longer entry},\n"
+        ).replace(b"\tAuthor = {B Smith},\n", b"")
+        # and the saved index matches it
+        assert EntryIndex(bibfile).raw("Smit20") == shorter
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("ok")
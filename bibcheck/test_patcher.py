@@ -0,0 +1,101 @@
+"""
+Tests of in-place patching of .bib files (patcher.py).
+
+Run with `python bibcheck/test_patcher.py` (or pytest).
+"""
+
+import os
+import tempfile
+
+from helpers import bib_parser
+from patcher import patch_bibliography, patch_entry
+
+
+ENTRY = b"""@article{Mann21,
+	Author = {A Mann and B Smith},
+	Journal = {Nature},
+	Pages = "1-2",
+	Title = {A {DNA} study},
+	Year = {2021}}"""
+
+BIB = b"""% a comment that must survive
+@string{nat = "Nature"}
+
+""" + ENTRY + b"""
+
+@book{Smit20,
+  author = {B Smith},
+  title = {Another},
+  year = 2020
+}
+"""
+
+CDL = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "cdl.bib")
+
+
+def test_no_fixes():
+    assert patch_entry(ENTRY, {}) == ENTRY
+    assert patch_entry(ENTRY, {"journal": "Nature"}) == ENTRY
+
+
+def test_patch_entry():
+    patched = patch_entry(ENTRY, {"title": "A {DNA} Study", "pages": "1--2", "journal": None, "ID": "Mann21a"})
+    assert patched == b"""@article{Mann21a,
+	Author = {A Mann and B Smith},
+	Pages = {1--2},
+	Title = {A {DNA} Study},
+	Year = {2021}}"""
+
+
+def test_added_fields():
+    # new fields follow the separator and capitalization of the last field
+    assert patch_entry(ENTRY, {"volume": "5"}).endswith(b"Year = {2021},\n\tVolume = {5}}")
+    raw = b"@book{Smit20,\n  author = {B Smith},\n  year = 2020\n}"
+    assert patch_entry(raw, {"year": "2020", "title": "T"}) == (
+        b"@book{Smit20,\n  author = {B Smith},\n  year = {2020},\n  title = {T}\n}"
+    )
+
+
+def test_aliases():
+    parser = bib_parser()
+    raw = b"@article{Mann21,\n\tAuthors = {A Mann},\n\tYear = {2021}}"
+    assert patch_entry(raw, {"author": "A Mann and B Smith"}, aliases=parser.alt_dict) == (
+        b"@article{Mann21,\n\tAuthors = {A Mann and B Smith},\n\tYear = {2021}}"
+    )
+
+
+def test_patch_bibliography():
+    with tempfile.TemporaryDirectory() as d:
+        infile, outfile = os.path.join(d, "in.bib"), os.path.join(d, "out.bib")
+        with open(infile, "wb") as f:
+            f.write(BIB)
+
+        assert patch_bibliography(infile, outfile, {}) == 0
+        with open(outfile, "rb") as f:
+            assert f.read() == BIB
+
+        # only the patched entry changes, and the result parses to the
+        # corrected values
+        assert patch_bibliography(infile, infile, {"Smit20": {"title": "Another book"}, "Missing": {}}) == 1
+        with open(infile, "rb") as f:
+            patched = f.read()
+        assert patched == BIB.replace(b"title = {Another}", b"title = {Another book}")
+        entries = {e["ID"]: e for e in bib_parser().parse(patched.decode("utf-8")).entries}
+        assert entries["Smit20"]["title"] == "Another book"
+        assert entries["Mann21"]["title"] == "A {DNA} study"
+
+
+def test_round_trip_cdl():
+    # copying cdl.bib without patches reproduces it byte for byte
+    with tempfile.TemporaryDirectory() as d:
+        outfile = os.path.join(d, "cdl.bib")
+        assert patch_bibliography(CDL, outfile, {}) == 0
+        with open(CDL, "rb") as a, open(outfile, "rb") as b:
+            assert a.read() == b.read()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("ok")
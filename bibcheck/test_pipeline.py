@@ -0,0 +1,105 @@
+"""
+Tests of bounded producer/consumer pipelines (pipeline.py).
+
+Run with `python bibcheck/test_pipeline.py` (or pytest).
+"""
+
+import threading
+import time
+
+from pipeline import run
+
+
+def test_order():
+    # with one worker per stage, items come out in input order
+    assert list(run(range(100), [(lambda x: x + 1, 1), (lambda x: 2 * x, 1)], queue_size=4)) == [
+        2 * (x + 1) for x in range(100)
+    ]
+
+
+def test_workers():
+    def slow(x):
+        time.sleep(0.001 * (x % 3))
+        return x
+
+    results = list(run(range(200), [(slow, 8), (lambda x: x if x % 2 else None, 3)], queue_size=2))
+    assert sorted(results) == list(range(1, 200, 2))  # None drops an item
+
+
+def test_empty():
+    assert list(run([], [(lambda x: x, 4)])) == []
+
+
+def test_bounded():
+    # a blocked stage holds up the producer once the queues are full
+    produced = []
+    gate = threading.Event()
+
+    def source():
+        for i in range(1000):
+            produced.append(i)
+            yield i
+
+    def blocked(x):
+        gate.wait()
+        return x
+
+    results = run(source(), [(blocked, 2)], queue_size=3)
+    thread = threading.Thread(target=lambda: results.__next__())
+    thread.start()
+    time.sleep(0.2)
+    # 2 items in the workers, 3 queued, and 1 waiting to be put
+    assert len(produced) <= 6
+    gate.set()
+    thread.join()
+    assert len(list(results)) == 999
+    assert len(produced) == 1000
+
+
+def test_shutdown():
+    before = threading.active_count()
+    assert len(list(run(range(50), [(lambda x: x, 4), (lambda x: x, 4)]))) == 50
+    assert threading.active_count() == before
+
+
+def test_stage_failure():
+    seen = []
+
+    def fail(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return x
+
+    try:
+        for x in run(range(10), [(fail, 2), (lambda x: x, 1)]):
+            seen.append(x)
+    except ValueError as e:
+        assert str(e) == "bad item"
+    else:
+        raise AssertionError("expected the stage's exception")
+    # the other items are still processed before the exception is raised
+    assert sorted(seen) == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+
+
+def test_source_failure():
+    def source():
+        yield 1
+        yield 2
+        raise OSError("read error")
+
+    seen = []
+    try:
+        for x in run(source(), [(lambda x: x, 3)]):
+            seen.append(x)
+    except OSError:
+        pass
+    else:
+        raise AssertionError("expected the source's exception")
+    assert sorted(seen) == [1, 2]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("ok")
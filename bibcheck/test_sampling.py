@@ -0,0 +1,100 @@
+"""
+Tests of stratified sampling and error-rate estimates (sampling.py), and of
+bibverify's sampling options.
+
+Run with `python bibcheck/test_sampling.py` (or pytest).
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import sampling
+
+
+def entries(n, **fields):
+    return {f"K{i}": {"ENTRYTYPE": "article", "year": "2021", "journal": "Nature", **fields} for i in range(n)}
+
+
+def test_sample_size():
+    # the textbook n0 = 1.96^2 / (4 * 0.05^2) = 385, reduced for small populations
+    assert sampling.sample_size(10**9, 0.95, 0.05) == 385
+    assert sampling.sample_size(1000, 0.95, 0.05) == 278
+    assert sampling.sample_size(50, 0.95, 0.02) == 49
+
+
+def test_stratify():
+    population = {**entries(60), **{f"S{i}": {"ENTRYTYPE": "article", "year": "1995", "journal": "Science"}
+                                   for i in range(40)}}
+    assert {s: len(keys) for s, keys in sampling.stratify(population, 10).items()} == {
+        ("article", "2020s", "nature"): 60, ("article", "1990s", "science"): 40
+    }
+
+    # strata expected to get fewer than two samples are collapsed, venue first
+    for venue in ("Neuron", "Cell"):
+        population.update({f"{venue}{i}": {"ENTRYTYPE": "article", "year": "2021", "journal": venue}
+                           for i in range(3)})
+    population["B0"] = {"ENTRYTYPE": "book", "year": "2021", "publisher": "MIT"}
+    strata = sampling.stratify(population, 50)
+    assert sorted(strata[("article", "2020s", "*")]) == ["Cell0", "Cell1", "Cell2", "Neuron0", "Neuron1", "Neuron2"]
+    assert strata[("*", "*", "*")] == ["B0"]
+    assert sum(len(keys) for keys in strata.values()) == 107
+
+
+def test_allocate():
+    strata = {"a": list(range(60)), "b": list(range(30)), "c": list(range(10))}
+    assert sampling.allocate(strata, 10) == {"a": 6, "b": 3, "c": 1}
+    assert sampling.allocate(strata, 11) == {"a": 7, "b": 3, "c": 1}  # largest remainder (6.6)
+    assert sampling.allocate({"a": [1, 2], "b": [3]}, 2) == {"a": 1, "b": 1}  # at least one each
+    assert sampling.allocate({"a": [1]}, 5) == {"a": 1}  # no more than the stratum has
+
+
+def test_draw():
+    population = entries(100)
+    sample, strata = sampling.draw(population, 10, seed=1)
+    assert sum(len(keys) for keys in sample.values()) == 10
+    assert sampling.draw(population, 10, seed=1) == (sample, strata)
+    assert sampling.draw(population, 10, seed=2)[0] != sample
+
+
+def test_wilson_interval():
+    lower, upper = sampling.wilson_interval(0, 10)
+    assert abs(lower) < 1e-9 and abs(upper - 0.2775) < 1e-4
+    lower, upper = sampling.wilson_interval(5, 10)
+    assert abs(lower - 0.2366) < 1e-4 and abs(upper - 0.7634) < 1e-4
+    assert sampling.wilson_interval(0, 0) == (0.0, 1.0)
+
+
+def test_estimate():
+    strata = {"a": list(range(80)), "b": list(range(20))}
+
+    # strata are weighted by their population shares
+    p, lower, upper = sampling.estimate({"a": [0, 0, 0, 1], "b": [1, 1]}, strata)
+    assert abs(p - (0.8 * 0.25 + 0.2 * 1.0)) < 1e-9
+    assert lower < p < upper
+
+    # without variation within strata, the pooled Wilson interval is used
+    p, lower, upper = sampling.estimate({"a": [0, 0, 0, 0], "b": [0, 0]}, strata)
+    assert (p, lower) == (0.0, 0.0) and (lower, upper) == sampling.wilson_interval(0, 6)
+
+    # strata without outcomes are left out, and the rest reweighted
+    assert sampling.estimate({"a": [1, 0], "b": []}, strata)[0] == 0.5
+
+
+def test_verify_options():
+    from typer.testing import CliRunner
+    from bibverify import app
+
+    runner = CliRunner()
+    for args in (["--margin", "0"], ["--margin", "1.5"], ["--sample", "10", "--margin", "0.02"],
+                 ["--sample", "0"], ["--confidence", "0.9"], ["--sample", "10", "--confidence", "95"]):
+        result = runner.invoke(app, ["verify", "missing.bib", *args])
+        assert result.exit_code == 1 and "Error: --" in result.output, args
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("ok")
@@ -0,0 +1,119 @@
+"""
+Tests of the full-text search index (search.py).
+
+Run with `python bibcheck/test_search.py` (or pytest).
+"""
+
+import os
+import tempfile
+
+from search import SearchIndex, fts_query
+
+
+BIB = """@article{Mann21,
+	Author = {A Mann and B Smith},
+	Journal = {Nature},
+	Title = {Context reinstatement in memory},
+	Year = {2021}}
+
+@inproceedings{Smit20,
+	Author = {B Smith},
+	Booktitle = {Proceedings of the Cognitive Science Society},
+	Title = {Hippocampal ensemble codes},
+	Year = {2020}}
+
+@article{Jone19,
+	Author = {C Jones},
+	Journal = {Psychological Review},
+	Title = {A {\\'e}tude of {E}ntropy},
+	Year = {2019}}
+"""
+
+
+def keys(db, query):
+    return [r[0] for r in db.search(query)]
+
+
+def check_fts(db):
+    # the full-text index agrees with the entries table
+    db.db.execute("INSERT INTO fts(fts) VALUES ('integrity-check')")
+    assert db.db.execute("SELECT COUNT(*) FROM fts").fetchone()[0] == len(db)
+
+
+def test_fts_query():
+    assert fts_query("context memory") == '"context"* "memory"*'
+    assert fts_query("author:mann title:Context") == 'author : "mann"* title : "Context"*'
+    assert fts_query("Author:mann") == 'author : "mann"*'
+    assert fts_query("doi:10.1/x") == '"doi"* "10"* "1"* "x"*'  # not a column
+    # quotes, parentheses and FTS operators are searched for as words rather
+    # than interpreted, so no search is a syntax error
+    assert fts_query('"context reinstatement"') == '"context"* "reinstatement"*'
+    assert fts_query("memory OR NOT -codes (x)") == '"memory"* "OR"* "NOT"* "codes"* "x"*'
+    assert fts_query("NEAR(a b) * ^") == '"NEAR"* "a"* "b"*'
+    assert fts_query(":: ---") == ""
+
+
+def test_search():
+    with tempfile.TemporaryDirectory() as d:
+        bibfile = os.path.join(d, "cdl.bib")
+        with open(bibfile, "w") as f:
+            f.write(BIB)
+        db = SearchIndex(bibfile)
+        assert db.refresh() == 3
+        assert db.refresh() == 0  # unchanged file
+
+        assert keys(db, "context reinst") == ["Mann21"]
+        assert sorted(keys(db, "smith")) == ["Mann21", "Smit20"]
+        assert keys(db, "author:smith title:hippocampal") == ["Smit20"]
+        assert keys(db, "title:smith") == []
+        assert keys(db, "cognitive 2020") == ["Smit20"]  # booktitle as the venue
+        assert keys(db, "etude entropy") == ["Jone19"]  # latex accents and braces removed
+        assert keys(db, '"memory" OR (nature)') == []  # "or" must match a word too
+        assert keys(db, "") == []
+        check_fts(db)
+        db.close()
+
+
+def test_refresh():
+    with tempfile.TemporaryDirectory() as d:
+        bibfile = os.path.join(d, "cdl.bib")
+        with open(bibfile, "w") as f:
+            f.write(BIB)
+        db = SearchIndex(bibfile)
+        db.refresh()
+
+        # an edited entry, a deleted entry and a renamed key
+        edited = (BIB.replace("Hippocampal ensemble codes", "Cortical population codes")
+                  .replace("{Mann21,", "{Mann21a,"))
+        edited = edited[: edited.index("@article{Jone19")].rstrip() + "\n"
+        with open(bibfile, "w") as f:
+            f.write(edited)
+        assert db.refresh() == 4  # Smit20 updated, Mann21 --> Mann21a, Jone19 removed
+        assert sorted(k for k, in db.db.execute("SELECT key FROM entries")) == ["Mann21a", "Smit20"]
+        assert keys(db, "hippocampal") == []
+        assert keys(db, "cortical") == ["Smit20"]
+        assert keys(db, "context") == ["Mann21a"]
+        assert keys(db, "entropy") == []
+        check_fts(db)
+        db.close()
+
+        # a new connection sees the saved state; rebuild re-reads everything
+        db = SearchIndex(bibfile)
+        assert db.refresh() == 0
+        assert db.refresh(rebuild=True) == 2
+        assert keys(db, "cortical") == ["Smit20"]
+
+        # only new or changed entries are re-read
+        with open(bibfile, "a") as f:
+            f.write("\n@misc{Unst22,\n\tTitle = {Unstaged changes},\n\tYear = {2022}}\n")
+        assert db.refresh() == 1
+        assert keys(db, "unstaged") == ["Unst22"]
+        check_fts(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("ok")
@@ -0,0 +1,128 @@
+"""
+Tests of the sidecar stores (stores.py) and of combining shard results.
+
+Run with `python bibcheck/test_stores.py` (or pytest).
+"""
+
+from multiprocessing import Pool
+import json
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from stores import JSONStore, RenameLog, VerificationStore, atomic_write, sidecar_path
+
+
+def save_keys(args):
+    # one "shard": sets its own keys, saving after each one
+    fname, shard = args
+    store = JSONStore(fname)
+    for i in range(20):
+        store.set(f"{shard}-{i}", i)
+        store.save()
+
+
+def test_atomic_write():
+    with tempfile.TemporaryDirectory() as d:
+        fname = os.path.join(d, "out.txt")
+        with atomic_write(fname) as f:
+            f.write("one")
+        try:
+            with atomic_write(fname) as f:
+                f.write("two")
+                raise RuntimeError("interrupted")
+        except RuntimeError:
+            pass
+        with open(fname) as f:
+            assert f.read() == "one"  # unchanged by the failed write
+        assert os.listdir(d) == ["out.txt"]  # and no temporary file left behind
+
+
+def test_save_merge():
+    with tempfile.TemporaryDirectory() as d:
+        fname = os.path.join(d, "cdl.verified.json")
+        JSONStore(fname).save()  # nothing changed: nothing written
+        assert not os.path.exists(fname)
+
+        a, b = JSONStore(fname), JSONStore(fname)
+        a.set("Mann21", 1)
+        a.set("Smit20", 2)
+        a.save()
+        b.set("Jone19", 3)
+        b.save()  # keeps a's keys
+        assert JSONStore(fname).data == {"Mann21": 1, "Smit20": 2, "Jone19": 3}
+
+        a.remove("Smit20")
+        a.rename({"Mann21": "Mann21a"})
+        a.save()  # keeps b's key
+        assert JSONStore(fname).data == {"Mann21a": 1, "Jone19": 3}
+
+        b.set("Jone19", 4)
+        b.save(merge=False)  # b's view of the file replaces it
+        assert JSONStore(fname).data == {"Mann21": 1, "Smit20": 2, "Jone19": 4}
+
+
+def test_save_merge_processes():
+    with tempfile.TemporaryDirectory() as d:
+        fname = os.path.join(d, "cdl.verified.json")
+        with Pool(4) as pool:
+            pool.map(save_keys, [(fname, shard) for shard in range(4)])
+        assert len(JSONStore(fname)) == 80
+
+
+def test_merge_shards():
+    from bibverify import VERIFIER_VERSION, merge
+
+    with tempfile.TemporaryDirectory() as d:
+        bibfile = os.path.join(d, "cdl.bib")
+        counts = dict(verified=1, errors=0, warnings=0, cached=0, deferred=0, prescreened=0,
+                      requests_sent=1, requests_coalesced=0)
+        entries = [{"ID": "Mann21", "title": "A"}, {"ID": "Smit20", "title": "B"}]
+        files = []
+        for i, entry in enumerate(entries, 1):
+            shard = VerificationStore(None, VERIFIER_VERSION)
+            shard.record(entry, "verified")
+            files.append(os.path.join(d, f"cdl.shard-{i}-of-2.json"))
+            with open(files[-1], "w") as f:
+                json.dump({"version": VERIFIER_VERSION, "bibfile": bibfile, "shard": [i, 2],
+                           "counts": counts, "discrepancies": [], "store": shard.data,
+                           "dois": {entry["ID"]: f"10.1/{i}"}, "venues": {}}, f)
+
+        merge(files, update_stores=True)
+        store = VerificationStore(sidecar_path(bibfile, "verified"), VERIFIER_VERSION)
+        assert all(store.lookup(e) is not None for e in entries)
+        assert JSONStore(sidecar_path(bibfile, "dois")).data == {"Mann21": "10.1/1", "Smit20": "10.1/2"}
+
+
+def test_rename_log():
+    with tempfile.TemporaryDirectory() as d:
+        log = RenameLog(os.path.join(d, "cdl.renames.json"))
+        log.record({"Smit20": "Smit20a"})
+        log.record({"Smit20a": "Smit20b"})  # composed
+        assert log.data == {"Smit20": "Smit20b", "Smit20a": "Smit20b"}
+        log.record({"Smit20b": "Smit20"})  # renamed back
+        assert log.data == {"Smit20a": "Smit20", "Smit20b": "Smit20"}
+
+        # a key given to another entry no longer maps to the old entry's key
+        log.record({"Mann21": "Mann21a"})
+        log.record({"Mann21b": "Mann21"})
+        assert log.data == {"Smit20a": "Smit20", "Smit20b": "Smit20", "Mann21b": "Mann21"}
+
+        # keys swapped in one step both stay
+        log.record({"Jone19a": "Jone19b", "Jone19b": "Jone19a"})
+        assert log.data["Jone19a"] == "Jone19b" and log.data["Jone19b"] == "Jone19a"
+
+        log.save()
+        assert RenameLog(log.fname).data == log.data
+        assert log.pending({"Smit20", "Mann21", "Jone19a"}) == {
+            "Smit20a": "Smit20", "Smit20b": "Smit20", "Mann21b": "Mann21", "Jone19b": "Jone19a"
+        }
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+    print("ok")
@@ -23,36 +23,168 @@ License: MIT
 import sys
 sys.path.append('bibcheck')
 
-import requests
+from collections import Counter
+import hashlib
+import json
+import os
 import time
 import typer
-import bibtexparser as bp
-from typing import Optional, Dict, List, Tuple
+from typing import Callable, Optional, Dict, List, Tuple
 from urllib.parse import quote
-from difflib import SequenceMatcher
-from tqdm import tqdm
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
 
-app = typer.Typer()
+import matching
+from names import default_parser
+from patcher import patch_bibliography
+from metrics import Metrics
+from stores import DOIIndex, VenueAuthority, VerificationStore, sidecar_path
+
+try:
+    # plain help: newer versions of typer format it with rich, which takes
+    # longer to import than everything else the CLI needs at startup
+    app = typer.Typer(rich_markup_mode=None)
+except TypeError:  # typer < 0.7
+    app = typer.Typer()
+
+# Bump whenever the matching or comparison logic changes, so that results
+# cached by earlier versions are re-verified
+VERIFIER_VERSION = "1.4"
+
+# Fields checked by verify_entry, keyed by the prefix of their discrepancy messages
+DISCREPANCY_FIELDS = {
+    'Volume': 'volume',
+    'Issue/Number': 'number',
+    'Pages': 'pages',
+    'Year': 'year',
+}
+
+
+# Base URL of the CrossRef REST API (override with --api-url, e.g. to use a mock server)
+CROSSREF_API = "https://api.crossref.org"
+
+# Responses worth retrying (rate limited, or a transient server error)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+METRIC_DESCRIPTIONS = {
+    'crossref_requests_total': 'HTTP requests sent to CrossRef (including retries)',
+    'crossref_request_errors_total': 'CrossRef lookups that failed after all retries',
+    'crossref_retries_total': 'CrossRef requests retried after a 429, 5xx or connection error',
+    'crossref_requests_coalesced_total': 'Lookups served by an identical in-flight request',
+    'crossref_request_seconds': 'Latency of individual CrossRef HTTP requests',
+    'crossref_requests_in_flight': 'CrossRef HTTP requests currently in progress',
+    'crossref_requests_in_flight_max': 'Most CrossRef HTTP requests in progress at once',
+    'crossref_requests_per_second': 'Average CrossRef request rate over the run',
+    'matching_seconds': 'Time spent scoring CrossRef candidates against entries',
+    'entry_seconds': 'Time spent verifying each entry',
+    'store_hits_total': 'Entries whose stored result was reused',
+    'store_misses_total': 'Entries with no usable stored result',
+    'store_hit_ratio': 'Fraction of store lookups that were hits',
+    'doi_index_hits_total': 'Entries looked up by a DOI from the DOI index',
+    'entries_verified_total': 'Entries verified',
+    'entries_errors_total': 'Entries with discrepancies',
+    'entries_warnings_total': 'Entries that could not be verified',
+    'entries_deferred_total': 'Entries deferred because the time budget was spent',
+    'entries_prescreened_total': 'Entries reported without querying CrossRef',
+}
+
+# Years outside this range can't be right (for a numeric year)
+PLAUSIBLE_YEARS = (1600, time.localtime().tm_year + 1)
+
+# Volumes with an issue number tacked on, e.g. 75(3)
+VOLUME_WITH_ISSUE = re.compile(r'\d+\s*\(\d+\)')
+
+# Preprints (e.g. arXiv) and online-first articles deliberately give their DOI
+# as the volume, in this form: doi.org/10.48550/arXiv.2404.14619
+DOI_VOLUME = re.compile(r'doi\.org/10\.\S+')
+
+
+def discrepancy_fields(discrepancies: List[str]) -> List[str]:
+    """Return the fields that a list of discrepancy messages refers to."""
+    return sorted({field for d in discrepancies for prefix, field in DISCREPANCY_FIELDS.items()
+                   if d.startswith(prefix)})
+
+
+class SingleFlight:
+    """
+    Deduplicates identical calls that are in flight at the same time.
+
+    The first caller for a given key runs the function; callers that arrive
+    while it is still running wait for it and share its result (or exception).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.issued = 0  # calls that actually ran
+        self.coalesced = 0  # calls that were served by another caller's run
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self.in_flight[key] = {'done': threading.Event(), 'result': None, 'error': None}
+                self.issued += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            call['done'].set()
+        return call['result']
 
 
 class BibVerifier:
     """Verifies bibliographic entries against external sources."""
 
-    def __init__(self, verbose: bool = False, max_workers: int = 5):
+    def __init__(self, verbose: bool = False, max_workers: int = 5,
+                 store: Optional[VerificationStore] = None, dois: Optional[DOIIndex] = None,
+                 venues: Optional[VenueAuthority] = None, api_url: str = CROSSREF_API):
+        # requests (like bibtexparser and tqdm) is only imported when needed,
+        # so that commands like info and --help start quickly
+        import requests
+
         self.verbose = verbose
         self.max_workers = max_workers
+        self.api_url = api_url.rstrip('/')
         self.session = requests.Session()
+        # Keep a connection per worker (the default pool holds 10)
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(max_workers, 10))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.session.headers.update({
             'User-Agent': 'BibTeX-Verification-Tool/1.0 (mailto:research@example.com)'
         })
         self.verified_count = 0
         self.error_count = 0
         self.warning_count = 0
+        self.cached_count = 0
         self.discrepancies = []
         self.lock = threading.Lock()  # For thread-safe counter updates
+        self.store = store  # Results of previous runs (None disables caching)
+        self.dois = dois  # DOIs learned from confident matches (None disables)
+        self.venues = venues  # Journal name variants learned from confident matches (None disables)
+        self.local = threading.local()  # Per-thread request state
+        self.flights = SingleFlight()  # Shares identical concurrent CrossRef requests
+        self.deadline = None  # time.monotonic() deadline for budgeted runs
+        self.refresh = False  # Re-verify entries even if they have a stored result
+        self.deferred_count = 0
+        self.prescreened_count = 0  # Entries reported without querying CrossRef
+        self.max_retries = 3  # Retries per request after a 429, 5xx or connection error
+        self.metrics = Metrics(descriptions=METRIC_DESCRIPTIONS)
 
     def log(self, message: str, level: str = "info"):
         """Log a message if verbose mode is enabled."""
@@ -65,25 +197,17 @@ class BibVerifier:
             }.get(level, "•")
             typer.echo(f"{prefix} {message}")
 
-    def similarity_ratio(self, str1: str, str2: str) -> float:
-        """Calculate similarity ratio between two strings."""
-        if not str1 or not str2:
-            return 0.0
-        # Normalize strings for comparison
-        s1 = self.normalize_string(str1)
-        s2 = self.normalize_string(str2)
-        return SequenceMatcher(None, s1, s2).ratio()
+    def similarity_ratio(self, str1: str, str2: str, cutoff: float = 0.0) -> float:
+        """
+        Calculate similarity ratio between two strings.
+
+        Returns 0.0 early if the similarity can't reach cutoff.
+        """
+        return matching.similarity(str1, str2, cutoff=cutoff)
 
     def normalize_string(self, s: str) -> str:
-        """Normalize a string for comparison."""
-        if not s:
-            return ""
-        # Remove LaTeX commands, braces, and extra whitespace
-        s = re.sub(r'\{[^}]*\}', '', s)  # Remove LaTeX braces
-        s = re.sub(r'\\[a-zA-Z]+', '', s)  # Remove LaTeX commands
-        s = re.sub(r'[^a-zA-Z0-9\s]', '', s)  # Remove punctuation
-        s = re.sub(r'\s+', ' ', s)  # Normalize whitespace
-        return s.strip().lower()
+        """Normalize a string for comparison (results are cached)."""
+        return matching.normalize(s)
 
     def extract_doi_from_field(self, doi_field: str) -> Optional[str]:
         """Extract DOI from a DOI field that may contain a URL."""
@@ -93,18 +217,72 @@ class BibVerifier:
         doi = re.sub(r'^https?://(dx\.)?doi\.org/', '', doi_field)
         return doi.strip()
 
+    def fetch_json(self, url: str, params: Optional[Dict] = None) -> Dict:
+        """
+        GET a CrossRef API url and decode the JSON response.
+
+        Identical requests made concurrently by different workers are sent only
+        once. Rate-limited (429), 5xx and connection failures are retried,
+        honouring Retry-After. Raises requests.exceptions.RequestException on
+        failure.
+        """
+        import requests
+
+        def send():
+            with self.metrics.in_flight('crossref_requests_in_flight'), \
+                    self.metrics.timer('crossref_request_seconds'):
+                self.metrics.inc('crossref_requests_total')
+                return self.session.get(url, params=params, timeout=10)
+
+        def fetch():
+            attempt = 0
+            while True:
+                try:
+                    response = send()
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    if not self.should_retry(attempt):
+                        raise
+                    response = None
+                else:
+                    if getattr(response, 'status_code', 200) not in RETRY_STATUSES or not self.should_retry(attempt):
+                        response.raise_for_status()
+                        return response.json()
+                self.metrics.inc('crossref_retries_total')
+                time.sleep(self.retry_delay(response, attempt))
+                attempt += 1
+
+        def fetch_counting_errors():
+            try:
+                return fetch()
+            except requests.exceptions.RequestException:
+                self.metrics.inc('crossref_request_errors_total')
+                raise
+
+        key = (url, tuple(sorted((params or {}).items())))
+        return self.flights.do(key, fetch_counting_errors)
+
+    def should_retry(self, attempt: int) -> bool:
+        return attempt < self.max_retries and not self.out_of_time()
+
+    def retry_delay(self, response, attempt: int) -> float:
+        """Seconds to wait before a retry: the server's Retry-After if given, else exponential backoff."""
+        retry_after = getattr(response, 'headers', {}).get('Retry-After', '') if response is not None else ''
+        if retry_after.strip().isdigit():
+            return min(float(retry_after), 60.0)
+        return min(2.0 ** attempt, 30.0)
+
     def query_crossref_by_doi(self, doi: str) -> Optional[Dict]:
         """Query CrossRef API by DOI."""
         if not doi:
             return None
 
+        import requests
+
         doi = self.extract_doi_from_field(doi)
-        url = f"https://api.crossref.org/works/{quote(doi, safe='')}"
+        url = f"{self.api_url}/works/{quote(doi, safe='')}"
 
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self.fetch_json(url)
 
             if data.get('status') == 'ok':
                 return data.get('message')
@@ -112,6 +290,7 @@ class BibVerifier:
 
         except requests.exceptions.RequestException as e:
             self.log(f"CrossRef API error (DOI lookup): {e}", "warning")
+            self.local.request_failed = True
             return None
 
     def query_crossref_by_metadata(self, title: str, author: Optional[str] = None,
@@ -120,54 +299,64 @@ class BibVerifier:
         if not title:
             return None
 
+        items = self.search_crossref(title, author)
+        if not items:
+            return None
+        with self.metrics.timer('matching_seconds'):
+            return self.best_match(items, title, year)
+
+    def search_crossref(self, title: str, author: Optional[str] = None) -> Optional[List[Dict]]:
+        """Return the top CrossRef search results for a title and optional author."""
+        import requests
+
         # Build query
         query = title
         if author:
             query += f" {author}"
 
-        url = f"https://api.crossref.org/works"
+        url = f"{self.api_url}/works"
         params = {
             'query': query,
             'rows': 3,  # Get top 3 results for better matching
-            'select': 'title,author,published,container-title,volume,issue,page,DOI,publisher,type,ISSN'
+            'select': 'title,author,published,container-title,short-container-title,volume,issue,page,DOI,publisher,type,ISSN'
         }
 
         try:
-            response = self.session.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-
-            items = data.get('message', {}).get('items', [])
-            if not items:
-                return None
+            data = self.fetch_json(url, params)
+            return data.get('message', {}).get('items', [])
 
-            # Find best match by title similarity
-            best_match = None
-            best_score = 0.0
+        except requests.exceptions.RequestException as e:
+            self.log(f"CrossRef API error (metadata lookup): {e}", "warning")
+            self.local.request_failed = True
+            return None
 
-            for item in items:
-                item_title = item.get('title', [''])[0] if item.get('title') else ''
-                similarity = self.similarity_ratio(title, item_title)
+    def best_match(self, items: List[Dict], title: str, year: Optional[str] = None) -> Optional[Dict]:
+        """Pick the search result whose title best matches, or None if none is close enough."""
+        best_match = None
+        best_score = 0.0
 
-                # Also check year if provided
-                if year and 'published' in item:
-                    item_year = item.get('published', {}).get('date-parts', [[None]])[0][0]
-                    if item_year and str(item_year) != str(year):
-                        similarity *= 0.7  # Penalize year mismatch
+        norm_title = self.normalize_string(title)
+        for item in items:
+            item_title = item.get('title', [''])[0] if item.get('title') else ''
+            # Candidates below 0.7 are never returned, so stop scoring them early
+            similarity = matching.ratio(norm_title, self.normalize_string(item_title), cutoff=0.7) \
+                if item_title else 0.0
 
-                if similarity > best_score:
-                    best_score = similarity
-                    best_match = item
+            # Also check year if provided
+            if year and 'published' in item:
+                item_year = item.get('published', {}).get('date-parts', [[None]])[0][0]
+                if item_year and str(item_year) != str(year):
+                    similarity *= 0.7  # Penalize year mismatch
 
-            # Only return if similarity is above threshold
-            if best_score >= 0.7:
-                return best_match
+            if similarity > best_score:
+                best_score = similarity
+                best_match = item
 
-            return None
+        # Only return if similarity is above threshold
+        if best_score >= 0.7:
+            return best_match
 
-        except requests.exceptions.RequestException as e:
-            self.log(f"CrossRef API error (metadata lookup): {e}", "warning")
-            return None
+        return None
 
     def format_authors(self, authors_list: List[Dict]) -> str:
         """Format CrossRef authors list to BibTeX format."""
@@ -187,17 +376,7 @@ class BibVerifier:
         """Extract last names from BibTeX author string."""
         if not author_string:
             return []
-
-        authors = author_string.split(' and ')
-        last_names = []
-
-        for author in authors:
-            parts = author.strip().split()
-            if parts:
-                # Last name is typically the last part
-                last_names.append(parts[-1])
-
-        return last_names
+        return default_parser().surnames(author_string)
 
     def compare_authors(self, bib_authors: str, crossref_authors: List[Dict]) -> Tuple[bool, float]:
         """Compare BibTeX authors with CrossRef authors."""
@@ -211,9 +390,7 @@ class BibVerifier:
             return False, 0.0
 
         # Calculate how many authors match
-        matches = sum(1 for bln in bib_last_names if any(
-            self.similarity_ratio(bln, cln) > 0.85 for cln in crossref_last_names
-        ))
+        matches = matching.count_name_matches(bib_last_names, crossref_last_names, threshold=0.85)
 
         similarity = matches / max(len(bib_last_names), len(crossref_last_names))
         return similarity > 0.7, similarity
@@ -239,7 +416,10 @@ class BibVerifier:
         # Calculate similarities
         title_sim = self.similarity_ratio(title, crossref_title)
         authors_match, author_sim = self.compare_authors(authors, crossref_authors)
-        journal_sim = self.similarity_ratio(journal, crossref_journal) if journal and crossref_journal else 1.0
+        if not (journal and crossref_journal) or self.known_venue(journal, crossref_data):
+            journal_sim = 1.0
+        else:
+            journal_sim = self.similarity_ratio(journal, crossref_journal)
 
         # Log similarities for debugging
         self.log(f"  Title similarity: {title_sim:.2%}", "info")
@@ -267,21 +447,123 @@ class BibVerifier:
         # If we pass all checks, this is a confident match
         return True, "Confident match"
 
-    def verify_entry(self, entry: Dict) -> Tuple[bool, List[str], Dict]:
+    def timed_match(self, entry: Dict, crossref_data: Dict) -> Tuple[bool, str]:
+        with self.metrics.timer('matching_seconds'):
+            return self.is_confident_match(entry, crossref_data)
+
+    def venue_variants(self, crossref_data: Dict) -> Tuple[List[str], List[str]]:
+        """Container-title variants and ISSNs of a CrossRef record."""
+        names = (crossref_data.get('container-title') or []) + (crossref_data.get('short-container-title') or [])
+        return names, crossref_data.get('ISSN') or []
+
+    def known_venue(self, journal: str, crossref_data: Dict) -> bool:
+        """True if the venue authority already knows the CrossRef venue as a variant of journal."""
+        return self.venues is not None and self.venues.same_venue(journal, *self.venue_variants(crossref_data))
+
+    def record_result(self, entry: Dict, status: str, discrepancies: Optional[List[str]] = None,
+                      corrections: Optional[Dict] = None, cached: bool = False) -> Tuple[bool, List[str], Dict]:
+        """
+        Update the counters (and the result store) for a finished entry.
+
+        status is one of "verified", "error" or "warning".
+
+        Returns:
+            (verified, discrepancies_list, corrections_dict)
+        """
+        discrepancies = discrepancies or []
+        corrections = corrections or {}
+        entry_id = entry.get('ID', 'UNKNOWN')
+
+        with self.lock:
+            if cached:
+                self.cached_count += 1
+            if status == "verified":
+                self.verified_count += 1
+            elif status == "error":
+                self.error_count += 1
+                self.discrepancies.append({
+                    'id': entry_id,
+                    'discrepancies': discrepancies,
+                    'corrections': corrections
+                })
+            else:
+                self.warning_count += 1
+
+        # Don't cache results caused by network/API failures; retry them next run
+        if self.store is not None and not cached and not getattr(self.local, 'request_failed', False):
+            self.store.record(entry, status, discrepancies, corrections)
+
+        return status == "verified", discrepancies, corrections
+
+    def prescreen(self, entry: Dict) -> Tuple[str, List[str]]:
+        """
+        Classify an entry before any network request is made.
+
+        Returns (category, problems), where category is one of:
+            "broken": the entry has problems that CrossRef can't help with;
+                      report them without querying
+            "skip": the entry can't (or shouldn't) be checked against CrossRef
+            "network": the entry should be looked up in CrossRef
+        """
+        if entry.get('force') == 'True':
+            return "skip", []
+
+        # (a DOI in the pages field isn't a problem here: verify_entry
+        # corrects it from CrossRef)
+        problems = []
+        volume = entry.get('volume', '').strip()
+        year = entry.get('year', '').strip()
+
+        if VOLUME_WITH_ISSUE.fullmatch(volume):
+            problems.append(f"Volume field includes the issue number: '{volume}'")
+        elif ('doi' in volume.lower() or 'http' in volume.lower()) and not DOI_VOLUME.fullmatch(volume):
+            problems.append(f"Volume field contains a DOI or URL: '{volume}'")
+        if year.isdigit() and not PLAUSIBLE_YEARS[0] <= int(year) <= PLAUSIBLE_YEARS[1]:
+            problems.append(f"Year out of range: {year}")
+        if problems:
+            return "broken", problems
+
+        if year and not year.isdigit():
+            return "skip", [f"Year '{year}' is not a number; not checked against CrossRef"]
+        if not (entry.get('title') or entry.get('doi') or (self.dois is not None and self.dois.lookup(entry.get('ID')))):
+            return "skip", ["No title or DOI to look up"]
+        return "network", []
+
+    def verify_entry(self, entry: Dict, screen: Optional[Tuple[str, List[str]]] = None) -> Tuple[bool, List[str], Dict]:
         """
         Verify a single BibTeX entry.
 
+        screen is the entry's prescreen result, if it was already classified.
+
         Returns:
             (verified, discrepancies_list, corrections_dict)
         """
         entry_id = entry.get('ID', 'UNKNOWN')
         self.log(f"Verifying entry: {entry_id}")
+        self.local.request_failed = False
 
         # Skip if force flag is set
         if entry.get('force') == 'True':
             self.log(f"Skipping {entry_id} (force flag set)", "info")
             return True, [], {}
 
+        # Entries that can be judged without CrossRef are reported right away
+        category, problems = screen or self.prescreen(entry)
+        if category != "network":
+            self.log(f"{entry_id} pre-screened ({category}); not querying CrossRef", "info")
+            with self.lock:
+                self.prescreened_count += 1
+            return self.record_result(entry, "error" if category == "broken" else "warning", problems)
+
+        # Reuse the stored result if the entry hasn't changed since it was checked
+        if self.store is not None and not self.refresh:
+            cached = self.store.lookup(entry)
+            self.metrics.inc('store_hits_total' if cached else 'store_misses_total')
+            if cached:
+                self.log(f"{entry_id} unchanged since last run; using stored result", "info")
+                return self.record_result(entry, cached['status'], cached['discrepancies'],
+                                          cached['corrections'], cached=True)
+
         # Extract fields
         title = entry.get('title', '')
         authors = entry.get('author', '')
@@ -296,11 +578,25 @@ class BibVerifier:
         # Query CrossRef
         crossref_data = None
 
+        # Fall back on a DOI learned from a previous confident match
+        indexed_doi = False
+        if not doi and self.dois is not None:
+            doi = self.dois.lookup(entry_id) or ''
+            indexed_doi = bool(doi)
+            if indexed_doi:
+                self.metrics.inc('doi_index_hits_total')
+
         # Try DOI lookup first (most reliable)
         if doi:
             self.log(f"Looking up by DOI: {doi}", "info")
             crossref_data = self.query_crossref_by_doi(doi)
 
+        # A learned DOI that no longer matches the entry is stale; search instead
+        if indexed_doi and crossref_data and not self.timed_match(entry, crossref_data)[0]:
+            self.log(f"Indexed DOI for {entry_id} no longer matches; searching by title", "info")
+            self.dois.remove(entry_id)
+            crossref_data = None
+
         # Fallback to title-based lookup
         if not crossref_data and title:
             self.log(f"Looking up by title: {title[:50]}...", "info")
@@ -310,18 +606,18 @@ class BibVerifier:
         # No data found
         if not crossref_data:
             self.log(f"No verification data found for {entry_id}", "warning")
-            with self.lock:
-                self.warning_count += 1
-            return False, [f"No verification data found in CrossRef"], {}
+            return self.record_result(entry, "warning", [f"No verification data found in CrossRef"])
 
         # CRITICAL: Verify this is actually the same paper
         # This prevents false positives like GuoEtal20
-        is_match, match_reason = self.is_confident_match(entry, crossref_data)
+        is_match, match_reason = self.timed_match(entry, crossref_data)
+        if is_match and self.dois is not None and not entry.get('doi'):
+            self.dois.record(entry_id, crossref_data.get('DOI'))
+        if is_match and self.venues is not None and journal:
+            self.venues.record(journal, *self.venue_variants(crossref_data))
         if not is_match:
             self.log(f"CrossRef result not a confident match: {match_reason}", "warning")
-            with self.lock:
-                self.warning_count += 1
-            return False, [f"No confident match in CrossRef: {match_reason}"], {}
+            return self.record_result(entry, "warning", [f"No confident match in CrossRef: {match_reason}"])
 
         # At this point, we have a confident match
         # Now verify specific metadata fields (volume, pages, number)
@@ -373,32 +669,89 @@ class BibVerifier:
 
         # Summary
         if discrepancies:
-            with self.lock:
-                self.error_count += 1
-                self.discrepancies.append({
-                    'id': entry_id,
-                    'discrepancies': discrepancies,
-                    'corrections': corrections
-                })
-            return False, discrepancies, corrections
+            return self.record_result(entry, "error", discrepancies, corrections)
         else:
-            with self.lock:
-                self.verified_count += 1
             self.log(f"{entry_id} verified successfully", "success")
-            return True, [], {}
+            return self.record_result(entry, "verified")
+
+    def schedule(self, entries: Dict) -> List[Tuple[str, Dict]]:
+        """
+        Order entries by verification priority: entries that have never been
+        verified, then entries that changed since they were last verified (most
+        recently changed first), then entries whose stored result can't be
+        reused for another reason (an older verifier version or an expired
+        warning), then unchanged entries, least recently verified first.
+        """
+        if self.store is None:
+            return list(entries.items())
+
+        def priority(item):
+            record = self.store.get(item[0])
+            if record is None:
+                return 0, 0
+            changed = self.store.change_time(item[1])
+            if changed is not None:
+                return 1, -changed
+            elif self.store.lookup(item[1]) is None:
+                return 2, record.get('checked', 0)
+            return 3, record.get('checked', 0)
+
+        return sorted(entries.items(), key=priority)
+
+    def out_of_time(self) -> bool:
+        """True once the time budget (if any) has been spent."""
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def defer_entry(self, entry: Dict) -> Optional[Tuple[bool, List[str], Dict]]:
+        """
+        Handle an entry that was reached after the time budget ran out: report
+        its stored result if it has one, otherwise leave it for a later run.
 
-    def verify_entry_wrapper(self, entry_tuple: Tuple[str, Dict]) -> Tuple[str, bool, List[str], Dict]:
+        Returns None for deferred entries.
+        """
+        cached = self.store.lookup(entry) if self.store is not None else None
+        if cached:
+            return self.record_result(entry, cached['status'], cached['discrepancies'],
+                                      cached['corrections'], cached=True)
+        with self.lock:
+            self.deferred_count += 1
+        return None
+
+    def verify_entry_wrapper(self, entry_tuple: Tuple[str, Dict],
+                             screen: Optional[Tuple[str, List[str]]] = None) -> Tuple[str, Optional[bool], List[str], Dict]:
         """Wrapper for verify_entry to work with ThreadPoolExecutor."""
         entry_id, entry = entry_tuple
+        if self.out_of_time():
+            result = self.defer_entry(entry)
+            if result is None:
+                return entry_id, None, [], {}
+            return (entry_id,) + result
         try:
-            verified, discrepancies, corrections = self.verify_entry(entry)
+            with self.metrics.timer('entry_seconds'):
+                verified, discrepancies, corrections = self.verify_entry(entry, screen)
             return entry_id, verified, discrepancies, corrections
         except Exception as e:
             self.log(f"Error verifying {entry_id}: {e}", "error")
             return entry_id, False, [str(e)], {}
 
-    def verify_bibliography(self, bibfile: str, use_parallel: bool = True) -> Dict:
-        """Verify all entries in a bibliography file."""
+    def verify_bibliography(self, bibfile: str, use_parallel: bool = True,
+                            budget: Optional[float] = None,
+                            select: Optional[Callable[[Dict], Dict]] = None) -> Dict:
+        """
+        Verify all entries in a bibliography file.
+
+        If select is given, it is called with the parsed entries (a dictionary
+        of key --> entry) and only the entries it returns are verified.
+
+        If a time budget (in seconds) is given, entries are verified in priority
+        order (see schedule) until the budget is spent; stored results are
+        reported for the remaining entries, and entries without one are deferred.
+        """
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        import bibtexparser as bp
+        from tqdm import tqdm
+
         self.log(f"Loading bibliography: {bibfile}")
 
         parser = bp.bparser.BibTexParser(ignore_nonstandard_types=True,
@@ -409,6 +762,8 @@ class BibVerifier:
             bibdata = bp.load(f, parser=parser)
 
         entries = bibdata.get_entry_dict()
+        if select is not None:
+            entries = select(entries)
         total = len(entries)
 
         self.log(f"Found {total} entries to verify")
@@ -417,57 +772,62 @@ class BibVerifier:
         else:
             typer.echo(f"\nVerifying {total} entries sequentially...")
 
-        results = {
-            'verified': [],
-            'errors': [],
-            'warnings': [],
-            'corrections': {}
-        }
+        results = empty_results()
+
+        def add_result(*result):
+            add_to_results(results, *result)
+
+        if budget is not None:
+            # Re-verify unchanged entries too, oldest first, so that repeated
+            # budgeted runs roll through the whole bibliography
+            items = self.schedule(entries)
+            self.refresh = True
+            self.deadline = time.monotonic() + budget
+            typer.echo(f"Time budget: {budget:g} seconds")
+        else:
+            items = list(entries.items())
+
+        # Entries that can be judged locally never enter the network pool
+        # (each entry is classified once, here)
+        local_items = []
+        network_items = []
+        for item in items:
+            screen = self.prescreen(item[1])
+            if screen[0] == "network":
+                network_items.append(item)
+            else:
+                local_items.append((item, screen))
+        for (entry_id, entry), screen in local_items:
+            add_result(entry_id, *self.verify_entry(entry, screen))
+        items = network_items
+        network = ("network", [])
+        if local_items:
+            typer.echo(f"Pre-screened {len(local_items)} entries locally; {len(items)} need CrossRef")
 
         if use_parallel:
             # Parallel verification with ThreadPoolExecutor
             with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
                 # Submit all tasks
                 future_to_entry = {
-                    executor.submit(self.verify_entry_wrapper, item): item[0]
-                    for item in entries.items()
+                    executor.submit(self.verify_entry_wrapper, item, network): item[0]
+                    for item in items
                 }
 
                 # Process completed tasks with progress bar
-                with tqdm(total=total, desc="Verifying entries") as pbar:
+                with tqdm(total=len(items), desc="Verifying entries") as pbar:
                     for future in as_completed(future_to_entry):
-                        entry_id, verified, discrepancies, corrections = future.result()
-
-                        if verified:
-                            results['verified'].append(entry_id)
-                        else:
-                            results['errors'].append({
-                                'id': entry_id,
-                                'discrepancies': discrepancies
-                            })
-                            if corrections:
-                                results['corrections'][entry_id] = corrections
-
+                        add_result(*future.result())
                         pbar.update(1)
 
-                        # Small delay to respect rate limits
-                        time.sleep(0.01)
-
         else:
             # Sequential verification (original behavior)
-            for entry_id, entry in tqdm(entries.items(), desc="Verifying entries", disable=not self.verbose):
+            for entry_id, entry in tqdm(items, desc="Verifying entries", disable=not self.verbose):
+                if self.out_of_time():
+                    add_result(entry_id, *(self.defer_entry(entry) or (None, [], {})))
+                    continue
+
                 try:
-                    verified, discrepancies, corrections = self.verify_entry(entry)
-
-                    if verified:
-                        results['verified'].append(entry_id)
-                    else:
-                        results['errors'].append({
-                            'id': entry_id,
-                            'discrepancies': discrepancies
-                        })
-                        if corrections:
-                            results['corrections'][entry_id] = corrections
+                    add_result(entry_id, *self.verify_entry(entry, network))
 
                     # Rate limiting: be respectful to CrossRef
                     time.sleep(0.05)  # 50ms delay between requests
@@ -476,8 +836,198 @@ class BibVerifier:
                     self.log(f"Error verifying {entry_id}: {e}", "error")
                     results['warnings'].append(entry_id)
 
+        self.save_stores()
+
         return results
 
+    def export_metrics(self, prom_file: str, json_file: str):
+        """Write the run's metrics as a Prometheus text file and a JSON summary."""
+        m = self.metrics
+        for name, value in [('entries_verified_total', self.verified_count),
+                            ('entries_errors_total', self.error_count),
+                            ('entries_warnings_total', self.warning_count),
+                            ('entries_deferred_total', self.deferred_count),
+                            ('entries_prescreened_total', self.prescreened_count),
+                            ('crossref_requests_coalesced_total', self.flights.coalesced)]:
+            m.set_counter(name, value)
+        m.set('crossref_requests_per_second', round(m.rate('crossref_requests_total'), 3))
+        lookups = m.counters.get('store_hits_total', 0) + m.counters.get('store_misses_total', 0)
+        if lookups:
+            m.set('store_hit_ratio', round(m.counters.get('store_hits_total', 0) / lookups, 4))
+        m.write(prom_file, json_file, extra={'version': VERIFIER_VERSION})
+
+    def save_stores(self):
+        if self.store is not None:
+            self.store.save()
+        if self.dois is not None:
+            self.dois.save()
+        if self.venues is not None:
+            self.venues.save()
+
+
+def parse_duration(s: str) -> float:
+    """Parse a duration like '90', '90s', '10m' or '1h30m' into seconds."""
+    s = s.strip().lower()
+    if re.fullmatch(r'\d+(\.\d+)?', s):
+        return float(s)
+    parts = re.findall(r'(\d+(?:\.\d+)?)([hms])', s)
+    if not parts or ''.join(n + u for n, u in parts) != s:
+        raise ValueError(f"invalid duration: '{s}' (use e.g. 90s, 10m or 1h30m)")
+    return sum(float(n) * {'h': 3600, 'm': 60, 's': 1}[u] for n, u in parts)
+
+
+def parse_shard(s: str) -> Tuple[int, int]:
+    """Parse a shard like '2/8' into (2, 8); shards are numbered from 1."""
+    m = re.fullmatch(r'(\d+)/(\d+)', s.strip())
+    if not m or not 1 <= int(m.group(1)) <= int(m.group(2)):
+        raise ValueError(f"invalid shard: '{s}' (use i/N, with 1 <= i <= N)")
+    return int(m.group(1)), int(m.group(2))
+
+
+def shard_of(key: str, n: int) -> int:
+    """Deterministically assign a citation key to one of n shards (numbered from 1)."""
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest(), 16) % n + 1
+
+
+def empty_results() -> Dict:
+    return {
+        'verified': [],
+        'errors': [],
+        'warnings': [],
+        'deferred': [],
+        'corrections': {}
+    }
+
+
+def add_to_results(results: Dict, entry_id: str, verified: Optional[bool],
+                   discrepancies: List[str], corrections: Dict):
+    if verified is None:
+        results['deferred'].append(entry_id)
+    elif verified:
+        results['verified'].append(entry_id)
+    else:
+        results['errors'].append({
+            'id': entry_id,
+            'discrepancies': discrepancies
+        })
+        if corrections:
+            results['corrections'][entry_id] = corrections
+
+
+def all_ids(results: Dict) -> List[str]:
+    """Citation keys of every entry in a results dictionary."""
+    return results['verified'] + [e['id'] for e in results['errors']] + results['warnings'] + results['deferred']
+
+
+def summarize(verifier: BibVerifier, results: Dict) -> Dict:
+    """Collect a verifier's counters, discrepancies and results into a (JSON-friendly) summary."""
+    return {
+        'version': VERIFIER_VERSION,
+        'counts': {
+            'verified': verifier.verified_count,
+            'errors': verifier.error_count,
+            'warnings': verifier.warning_count,
+            'cached': verifier.cached_count,
+            'deferred': verifier.deferred_count,
+            'prescreened': verifier.prescreened_count,
+            'requests_sent': verifier.flights.issued,
+            'requests_coalesced': verifier.flights.coalesced,
+        },
+        'discrepancies': verifier.discrepancies,
+        'results': results,
+        'latency': verifier.metrics.snapshot()['histograms'].get('crossref_request_seconds'),
+        'retries': verifier.metrics.counters.get('crossref_retries_total', 0),
+    }
+
+
+def metrics_files(bibfile: str, name: str = 'metrics') -> Tuple[str, str]:
+    """Paths of the Prometheus text file and JSON summary of a run's metrics."""
+    base = os.path.splitext(sidecar_path(bibfile, name))[0]
+    return base + '.prom', base + '.json'
+
+
+def print_summary(summary: Dict):
+    """Print the verification summary and (the first few) discrepancies."""
+    counts = summary['counts']
+    discrepancies = summary['discrepancies']
+
+    typer.echo("\n" + "="*60)
+    typer.echo("VERIFICATION SUMMARY")
+    typer.echo("="*60)
+    typer.echo(f"✓ Verified: {counts['verified']}")
+    typer.echo(f"✗ Errors: {counts['errors']}")
+    typer.echo(f"⚠ Warnings: {counts['warnings']}")
+    if counts['cached']:
+        typer.echo(f"↺ Unchanged (from store): {counts['cached']}")
+    if counts['deferred']:
+        typer.echo(f"⏸ Deferred (budget spent): {counts['deferred']}")
+    if counts.get('prescreened'):
+        typer.echo(f"⊘ Pre-screened (no query needed): {counts['prescreened']}")
+    typer.echo(f"⇄ CrossRef requests: {counts['requests_sent']} sent, "
+               f"{counts['requests_coalesced']} saved by sharing identical in-flight requests")
+    latency = summary.get('latency')
+    if latency and latency['count']:
+        typer.echo(f"⏱ CrossRef latency: median {latency['p50'] * 1000:.0f} ms, "
+                   f"90th percentile {latency['p90'] * 1000:.0f} ms ({summary['retries']} retries)")
+
+    # Print discrepancies
+    if discrepancies:
+        typer.echo(f"\n{'='*60}")
+        typer.echo(f"DISCREPANCIES FOUND ({len(discrepancies)} entries)")
+        typer.echo("="*60)
+
+        for disc in discrepancies[:10]:  # Show first 10
+            typer.echo(f"\n{disc['id']}:")
+            for d in disc['discrepancies']:
+                typer.echo(f"  {d}")
+
+        if len(discrepancies) > 10:
+            typer.echo(f"\n... and {len(discrepancies) - 10} more entries with discrepancies")
+            typer.echo("Run with --verbose to see all discrepancies")
+
+
+def print_conclusion(error_count: int):
+    if error_count == 0:
+        typer.echo("\n✓ All entries verified successfully!")
+    else:
+        typer.echo(f"\n⚠ Found issues in {error_count} entries")
+        typer.echo("Review the discrepancies above and fix manually, or use --autofix --outfile")
+
+
+def print_sample_estimate(verifier: BibVerifier, results: Dict, sample: Dict, strata: Dict,
+                          confidence: float):
+    """Print population error-rate estimates from a stratified sample."""
+    import sampling
+
+    errors = {d['id']: discrepancy_fields(d['discrepancies']) for d in verifier.discrepancies}
+    verified = set(results['verified'])
+    n = sum(len(keys) for keys in sample.values())
+    total = sum(len(keys) for keys in strata.values())
+    deferred = set(results['deferred'])
+
+    def report(label, outcome):
+        outcomes = {s: [int(outcome(k)) for k in keys] for s, keys in sample.items()}
+        p, lower, upper = sampling.estimate(outcomes, strata, confidence)
+        typer.echo(f"{label}: {p:.1%} ({confidence:.0%} CI: {lower:.1%} to {upper:.1%})")
+
+    typer.echo(f"\n{'='*60}")
+    typer.echo("SAMPLE ESTIMATE")
+    typer.echo("="*60)
+    typer.echo(f"Sampled {n} of {total} entries from {len(strata)} strata")
+
+    # the entries reached before the budget ran out aren't a random sample
+    # (they're the ones verified first), so an incomplete sample would give
+    # biased estimates
+    missing = sum(k in deferred for keys in sample.values() for k in keys)
+    if missing:
+        typer.echo(f"⚠ {missing} sampled entries were deferred by --budget; no estimate is made from an "
+                   f"incomplete sample.  Run again with the same --seed to finish it.")
+        return
+    report("Entries with discrepancies", lambda k: k in errors)
+    for field in DISCREPANCY_FIELDS.values():
+        report(f"  {field}", lambda k: field in errors.get(k, []))
+    report("Entries not verifiable in CrossRef", lambda k: k not in errors and k not in verified)
+
 
 @app.command()
 def verify(
@@ -487,7 +1037,21 @@ def verify(
     verbose: bool = typer.Option(False, "--verbose", "-v", help="Verbose output"),
     max_entries: Optional[int] = typer.Option(None, "--max", help="Maximum entries to verify (for testing)"),
     parallel: bool = typer.Option(True, "--parallel/--no-parallel", help="Use parallel processing (default: True)"),
-    workers: int = typer.Option(5, "--workers", "-w", help="Number of parallel workers (default: 5)")
+    workers: int = typer.Option(5, "--workers", "-w", help="Number of parallel workers (default: 5)"),
+    cache: bool = typer.Option(True, "--cache/--no-cache", help="Reuse stored results for unchanged entries (default: True)"),
+    store: Optional[str] = typer.Option(None, "--store", help="Verification result store (default: <bibname>.verified.json)"),
+    doi_index: Optional[str] = typer.Option(None, "--doi-index", help="Citation key to DOI index (default: <bibname>.dois.json)"),
+    venue_authority: Optional[str] = typer.Option(None, "--venues", help="Journal name authority table (default: <bibname>.venues.json)"),
+    budget: Optional[str] = typer.Option(None, "--budget", help="Time budget, e.g. 90s, 10m or 1h30m; entries are verified in priority order until it is spent"),
+    sample: Optional[int] = typer.Option(None, "--sample", help="Verify a stratified random sample of this many entries and estimate error rates"),
+    confidence: Optional[float] = typer.Option(None, "--confidence", help="Confidence level of sample estimates, with --sample or --margin (default: 0.95)"),
+    margin: Optional[float] = typer.Option(None, "--margin", help="Choose the sample size needed to estimate error rates within this margin (e.g. 0.02)"),
+    seed: int = typer.Option(0, "--seed", help="Random seed for --sample/--margin (default: 0)"),
+    shard: Optional[str] = typer.Option(None, "--shard", help="Only verify shard i of N (e.g. 2/8), partitioned by key hash"),
+    results_file: Optional[str] = typer.Option(None, "--results", help="Save results as JSON (default for shards: <bibname>.shard-i-of-N.json)"),
+    metrics: bool = typer.Option(True, "--metrics/--no-metrics", help="Save run metrics to <bibname>.metrics.prom and .json (default: True)"),
+    metrics_interval: Optional[float] = typer.Option(None, "--metrics-interval", help="Also rewrite the metrics files every this many seconds while running"),
+    api_url: str = typer.Option(CROSSREF_API, "--api-url", help="CrossRef API base URL (e.g. a local mock server)")
 ):
     """
     Verify bibliographic entries against CrossRef database.
@@ -497,46 +1061,108 @@ def verify(
 
     Parallel processing (enabled by default) significantly speeds up verification
     by making multiple API requests concurrently.
-    """
-    verifier = BibVerifier(verbose=verbose, max_workers=workers)
 
-    try:
-        results = verifier.verify_bibliography(bibfile, use_parallel=parallel)
+    Results are stored next to the .bib file, keyed by a hash of each entry's
+    verified fields; only new or modified entries are queried on later runs.
+    DOIs of confidently matched entries are also saved, so that later runs
+    can look those entries up directly by DOI.
 
-        # Print summary
-        typer.echo("\n" + "="*60)
-        typer.echo("VERIFICATION SUMMARY")
-        typer.echo("="*60)
-        typer.echo(f"✓ Verified: {verifier.verified_count}")
-        typer.echo(f"✗ Errors: {verifier.error_count}")
-        typer.echo(f"⚠ Warnings: {verifier.warning_count}")
+    With --budget, entries that were never verified go first, then changed
+    entries (most recently changed first), then the least recently verified
+    ones; the run stops cleanly when the budget is spent, so repeated runs
+    roll through the whole file.
 
-        # Print discrepancies
-        if verifier.discrepancies:
-            typer.echo(f"\n{'='*60}")
-            typer.echo(f"DISCREPANCIES FOUND ({len(verifier.discrepancies)} entries)")
-            typer.echo("="*60)
+    With --sample N (or --margin), only a seeded random sample of entries,
+    stratified by entry type, decade and venue, is verified, and the overall
+    and per-field discrepancy rates are estimated with confidence intervals.
 
-            for disc in verifier.discrepancies[:10]:  # Show first 10
-                typer.echo(f"\n{disc['id']}:")
-                for d in disc['discrepancies']:
-                    typer.echo(f"  {d}")
+    With --shard i/N, only the entries whose key hashes to shard i are
+    verified and the results are saved to a per-shard file; run N shards in
+    parallel (e.g. as separate CI jobs) and combine them with `merge`.
+    """
+    import sampling
 
-            if len(verifier.discrepancies) > 10:
-                typer.echo(f"\n... and {len(verifier.discrepancies) - 10} more entries with discrepancies")
-                typer.echo("Run with --verbose to see all discrepancies")
+    try:
+        budget_seconds = parse_duration(budget) if budget else None
+        shard_index, shard_count = parse_shard(shard) if shard else (None, None)
+        sampled = sample is not None or margin is not None
+        if sample is not None and margin is not None:
+            raise ValueError("--sample and --margin both set the sample size; use one of them")
+        if sample is not None and sample < 1:
+            raise ValueError(f"--sample must be at least 1, not {sample}")
+        if margin is not None and not 0 < margin <= 0.5:
+            raise ValueError(f"--margin must be greater than 0 and at most 0.5, not {margin}")
+        if confidence is not None and not sampled:
+            raise ValueError("--confidence only applies to sample estimates (use it with --sample or --margin)")
+        if confidence is not None and not 0 < confidence < 1:
+            raise ValueError(f"--confidence must be between 0 and 1, not {confidence}")
+    except ValueError as e:
+        typer.echo(f"✗ Error: {e}", err=True)
+        raise typer.Exit(1)
+    confidence = confidence or 0.95
+
+    if shard and not results_file:
+        results_file = sidecar_path(bibfile, f'shard-{shard_index}-of-{shard_count}')
+
+    result_store = None
+    if cache:
+        result_store = VerificationStore(store or sidecar_path(bibfile, 'verified'), VERIFIER_VERSION)
+    dois = DOIIndex(doi_index or sidecar_path(bibfile, 'dois'))
+    venues = VenueAuthority(venue_authority or sidecar_path(bibfile, 'venues'))
+    verifier = BibVerifier(verbose=verbose, max_workers=workers, store=result_store, dois=dois, venues=venues,
+                           api_url=api_url)
+
+    prom_file, metrics_file = metrics_files(bibfile, f'shard-{shard_index}-of-{shard_count}.metrics'
+                                            if shard else 'metrics')
+    if metrics and metrics_interval:
+        verifier.metrics.start_snapshots(metrics_interval, lambda: verifier.export_metrics(prom_file, metrics_file))
+
+    drawn = {}
+
+    def select(entries):
+        if shard:
+            entries = {k: e for k, e in entries.items() if shard_of(k, shard_count) == shard_index}
+        if sampled and entries:
+            n = sample if sample is not None else sampling.sample_size(len(entries), confidence, margin)
+            drawn['sample'], drawn['strata'] = sampling.draw(entries, n, seed=seed)
+            entries = {k: entries[k] for keys in drawn['sample'].values() for k in keys}
+        return entries
+
+    try:
+        results = verifier.verify_bibliography(bibfile, use_parallel=parallel, budget=budget_seconds,
+                                               select=select if (shard or sampled) else None)
+        verifier.metrics.stop_snapshots()
+        if metrics:
+            verifier.export_metrics(prom_file, metrics_file)
+
+        summary = summarize(verifier, results)
+        if results_file:
+            summary['bibfile'] = bibfile
+            summary['shard'] = [shard_index, shard_count] if shard else None
+            summary['store'] = {k: result_store.get(k) for k in all_ids(results)
+                                if result_store is not None and k in result_store}
+            summary['dois'] = {k: dois.get(k) for k in all_ids(results) if k in dois}
+            summary['venues'] = venues.data
+            with open(results_file, 'w') as f:
+                json.dump(summary, f, indent=1, ensure_ascii=False)
+            typer.echo(f"\nSaved results to {results_file}")
+        if metrics:
+            typer.echo(f"\nSaved metrics to {prom_file} and {metrics_file}")
+
+        print_summary(summary)
+
+        if drawn:
+            print_sample_estimate(verifier, results, drawn['sample'], drawn['strata'], confidence)
 
         # Auto-fix if requested
-        if autofix and outfile:
-            typer.echo(f"\n⚠ Auto-fix feature not yet implemented")
-            typer.echo("This feature will be added in a future update")
+        if autofix:
+            if outfile:
+                changed = patch_bibliography(bibfile, outfile, results['corrections'])
+                typer.echo(f"\n✓ Corrected {changed} entries; saved to {outfile}")
+            else:
+                typer.echo("\n⚠ Specify --outfile (which may be the input file) to save corrections")
 
-        # Final message
-        if verifier.error_count == 0:
-            typer.echo("\n✓ All entries verified successfully!")
-        else:
-            typer.echo(f"\n⚠ Found issues in {verifier.error_count} entries")
-            typer.echo("Review the discrepancies above and fix manually, or use --autofix (when available)")
+        print_conclusion(verifier.error_count)
 
     except FileNotFoundError:
         typer.echo(f"✗ Error: File '{bibfile}' not found", err=True)
@@ -549,6 +1175,213 @@ def verify(
         raise typer.Exit(1)
 
 
+@app.command()
+def merge(
+    files: List[str] = typer.Argument(..., help="Result files written by `verify --shard` (or `verify --results`)"),
+    update_stores: bool = typer.Option(True, "--update-stores/--no-update-stores", help="Add the shards' results to the local result store, DOI index and venue authority (default: True)")
+):
+    """
+    Combine the results of several verification shards.
+
+    Prints the usual summary and discrepancy list for the combined results,
+    and (by default) folds the shards' stored results, learned DOIs and venue
+    names into the local sidecar files, so that the next run can reuse them.
+    """
+    summaries = []
+    for fname in files:
+        try:
+            with open(fname, 'r') as f:
+                summaries.append(json.load(f))
+        except (OSError, ValueError) as e:
+            typer.echo(f"✗ Error: could not read {fname}: {e}", err=True)
+            raise typer.Exit(1)
+
+    shards = {tuple(s['shard']) for s in summaries if s.get('shard')}
+    counts = {n for _, n in shards}
+    if len(counts) > 1:
+        typer.echo(f"⚠ Shards come from runs with different shard counts: {sorted(counts)}")
+    elif counts:
+        missing = sorted(set(range(1, counts.pop() + 1)) - {i for i, _ in shards})
+        if missing:
+            typer.echo(f"⚠ Missing shards: {', '.join(str(i) for i in missing)}")
+
+    merged = {
+        'counts': {k: sum(s['counts'].get(k, 0) for s in summaries)
+                   for k in set().union(*(s['counts'] for s in summaries))},
+        'discrepancies': sorted((d for s in summaries for d in s['discrepancies']), key=lambda d: d['id']),
+    }
+    print_summary(merged)
+
+    if update_stores:
+        for s in summaries:
+            bibfile = s.get('bibfile', 'cdl.bib')
+            if s.get('store') and s.get('version') == VERIFIER_VERSION:
+                result_store = VerificationStore(sidecar_path(bibfile, 'verified'), VERIFIER_VERSION)
+                result_store.update(s['store'])
+                result_store.save()
+            if s.get('dois'):
+                dois = DOIIndex(sidecar_path(bibfile, 'dois'))
+                dois.update(s['dois'])
+                dois.save()
+            if s.get('venues'):
+                venues = VenueAuthority(sidecar_path(bibfile, 'venues'))
+                venues.update({k: v for k, v in s['venues'].items() if k not in venues})
+                venues.save()
+
+    print_conclusion(merged['counts']['errors'])
+
+
+# Entries whose format problems the pipeline report lists in full
+REPORTED_PROBLEMS = 10
+
+
+def print_format_report(problems: Dict[str, Tuple[Dict, List[str]]], duplicates: List[List[str]],
+                        duplicate_keys: List[str], count: Optional[int] = None):
+    """
+    Print the (first few) formatting problems found by the pipeline's local
+    checks.  problems may hold just the entries to show, out of count.
+    """
+    count = len(problems) if count is None else count
+    typer.echo(f"\n{'='*60}")
+    typer.echo(f"FORMAT CHECKS ({count} entries with problems)")
+    typer.echo("="*60)
+
+    for key in duplicate_keys:
+        typer.echo(f"\nMultiple entries with the key {key}")
+
+    for group in duplicates:
+        typer.echo(f"\nPossible duplicates: {', '.join(group)}")
+
+    for entry_id, (fixes, unfixable) in sorted(problems.items())[:REPORTED_PROBLEMS]:
+        typer.echo(f"\n{entry_id}:")
+        for field, value in fixes.items():
+            typer.echo(f"  {field} should be: {value}")
+        for p in unfixable:
+            typer.echo(f"  {p}")
+
+    if count > REPORTED_PROBLEMS:
+        typer.echo(f"\n... and {count - REPORTED_PROBLEMS} more entries with problems")
+        typer.echo("Run `python bibcheck.py verify --verbose` to see all of them")
+
+
+@app.command()
+def pipeline(
+    bibfile: str = typer.Argument("cdl.bib", help="BibTeX file to check and verify"),
+    verbose: bool = typer.Option(False, "--verbose", "-v", help="Verbose output"),
+    workers: int = typer.Option(5, "--workers", "-w", help="Number of parallel workers (default: 5)"),
+    queue_size: int = typer.Option(64, "--queue-size", help="Maximum number of entries waiting between stages (default: 64)"),
+    cache: bool = typer.Option(True, "--cache/--no-cache", help="Reuse stored results for unchanged entries (default: True)"),
+    store: Optional[str] = typer.Option(None, "--store", help="Verification result store (default: <bibname>.verified.json)"),
+    doi_index: Optional[str] = typer.Option(None, "--doi-index", help="Citation key to DOI index (default: <bibname>.dois.json)"),
+    venue_authority: Optional[str] = typer.Option(None, "--venues", help="Journal name authority table (default: <bibname>.venues.json)"),
+    metrics: bool = typer.Option(True, "--metrics/--no-metrics", help="Save run metrics to <bibname>.metrics.prom and .json (default: True)"),
+    metrics_interval: Optional[float] = typer.Option(None, "--metrics-interval", help="Also rewrite the metrics files every this many seconds while running"),
+    api_url: str = typer.Option(CROSSREF_API, "--api-url", help="CrossRef API base URL (e.g. a local mock server)")
+):
+    """
+    Check formatting and verify against CrossRef in a single streaming pass.
+
+    Entries are parsed one at a time as the file is read, run through
+    bibcheck's per-entry format checks, and handed to the verification
+    workers, with each stage connected to the next by a bounded queue.
+    Network verification starts as soon as the first entry is parsed, and
+    at most a few queues' worth of entries are held at once.  The checks that
+    need the whole file (duplicate keys and entries, and key suffixes) run at
+    the end on a compact record of each entry: its key, its key base and a
+    hash of its title and author surnames (a few dozen bytes per entry).  Of
+    the entries with format problems, only the keys are kept, plus the
+    details of the few that are listed in the report.
+    """
+    from tqdm import tqdm
+
+    import helpers
+    import pipeline as stages
+
+    result_store = None
+    if cache:
+        result_store = VerificationStore(store or sidecar_path(bibfile, 'verified'), VERIFIER_VERSION)
+    dois = DOIIndex(doi_index or sidecar_path(bibfile, 'dois'))
+    venues = VenueAuthority(venue_authority or sidecar_path(bibfile, 'venues'))
+    verifier = BibVerifier(verbose=verbose, max_workers=workers, store=result_store, dois=dois, venues=venues,
+                           api_url=api_url)
+
+    keep_fields = helpers.read("keep_fields.txt")
+    # compact per-entry records for the whole-file checks, by position (the
+    # stream, unlike load_bibliography, keeps every entry that shares a key)
+    ids, bases, fingerprints, forced = [], [], [], set()
+    problem_keys = set()
+    problems = {}  # details of the entries listed in the report
+
+    def add_problem(key, fixes, unfixable):
+        problem_keys.add(key)
+        if key in problems or len(problems) < REPORTED_PROBLEMS or key < max(problems):
+            problems.setdefault(key, (fixes, unfixable))
+            if len(problems) > REPORTED_PROBLEMS:
+                del problems[max(problems)]
+
+    def check(entry):
+        author, title = entry.get('author', ''), entry.get('title', '')
+        if 'force' in entry:
+            forced.add(len(ids))
+        ids.append(entry['ID'])
+        try:
+            bases.append(helpers.author_key(author) + str(entry.get('year', ''))[-2:])
+        except Exception:
+            bases.append(entry['ID'])  # no key base: leave the key alone
+        try:
+            surnames = " and ".join(helpers.last_names_from_str(author))
+        except Exception:
+            surnames = author
+        fingerprints.append(hashlib.blake2b(f"{title}\0{surnames}".encode("utf-8"), digest_size=8).digest())
+
+        fixes, unfixable = helpers.check_entry(entry, keep_fields=keep_fields, venues=venues)
+        if fixes or unfixable:
+            add_problem(entry['ID'], fixes, unfixable)
+        return entry
+
+    def verify(entry):
+        return verifier.verify_entry_wrapper((entry['ID'], entry))
+
+    prom_file, metrics_file = metrics_files(bibfile)
+    if metrics and metrics_interval:
+        verifier.metrics.start_snapshots(metrics_interval, lambda: verifier.export_metrics(prom_file, metrics_file))
+
+    results = empty_results()
+    typer.echo(f"\nChecking and verifying {bibfile} using {workers} parallel workers...")
+    try:
+        with tqdm(desc="Verifying entries", unit=" entries") as pbar:
+            for result in stages.run(helpers.stream_bibliography(bibfile), [(check, 1), (verify, workers)],
+                                     queue_size=queue_size):
+                add_to_results(results, *result)
+                pbar.update(1)
+    except FileNotFoundError:
+        typer.echo(f"✗ Error: File '{bibfile}' not found", err=True)
+        raise typer.Exit(1)
+    finally:
+        verifier.save_stores()
+        verifier.metrics.stop_snapshots()
+    if metrics:
+        verifier.export_metrics(prom_file, metrics_file)
+        typer.echo(f"\nSaved metrics to {prom_file} and {metrics_file}")
+
+    # checks that need every entry, run on the compact records: entries
+    # with the same title and author surnames are duplicates (as in
+    # helpers.find_duplicates)
+    duplicate_keys = sorted(k for k, n in Counter(ids).items() if n > 1)
+    duplicates = helpers.duplicate_inds(fingerprints)
+    targets = helpers.check_key_suffixes({i: {'ID': k} for i, k in enumerate(ids)}, target_ids=bases)
+    for i, (key, target) in enumerate(zip(ids, targets)):
+        if target != key and i not in forced:
+            if key in problems:
+                problems[key][0].setdefault('ID', target)
+            else:
+                add_problem(key, {'ID': target}, [])
+
+    print_summary(summarize(verifier, results))
+    print_format_report(problems, [[ids[i] for i in d] for d in duplicates], duplicate_keys, len(problem_keys))
+    print_conclusion(verifier.error_count + len(problem_keys) + len(duplicates) + len(duplicate_keys))
+
+
 @app.command()
 def info():
     """Show information about the verification tool."""